@@ -2,12 +2,12 @@ import streamlit as st
 import pandas as pd
 import json
 from datetime import datetime, timedelta
-from config import NOC_USERNAME, NOC_PASSWORD, VERSION, SCRAPE_INTERVAL_HOURS, ENABLE_CLOUD_SYNC
+from config import NOC_USERNAME, NOC_PASSWORD, VERSION, SCRAPE_INTERVAL_HOURS, ENABLE_CLOUD_SYNC, CLOUD_COMPACT_ENCODING
 from scraper import NOCScraper
 from database import get_session, Flight, CrewMember, DailySyncStatus, init_db, FlightHistory, get_metadata, set_metadata
 from sqlalchemy import desc, extract
 from bid_periods import get_bid_period_date_range, get_bid_period_from_date
-from firestore_lib import set_cloud_sync_enabled
+from firestore_lib import set_cloud_sync_enabled, set_compact_encoding_enabled
 from logger_util import init_logging
 init_logging()
 
@@ -127,6 +127,7 @@ if "password" not in st.session_state:
 # Ensure Cloud Sync settings are updated on load (side effect)
 session = get_session()
 db_cloud_sync = get_metadata(session, "ui_enable_cloud_sync")
+db_compact = get_metadata(session, "ui_cloud_compact_encoding")
 session.close()
 
 if db_cloud_sync is not None:
@@ -134,6 +135,11 @@ if db_cloud_sync is not None:
 else:
     set_cloud_sync_enabled(ENABLE_CLOUD_SYNC)
 
+if db_compact is not None:
+    set_compact_encoding_enabled(db_compact.lower() == 'true')
+else:
+    set_compact_encoding_enabled(CLOUD_COMPACT_ENCODING)
+
 # --- Global Check ---
 # Only block if we aren't on the settings page
 current_page = st.session_state.get("current_page")
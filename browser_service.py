@@ -0,0 +1,118 @@
+"""
+Long-lived browser for scheduled scrapes.
+
+The background worker used to launch Chromium, open a context and log in
+every cycle. BrowserService keeps one NOCScraper (browser, context and page)
+warm across cycles instead:
+
+- health check: the browser must still be connected and the page open,
+  otherwise the whole browser is relaunched;
+- recycling: the context (cookies, caches, renderer memory) is replaced
+  after MAX_CONTEXT_USES cycles or once the page's JS heap passes
+  MAX_JS_HEAP_MB, and the browser process itself after MAX_BROWSER_AGE;
+- session check: the Station Ops login check (a full page load) only runs
+  when the context is new, the last check is older than
+  SESSION_REVALIDATE_AFTER, or the previous cycle failed.
+
+Playwright's sync API is bound to the thread that started it, so a service
+must only be used from one thread (each scheduler owns its own instance).
+"""
+import threading
+from datetime import datetime, timedelta
+from scraper import NOCScraper
+
+MAX_CONTEXT_USES = 20
+MAX_JS_HEAP_MB = 512
+MAX_BROWSER_AGE = timedelta(hours=12)
+SESSION_REVALIDATE_AFTER = timedelta(minutes=30)
+
+class BrowserService:
+    def __init__(self, headless=True):
+        self.headless = headless
+        self.scraper = None
+        self.thread_id = None
+        self.browser_started_at = None
+        self.context_uses = 0
+        self.session_checked_at = None
+        self.stats = {"launches": 0, "context_recycles": 0, "session_checks": 0, "reuses": 0}
+
+    def get_scraper(self, auth_mode, username, password, storage_state_path, telemetry=None):
+        """
+        Returns a logged-in scraper ready for scrape_date(), or None when login fails.
+        telemetry (a ScrapeRunRecorder) is attached before the session check so it is timed too.
+        """
+        if self.thread_id is not None and self.thread_id != threading.get_ident():
+            raise RuntimeError("BrowserService used from a different thread than the one that started it")
+
+        if self.scraper and not self.scraper.is_alive():
+            print("[Browser Service] Browser is gone; relaunching.")
+            self.shutdown()
+        if self.scraper and datetime.now() - self.browser_started_at > MAX_BROWSER_AGE:
+            print("[Browser Service] Browser reached its max age; relaunching.")
+            self.shutdown()
+
+        if not self.scraper:
+            self.scraper = NOCScraper(headless=self.headless)
+            self.scraper.start(auth_mode=auth_mode, storage_state_path=storage_state_path)
+            self.thread_id = threading.get_ident()
+            self.browser_started_at = datetime.now()
+            self.context_uses = 0
+            self.session_checked_at = None
+            self.stats["launches"] += 1
+        else:
+            heap_mb = self.scraper.js_heap_mb()
+            if self.context_uses >= MAX_CONTEXT_USES or (heap_mb and heap_mb > MAX_JS_HEAP_MB):
+                reason = f"{self.context_uses} uses" if self.context_uses >= MAX_CONTEXT_USES else f"JS heap {heap_mb:.0f} MB"
+                self._recycle_context(storage_state_path, reason)
+            else:
+                self.stats["reuses"] += 1
+
+        self.scraper.reset_run_state()
+        self.scraper.telemetry = telemetry
+        if not self._session_valid():
+            self.stats["session_checks"] += 1
+            if not self.scraper.login(username=username, password=password, auth_mode=auth_mode, storage_state_path=storage_state_path):
+                return None
+            self.session_checked_at = datetime.now()
+        self.context_uses += 1
+        return self.scraper
+
+    def _session_valid(self):
+        if not self.session_checked_at or datetime.now() - self.session_checked_at > SESSION_REVALIDATE_AFTER:
+            return False
+        # Still sitting on Station Ops from the last cycle; a lost session shows up as a failed cycle
+        return "StationOperations.aspx" in (self.scraper.page.url or "")
+
+    def _recycle_context(self, storage_state_path, reason):
+        print(f"[Browser Service] Recycling browser context ({reason}).")
+        try:
+            # Carry the logged-in cookies over to the new context
+            self.scraper.save_session(storage_state_path)
+        except Exception as e:
+            print(f"[Browser Service] Could not save session state: {e}")
+        self.scraper.close_context()
+        self.scraper.open_context(storage_state_path)
+        self.context_uses = 0
+        self.session_checked_at = None
+        self.stats["context_recycles"] += 1
+
+    def release(self, healthy=True):
+        """Ends a cycle. An unhealthy cycle forces a session check, or a relaunch if the browser died."""
+        if not self.scraper:
+            return
+        if not healthy:
+            self.session_checked_at = None
+            if not self.scraper.is_alive():
+                self.shutdown()
+                return
+        self.scraper.telemetry = None
+        self.scraper.reset_run_state()
+
+    def shutdown(self):
+        if self.scraper:
+            try:
+                self.scraper.stop()
+            except Exception as e:
+                print(f"[Browser Service] Error stopping browser: {e}")
+        self.scraper = None
+        self.thread_id = None
@@ -0,0 +1,208 @@
+"""
+Firestore call instrumentation.
+
+firestore_lib reports every call here (operation, collection path, document
+count, estimated bytes, latency, retries, errors). Counters accumulate in an
+in-memory histogram per "op collection" key. Wrapping a sync operation in
+cloud_metrics.run(label) stores the delta for that run in the cloud_sync_runs
+table, so the Sync tab can show what each run cost and where the time went.
+
+Each run gets its own counters, found through a ContextVar holding the run
+id, so runs overlapping on different threads only count their own calls.
+Nested runs fold into the outermost one. Work handed to thread pools must be
+submitted through bind_run() so the pool thread reports to the same run.
+"""
+import json
+import time
+import bisect
+import itertools
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+READ_OPS = ("read", "list", "query", "aggregate")
+
+# Id of the run the current thread/task is working for (None outside any run)
+_current_run = contextvars.ContextVar("cloud_metrics_run", default=None)
+
+def _new_stat():
+    return {"calls": 0, "docs": 0, "bytes": 0, "retries": 0, "errors": 0, "latency_ms": 0.0,
+            "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+
+def collection_path(doc_ref):
+    """'daily_flights/2026-03-01/flights/X' -> 'daily_flights/flights'."""
+    path = getattr(doc_ref, "path", "") or ""
+    return "/".join(path.split("/")[0::2]) or "unknown"
+
+def estimate_size(value):
+    """Rough Firestore storage size of a value (strings/bytes by length, scalars 8 bytes)."""
+    if value is None:
+        return 1
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value) + 1
+    if isinstance(value, dict):
+        return sum(len(str(k)) + 1 + estimate_size(v) for k, v in value.items()) + 32
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return 8
+
+def percentile_ms(buckets, q):
+    """Upper bound of the bucket holding the q-th quantile (None when the last, open bucket)."""
+    total = sum(buckets)
+    if not total:
+        return 0
+    target = q * total
+    running = 0
+    for i, count in enumerate(buckets):
+        running += count
+        if running >= target:
+            return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+class CloudMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.runs = {} # run id -> per-run counters, same shape as stats
+        self.run_ids = itertools.count(1)
+
+    def record(self, op, collection, docs=0, size=0, latency_s=0.0, retries=0, error=False):
+        latency_ms = latency_s * 1000
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)
+        key = f"{op} {collection}"
+        run_id = _current_run.get()
+        with self.lock:
+            targets = [self.stats]
+            if run_id in self.runs:
+                targets.append(self.runs[run_id])
+            for counters in targets:
+                st = counters.setdefault(key, _new_stat())
+                st["calls"] += 1
+                st["docs"] += docs
+                st["bytes"] += size
+                st["retries"] += retries
+                st["errors"] += 1 if error else 0
+                st["latency_ms"] += latency_ms
+                st["buckets"][bucket] += 1
+
+    @staticmethod
+    def bind_run(func):
+        """
+        Wraps func to run in a copy of the caller's context, so calls it makes on
+        a pool thread count towards the caller's run. Bind once per submit().
+        """
+        return functools.partial(contextvars.copy_context().run, func)
+
+    @contextmanager
+    def track(self, op, collection):
+        """Times one Firestore call; the body fills in call["docs"], ["bytes"], ["retries"]."""
+        call = {"docs": 0, "bytes": 0, "retries": 0}
+        started = time.perf_counter()
+        error = False
+        try:
+            yield call
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(op, collection, call["docs"], call["bytes"], time.perf_counter() - started, call["retries"], error)
+
+    def snapshot(self):
+        with self.lock:
+            return {k: dict(v, buckets=list(v["buckets"])) for k, v in self.stats.items()}
+
+    @staticmethod
+    def summarize(delta):
+        """Run totals plus per-operation rows with average and p50/p95 latency."""
+        totals = {"reads": 0, "writes": 0, "deletes": 0, "bytes": 0, "retries": 0, "errors": 0, "calls": 0}
+        rows = []
+        for key, st in sorted(delta.items()):
+            op, collection = key.split(" ", 1)
+            if op in READ_OPS:
+                totals["reads"] += st["docs"]
+            elif op == "delete":
+                totals["deletes"] += st["docs"]
+            else:
+                totals["writes"] += st["docs"]
+            for f in ("bytes", "retries", "errors", "calls"):
+                totals[f] += st[f]
+            rows.append({
+                "op": op,
+                "collection": collection,
+                "calls": st["calls"],
+                "docs": st["docs"],
+                "bytes": st["bytes"],
+                "retries": st["retries"],
+                "errors": st["errors"],
+                "avg_ms": round(st["latency_ms"] / st["calls"], 1) if st["calls"] else 0,
+                "p50_ms": percentile_ms(st["buckets"], 0.5),
+                "p95_ms": percentile_ms(st["buckets"], 0.95),
+                "buckets": st["buckets"]
+            })
+        return totals, rows
+
+    @contextmanager
+    def run(self, label):
+        """Measures every Firestore call made inside the block and persists a per-run summary."""
+        if _current_run.get() is not None:
+            # Nested: calls already count towards the outer run
+            yield
+            return
+
+        with self.lock:
+            run_id = next(self.run_ids)
+            self.runs[run_id] = {}
+        token = _current_run.set(run_id)
+        started_at = datetime.now()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            _current_run.reset(token)
+            with self.lock:
+                counters = self.runs.pop(run_id)
+            if counters:
+                self._persist(label, started_at, time.perf_counter() - started, counters)
+
+    def measured(self, label):
+        """Decorator form of run(label)."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.run(label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _persist(self, label, started_at, duration_s, delta):
+        totals, rows = self.summarize(delta)
+        print(f"[Cloud Metrics] {label}: {totals['reads']} reads, {totals['writes']} writes, {totals['deletes']} deletes, "
+              f"{totals['bytes'] / 1024:.0f} KB, {totals['retries']} retries, {totals['errors']} errors in {duration_s:.1f}s")
+        from database import get_session, CloudSyncRun
+        session = get_session()
+        try:
+            session.add(CloudSyncRun(
+                label=label,
+                started_at=started_at,
+                duration_seconds=round(duration_s, 2),
+                reads=totals["reads"],
+                writes=totals["writes"],
+                deletes=totals["deletes"],
+                bytes=totals["bytes"],
+                retries=totals["retries"],
+                errors=totals["errors"],
+                summary_json=json.dumps({"buckets_ms": LATENCY_BUCKETS_MS, "ops": rows})
+            ))
+            session.commit()
+        except Exception as e:
+            print(f"[Cloud Metrics] Could not persist run summary: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+# Global singleton
+cloud_metrics = CloudMetrics()
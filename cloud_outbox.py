@@ -0,0 +1,149 @@
+"""
+Cloud outbox: a local journal of flight inserts, updates and deletes.
+
+The scraper writes journal rows in the same transaction as the flight changes
+themselves, and push_pending_changes() drains only those rows to Firestore.
+Rows are marked pushed only after their writes are committed, so a crash
+mid-push simply leaves them pending for the next run (all writes are
+idempotent merges/deletes).
+"""
+from datetime import datetime, timedelta
+from database import Flight, CloudOutbox
+from cloud_metrics import cloud_metrics
+
+def record_flight_change(session, flight, op="upsert"):
+    """Journals a flight change. Does not commit; call inside the writer's transaction."""
+    from ingest_data import cloud_flight_key
+    if flight is None or flight.id is None:
+        return
+    session.add(CloudOutbox(
+        flight_id=flight.id,
+        flight_date=flight.date,
+        doc_key=cloud_flight_key(flight),
+        op=op,
+        created_at=datetime.now()
+    ))
+
+def pending_count(session):
+    return session.query(CloudOutbox).filter(CloudOutbox.pushed_at.is_(None)).count()
+
+@cloud_metrics.measured("Outbox Push")
+def push_pending_changes(session, chunk_size=500):
+    """
+    Pushes pending journal entries to Firestore in chunks of chunk_size rows.
+    Returns the number of flights written or deleted in the cloud.
+    """
+    from firestore_lib import get_batch_writer, upload_daily_flights, delete_daily_flight, is_compact_encoding_enabled, get_day_roots, COMPACT_ENCODING
+    from ingest_data import build_daily_bundles, cloud_flight_key
+
+    if pending_count(session) == 0:
+        return 0
+    writer = get_batch_writer("Outbox Push")
+    if not writer:
+        return 0
+
+    pushed = 0
+    try:
+        while True:
+            rows = session.query(CloudOutbox).filter(CloudOutbox.pushed_at.is_(None))\
+                .order_by(CloudOutbox.id).limit(chunk_size).all()
+            if not rows:
+                break
+            # Compact-day conversions flush mid-chunk, so count failures from here
+            failed_before = writer.stats["failed_writes"]
+
+            # The latest journal entry per flight wins
+            latest = {}
+            for r in rows:
+                latest[r.flight_id] = r
+
+            if is_compact_encoding_enabled():
+                # Compact days are stored as one blob, so re-send each touched day whole
+                days = sorted({r.flight_date for r in latest.values() if r.flight_date})
+                for day in days:
+                    day_flights = session.query(Flight).filter(Flight.date == day).all()
+                    flights_map = build_daily_bundles(session, day_flights).get(day.strftime('%Y-%m-%d'), {})
+                    upload_daily_flights(day.strftime('%Y-%m-%d'), flights_map, writer=writer, compact=True)
+                if not _flush_ok(writer, len(rows), failed_before):
+                    session.rollback()
+                    break
+                _mark_pushed(session, rows)
+                pushed += len(latest)
+                continue
+
+            upsert_ids = {fid for fid, r in latest.items() if r.op == "upsert"}
+            deletes = [r for r in latest.values() if r.op == "delete"]
+
+            # A deleted flight can share its document with a surviving duplicate or a
+            # re-created flight; re-upload the survivor instead of deleting the doc
+            if deletes:
+                delete_dates = {r.flight_date for r in deletes}
+                survivors = {}
+                for f in session.query(Flight).filter(Flight.date.in_(delete_dates)).all():
+                    survivors.setdefault((f.date, cloud_flight_key(f)), f.id)
+                kept_deletes = []
+                for r in deletes:
+                    survivor_id = survivors.get((r.flight_date, r.doc_key))
+                    if survivor_id:
+                        upsert_ids.add(survivor_id)
+                    else:
+                        kept_deletes.append(r)
+                deletes = kept_deletes
+
+            flights = session.query(Flight).filter(Flight.id.in_(upsert_ids)).all() if upsert_ids else []
+
+            # Days still stored compact (e.g. after switching encodings) can't take
+            # per-flight deltas: convert each one whole to documents instead
+            touched_days = {f.date for f in flights} | {r.flight_date for r in deletes}
+            roots = get_day_roots(sorted(d.strftime('%Y-%m-%d') for d in touched_days if d))
+            compact_days = {d for d in touched_days if d and roots.get(d.strftime('%Y-%m-%d'), {}).get("encoding") == COMPACT_ENCODING}
+            converted = 0
+            for day in sorted(compact_days):
+                date_str = day.strftime('%Y-%m-%d')
+                day_flights = session.query(Flight).filter(Flight.date == day).all()
+                converted += len(day_flights)
+                upload_daily_flights(date_str, build_daily_bundles(session, day_flights).get(date_str, {}),
+                                     writer=writer, compact=False, root=roots[date_str])
+
+            flights = [f for f in flights if f.date not in compact_days]
+            deletes = [r for r in deletes if r.flight_date not in compact_days]
+            for date_str, flights_map in build_daily_bundles(session, flights).items():
+                upload_daily_flights(date_str, flights_map, writer=writer, compact=False, root=roots.get(date_str))
+            for r in deletes:
+                delete_daily_flight(r.flight_date.strftime('%Y-%m-%d'), r.doc_key, writer=writer)
+
+            if not _flush_ok(writer, len(rows), failed_before):
+                session.rollback()
+                break
+            _mark_pushed(session, rows)
+            pushed += len(flights) + len(deletes) + converted
+    finally:
+        # Failed batches were already caught by _flush_ok and left pending
+        writer.close(raise_on_error=False)
+
+    purge_pushed(session)
+    print(f"[Cloud Outbox] Pushed {pushed} flight changes.")
+    return pushed
+
+def _flush_ok(writer, row_count, failed_before):
+    stats = writer.flush()
+    if stats["failed_writes"] > failed_before:
+        print(f"[Cloud Outbox] {stats['failed_writes'] - failed_before} writes failed; leaving {row_count} entries pending.")
+        return False
+    return True
+
+def _mark_pushed(session, rows):
+    now = datetime.now()
+    for r in rows:
+        r.pushed_at = now
+    session.commit()
+
+def purge_pushed(session, older_than_days=7):
+    """Drops journal rows that reached Firestore more than older_than_days ago."""
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    count = session.query(CloudOutbox).filter(
+        CloudOutbox.pushed_at.isnot(None),
+        CloudOutbox.pushed_at < cutoff
+    ).delete(synchronize_session=False)
+    session.commit()
+    return count
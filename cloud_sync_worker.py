@@ -0,0 +1,155 @@
+"""
+Background cloud-sync worker.
+
+The scraper hands it work instead of calling Firestore inline, so a slow
+network no longer stalls a sweep. Requests are coalesced while they wait:
+any number of scraped days collapse into a single outbox push (the outbox
+already holds the per-flight deltas), and repeated metadata updates keep only
+the latest value per key. The pending set is bounded; when it is full the
+submitting thread waits briefly instead of buffering without limit.
+
+Status is kept in memory for this process and mirrored to AppMetadata so the
+Sync tab can show it even when the scraper runs in another process.
+"""
+import json
+import time
+import threading
+from datetime import datetime
+from database import get_session, set_metadata
+
+STATUS_KEY = "cloud_sync_worker_status"
+
+class CloudSyncWorker:
+    def __init__(self, max_pending=1000):
+        self.cond = threading.Condition()
+        self.max_pending = max_pending
+        self.pending_days = set()
+        self.pending_metadata = {}
+        self.push_requested = False
+        self.busy = False
+        self.thread = None
+        self.status = {
+            "state": "idle",
+            "requests": 0,
+            "coalesced": 0,
+            "pushes": 0,
+            "pushed_changes": 0,
+            "last_push_at": None,
+            "last_push_seconds": None,
+            "last_push_days": [],
+            "last_error": None
+        }
+
+    def start(self):
+        with self.cond:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name="cloud-sync-worker", daemon=True)
+            self.thread.start()
+        print("[Cloud Sync Worker] Thread initialized.")
+
+    def _pending_size(self):
+        return len(self.pending_days) + len(self.pending_metadata)
+
+    def _wait_for_room(self, timeout):
+        # Caller holds self.cond
+        if not self.cond.wait_for(lambda: self._pending_size() < self.max_pending, timeout):
+            print("[Cloud Sync Worker] Queue full; submitting anyway (outbox keeps the data).")
+
+    def submit_day(self, date_key, timeout=30):
+        """Requests a push of the outbox after date_key was scraped."""
+        self.start()
+        day = date_key.strftime('%Y-%m-%d')
+        with self.cond:
+            self._wait_for_room(timeout)
+            self.status["requests"] += 1
+            if self.push_requested or day in self.pending_days:
+                self.status["coalesced"] += 1
+            self.pending_days.add(day)
+            self.push_requested = True
+            self.cond.notify_all()
+
+    def submit_metadata(self, key, value, timeout=30):
+        """Queues a metadata upload; only the latest value per key is sent."""
+        self.start()
+        with self.cond:
+            self._wait_for_room(timeout)
+            self.status["requests"] += 1
+            if key in self.pending_metadata:
+                self.status["coalesced"] += 1
+            self.pending_metadata[key] = value
+            self.cond.notify_all()
+
+    def flush(self, timeout=120):
+        """Waits until all submitted work has been pushed. Returns False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: not self.busy and not self.push_requested and not self.pending_metadata,
+                timeout
+            )
+
+    def get_status(self):
+        with self.cond:
+            status = dict(self.status)
+            status["pending_days"] = len(self.pending_days)
+            status["pending_metadata"] = len(self.pending_metadata)
+            return status
+
+    def _run(self):
+        print("[Cloud Sync Worker] Worker started.")
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.push_requested or self.pending_metadata)
+                days, self.pending_days = self.pending_days, set()
+                metadata, self.pending_metadata = self.pending_metadata, {}
+                do_push, self.push_requested = self.push_requested, False
+                self.busy = True
+                self.status["state"] = "pushing"
+                self.cond.notify_all()
+
+            started = time.perf_counter()
+            error = None
+            pushed = 0
+            session = get_session()
+            try:
+                from firestore_lib import get_batch_writer, upload_metadata
+                from cloud_metrics import cloud_metrics
+                if metadata:
+                    with cloud_metrics.run("Metadata Push"):
+                        writer = get_batch_writer("Metadata Push")
+                        if writer:
+                            for key, value in metadata.items():
+                                upload_metadata(key, value, writer=writer)
+                            writer.close(report=False)
+                if do_push:
+                    from cloud_outbox import push_pending_changes
+                    pushed = push_pending_changes(session)
+            except Exception as e:
+                error = str(e)
+                print(f"[Cloud Sync Worker] Push error: {e}")
+                session.rollback()
+
+            with self.cond:
+                self.status["state"] = "error" if error else "idle"
+                self.status["last_error"] = error
+                self.status["pushes"] += 1
+                self.status["pushed_changes"] += pushed
+                self.status["last_push_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                self.status["last_push_seconds"] = round(time.perf_counter() - started, 2)
+                self.status["last_push_days"] = sorted(days)
+                snapshot = dict(self.status)
+                snapshot["pending_days"] = len(self.pending_days)
+
+            try:
+                set_metadata(session, STATUS_KEY, json.dumps(snapshot))
+            except Exception as e:
+                print(f"[Cloud Sync Worker] Could not persist status: {e}")
+            finally:
+                session.close()
+
+            with self.cond:
+                self.busy = False
+                self.cond.notify_all()
+
+# Global singleton
+cloud_sync_worker = CloudSyncWorker()
@@ -25,10 +25,19 @@ NOC_PASSWORD = os.getenv('NOC_PASSWORD')
 # Firestore
 FIRESTORE_CREDENTIALS = os.getenv('FIRESTORE_CREDENTIALS', 'firestore_key.json')
 ENABLE_CLOUD_SYNC = os.getenv('ENABLE_CLOUD_SYNC', 'False').lower() in ('true', '1', 't')
+# Store each day's flights as compressed columnar chunks instead of one document per flight
+CLOUD_COMPACT_ENCODING = os.getenv('CLOUD_COMPACT_ENCODING', 'False').lower() in ('true', '1', 't')
 
 # Scheduling
 SCRAPE_INTERVAL_HOURS = int(os.getenv('SCRAPE_INTERVAL_HOURS', '1'))
 SCRAPE_DAYS = int(os.getenv('SCRAPE_DAYS', '1'))
+# Comma-separated station codes set in the Station Ops field each sweep (e.g. 'IAD,IAH'); empty uses the account's default station
+SCRAPE_STATIONS = [s.strip().upper() for s in os.getenv('SCRAPE_STATIONS', '').split(',') if s.strip()]
+
+# Scraper: block images, fonts, stylesheets, media and third-party/analytics requests in headless runs
+SCRAPER_BLOCK_RESOURCES = os.getenv('SCRAPER_BLOCK_RESOURCES', 'True').lower() in ('true', '1', 't')
+# Opt-in: comma-separated extra script hosts; when set, scripts from any other host (besides the portal and login) are blocked too
+SCRAPER_SCRIPT_HOSTS = [h.strip().lower() for h in os.getenv('SCRAPER_SCRIPT_HOSTS', '').split(',') if h.strip()]
 
 # App Version Number
 VERSION = 'v1.4'
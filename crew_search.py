@@ -0,0 +1,160 @@
+"""
+In-memory trigram search index over crew names and employee ids.
+
+Built once from the crew table, then kept current incrementally: the scraper
+calls add() once its crew changes are committed, and sync() picks up rows
+written by other processes (e.g. run_scheduler.py) by loading only ids above
+the highest one already indexed. Renames and employee id fixes do not move
+that high-water mark, so writers stamp CHANGED_KEY in the same transaction
+(mark_crew_changed) and sync() rebuilds when the stamp or the row count no
+longer matches the index.
+"""
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import func
+from database import CrewMember, AppMetadata, get_metadata
+
+CHANGED_KEY = "crew_changed_at"
+
+def _normalize(text):
+    return re.sub(r"[^a-z0-9]+", " ", str(text or "").lower()).strip()
+
+def _trigrams(text):
+    grams = set()
+    for token in text.split():
+        padded = f"  {token} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+class CrewSearchIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}               # crew pk -> {"name", "id", "label"}
+        self.search_text = {}           # crew pk -> normalized "name employee_id"
+        self.grams = defaultdict(set)   # trigram -> {crew pk}
+        self.max_crew_id = 0
+        self.changed_stamp = None
+        self.built = False
+
+    def _index(self, crew_pk, name, employee_id):
+        old_text = self.search_text.get(crew_pk)
+        if old_text is not None:
+            for g in _trigrams(old_text):
+                self.grams[g].discard(crew_pk)
+
+        text = _normalize(f"{name or ''} {employee_id or ''}")
+        self.search_text[crew_pk] = text
+        self.entries[crew_pk] = {"name": name, "id": employee_id, "label": f"{name} ({employee_id})"}
+        for g in _trigrams(text):
+            self.grams[g].add(crew_pk)
+        self.max_crew_id = max(self.max_crew_id, crew_pk)
+
+    def build(self, session):
+        stamp = get_metadata(session, CHANGED_KEY)
+        rows = session.query(CrewMember.id, CrewMember.name, CrewMember.employee_id).all()
+        with self.lock:
+            self.entries.clear()
+            self.search_text.clear()
+            self.grams.clear()
+            self.max_crew_id = 0
+            for crew_pk, name, employee_id in rows:
+                self._index(crew_pk, name, employee_id)
+            self.changed_stamp = stamp
+            self.built = True
+        print(f"[Crew Search] Indexed {len(rows)} crew members.")
+
+    def sync(self, session):
+        """
+        Builds the index on first use, then loads only crew rows added since.
+        Rebuilds when another writer renamed crew (CHANGED_KEY moved) or rows
+        were deleted, which the id high-water mark alone cannot see.
+        """
+        if not self.built or get_metadata(session, CHANGED_KEY) != self.changed_stamp:
+            self.build(session)
+            return
+        rows = session.query(CrewMember.id, CrewMember.name, CrewMember.employee_id)\
+            .filter(CrewMember.id > self.max_crew_id).all()
+        if rows:
+            with self.lock:
+                for crew_pk, name, employee_id in rows:
+                    self._index(crew_pk, name, employee_id)
+        count = session.query(func.count(CrewMember.id)).scalar()
+        if count != len(self.entries):
+            self.build(session)
+
+    def add(self, crew_pk, name, employee_id):
+        """
+        Adds or re-indexes a single crew member. No-op until the index is built.
+        Call only after the row is committed, so a rollback cannot leave an entry behind.
+        """
+        if not self.built or not crew_pk:
+            return
+        with self.lock:
+            self._index(crew_pk, name, employee_id)
+
+    def all_crew(self):
+        """Every indexed crew member sorted by name (same shape as the old picker list)."""
+        with self.lock:
+            return sorted(self.entries.values(), key=lambda e: (e["name"] or "", e["id"] or ""))
+
+    def search_scored(self, query, limit=20, min_score=0.34):
+        """
+        Returns [(crew_pk, score)] ranked best-first for a partial name or id.
+        min_score drops weak matches that share only a trigram or two with the query.
+        """
+        q = _normalize(query)
+        if not q:
+            return []
+        q_grams = _trigrams(q)
+        q_tokens = q.split()
+
+        with self.lock:
+            hits = defaultdict(int)
+            for g in q_grams:
+                for crew_pk in self.grams.get(g, ()):
+                    hits[crew_pk] += 1
+
+            scored = []
+            for crew_pk, shared in hits.items():
+                text = self.search_text[crew_pk]
+                entry = self.entries[crew_pk]
+                # Trigram similarity, weighted towards how much of the query matched
+                score = shared / len(q_grams)
+                if entry["id"] and str(entry["id"]) == q:
+                    score += 3.0
+                elif entry["id"] and str(entry["id"]).startswith(q):
+                    score += 1.5
+                if q in text:
+                    score += 1.0
+                words = text.split()
+                if all(any(w.startswith(t) for w in words) for t in q_tokens):
+                    score += 0.5
+                if score >= min_score:
+                    scored.append((crew_pk, score))
+
+            scored.sort(key=lambda x: (-x[1], self.entries[x[0]]["name"] or ""))
+        return scored[:limit]
+
+    def search(self, query, limit=20):
+        """Ranked picker entries for a partial name or id."""
+        results = self.search_scored(query, limit)
+        with self.lock:
+            return [self.entries[crew_pk] for crew_pk, _ in results]
+
+def mark_crew_changed(session):
+    """
+    Stages a new CHANGED_KEY stamp in the caller's transaction (no commit) so
+    indexes in other processes rebuild once the rename is committed.
+    """
+    session.merge(AppMetadata(key=CHANGED_KEY, value=datetime.now().isoformat()))
+
+# Global singleton
+crew_index = CrewSearchIndex()
+
+def get_crew_index(session):
+    """Returns the shared index, building or topping it up from the DB as needed."""
+    crew_index.sync(session)
+    return crew_index
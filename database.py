@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Table
+from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, ForeignKey, Table, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 from config import DB_URL
 
@@ -128,6 +128,111 @@ class DailySyncStatus(Base):
     def __repr__(self):
         return f"<DailySyncStatus(date='{self.date}', status='{self.status}')>"
 
+class StationSyncStatus(Base):
+    __tablename__ = 'station_sync_status'
+
+    station = Column(String, primary_key=True) # Station code set in the Station Ops field, e.g. 'IAD'
+    date = Column(DateTime, primary_key=True) # The date being scraped (midnight)
+    last_scraped_at = Column(DateTime)
+    flights_found = Column(Integer, default=0) # Flights departing or arriving at the station that day
+    status = Column(String) # 'Success', 'Failed'
+
+    def __repr__(self):
+        return f"<StationSyncStatus(station='{self.station}', date='{self.date}', status='{self.status}')>"
+
+class RosterCache(Base):
+    __tablename__ = 'roster_cache'
+    __table_args__ = (UniqueConstraint('crew_id', 'year', 'month', name='uq_roster_cache_crew_month'),)
+
+    id = Column(Integer, primary_key=True)
+    crew_id = Column(Integer, ForeignKey('crew.id'), index=True)
+    year = Column(Integer)
+    month = Column(Integer)
+    days_json = Column(String) # JSON: {day: {"legs": [...], "removed": [...], "canceled": [...]}}
+    leg_count = Column(Integer, default=0)
+    scheduled_block_minutes = Column(Integer, default=0)
+    actual_block_minutes = Column(Integer, default=0)
+    removed_count = Column(Integer, default=0)
+    canceled_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<RosterCache(crew_id='{self.crew_id}', period='{self.year}-{self.month:02d}')>"
+
+class CloudOutbox(Base):
+    __tablename__ = 'cloud_outbox'
+
+    id = Column(Integer, primary_key=True)
+    flight_id = Column(Integer, index=True) # Not a FK: deleted flights keep their journal rows
+    flight_date = Column(DateTime) # Firestore daily_flights/{date} parent
+    doc_key = Column(String) # Firestore document id inside the day's 'flights' subcollection
+    op = Column(String) # 'upsert' or 'delete'
+    created_at = Column(DateTime, default=datetime.now)
+    pushed_at = Column(DateTime, nullable=True, index=True) # NULL until the change reached Firestore
+
+    def __repr__(self):
+        return f"<CloudOutbox(flight_id='{self.flight_id}', op='{self.op}', pushed='{self.pushed_at}')>"
+
+class PairingBundleHash(Base):
+    __tablename__ = 'pairing_bundle_hashes'
+
+    doc_id = Column(String, primary_key=True) # Firestore pairings doc id: PairingNumber_YYYYMMDD
+    content_hash = Column(String) # sha256 of the bundle as last uploaded
+    start_date = Column(DateTime, index=True)
+    uploaded_at = Column(DateTime, default=datetime.now)
+
+class CloudSyncRun(Base):
+    __tablename__ = 'cloud_sync_runs'
+
+    id = Column(Integer, primary_key=True)
+    label = Column(String) # e.g. 'Outbox Push', 'Full Mirror', 'Restore'
+    started_at = Column(DateTime, index=True)
+    duration_seconds = Column(Float)
+    reads = Column(Integer, default=0) # Documents read
+    writes = Column(Integer, default=0) # Documents written
+    deletes = Column(Integer, default=0) # Documents deleted
+    bytes = Column(Integer, default=0) # Estimated payload bytes
+    retries = Column(Integer, default=0)
+    errors = Column(Integer, default=0)
+    summary_json = Column(String) # Per op/collection calls, docs, bytes, latency histogram
+
+class ScrapeRun(Base):
+    __tablename__ = 'scrape_runs'
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String) # 'background', 'manual' or 'run_scheduler'
+    started_at = Column(DateTime, index=True)
+    finished_at = Column(DateTime)
+    duration_seconds = Column(Float)
+    dates_scraped = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    pruned = Column(Integer, default=0)
+    status = Column(String) # 'Success', 'Partial', 'Failed'
+    error = Column(String, nullable=True)
+
+class ScrapePhase(Base):
+    __tablename__ = 'scrape_phases'
+
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('scrape_runs.id'), index=True)
+    date = Column(DateTime, nullable=True) # Scraped date; NULL for run-level phases such as login_check
+    phase = Column(String) # login_check, date_set, search_postback, content_capture, parse, db_diff, prune, commit, cloud_upload, ... or 'total'
+    seconds = Column(Float)
+    # Only set on the per-date 'total' row
+    inserted = Column(Integer, nullable=True)
+    updated = Column(Integer, nullable=True)
+    pruned = Column(Integer, nullable=True)
+
+class ScrapeLease(Base):
+    __tablename__ = 'scrape_leases'
+
+    name = Column(String, primary_key=True) # Lock name, e.g. 'scrape'
+    owner = Column(String) # host:pid:label:random of the holder
+    acquired_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True) # Anyone may take the lease over after this
+
 class AppMetadata(Base):
     __tablename__ = 'app_metadata'
     key = Column(String, primary_key=True)
@@ -227,9 +332,53 @@ def init_db():
             conn.execute(text("CREATE INDEX IF NOT EXISTS ix_flights_dep ON flights(departure_airport)"))
             conn.execute(text("CREATE INDEX IF NOT EXISTS ix_flights_arr ON flights(arrival_airport)"))
             conn.execute(text("CREATE INDEX IF NOT EXISTS ix_flights_tail ON flights(tail_number)"))
+            # Crew-centric lookups (employee history, rosters) filter the association by crew first
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_flight_crew_crew ON flight_crew(crew_id, flight_id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_flight_history_flight ON flight_history(flight_id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_ioe_emp_start ON ioe_assignments(employee_id, start_date)"))
             conn.commit()
         except Exception as e:
             pass
+
+    # Full-text index over the scraped text blocks (notes / pax / load)
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == "sqlite":
+                exists = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='flight_text_fts'")).first()
+                if not exists:
+                    # External-content FTS5 table; triggers keep it in step with every write to flights
+                    conn.execute(text("CREATE VIRTUAL TABLE flight_text_fts USING fts5(notes_data, pax_data, load_data, content='flights', content_rowid='id')"))
+                # Triggers are dropped along with the flights table, so always make sure they exist
+                conn.execute(text("""
+                    CREATE TRIGGER IF NOT EXISTS flights_fts_ai AFTER INSERT ON flights BEGIN
+                        INSERT INTO flight_text_fts(rowid, notes_data, pax_data, load_data)
+                        VALUES (new.id, new.notes_data, new.pax_data, new.load_data);
+                    END"""))
+                conn.execute(text("""
+                    CREATE TRIGGER IF NOT EXISTS flights_fts_ad AFTER DELETE ON flights BEGIN
+                        INSERT INTO flight_text_fts(flight_text_fts, rowid, notes_data, pax_data, load_data)
+                        VALUES ('delete', old.id, old.notes_data, old.pax_data, old.load_data);
+                    END"""))
+                conn.execute(text("""
+                    CREATE TRIGGER IF NOT EXISTS flights_fts_au AFTER UPDATE OF notes_data, pax_data, load_data ON flights BEGIN
+                        INSERT INTO flight_text_fts(flight_text_fts, rowid, notes_data, pax_data, load_data)
+                        VALUES ('delete', old.id, old.notes_data, old.pax_data, old.load_data);
+                        INSERT INTO flight_text_fts(rowid, notes_data, pax_data, load_data)
+                        VALUES (new.id, new.notes_data, new.pax_data, new.load_data);
+                    END"""))
+                if not exists:
+                    conn.execute(text("INSERT INTO flight_text_fts(flight_text_fts) VALUES ('rebuild')"))
+                    print("Migration: Built full-text index 'flight_text_fts'.")
+                conn.commit()
+            elif engine.dialect.name == "postgresql":
+                conn.execute(text("""
+                    ALTER TABLE flights ADD COLUMN IF NOT EXISTS search_tsv tsvector
+                    GENERATED ALWAYS AS (to_tsvector('simple',
+                        coalesce(notes_data, '') || ' ' || coalesce(pax_data, '') || ' ' || coalesce(load_data, ''))) STORED"""))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_flights_search_tsv ON flights USING GIN (search_tsv)"))
+                conn.commit()
+    except Exception as e:
+        print(f"Migration Error on full-text index: {e}")
             
     return engine
 
@@ -2,11 +2,29 @@ import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
 import os
-from config import FIRESTORE_CREDENTIALS, ENABLE_CLOUD_SYNC
-from datetime import datetime
+import json
+import zlib
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import FIRESTORE_CREDENTIALS, ENABLE_CLOUD_SYNC, CLOUD_COMPACT_ENCODING
+from cloud_metrics import cloud_metrics, collection_path, estimate_size
+from datetime import datetime, timedelta
 
 _db = None
 _enabled_override = None
+_compact_override = None
+
+# Firestore rejects WriteBatch commits with more than 500 operations
+MAX_BATCH_WRITES = 500
+# ...and requests over 10 MiB; stay well under it when batching blobs
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+# Compact day bundles: one compressed columnar blob per day, split into chunk
+# documents safely below Firestore's 1 MiB document limit
+COMPACT_ENCODING = "columnar-zlib-v1"
+COMPACT_CHUNK_BYTES = 900 * 1024
 
 def set_cloud_sync_enabled(enabled):
     global _enabled_override
@@ -17,6 +35,15 @@ def is_cloud_sync_enabled():
         return _enabled_override
     return ENABLE_CLOUD_SYNC
 
+def set_compact_encoding_enabled(enabled):
+    global _compact_override
+    _compact_override = enabled
+
+def is_compact_encoding_enabled():
+    if _compact_override is not None:
+        return _compact_override
+    return CLOUD_COMPACT_ENCODING
+
 def init_firestore():
     global _db
     if not is_cloud_sync_enabled():
@@ -27,6 +54,12 @@ def init_firestore():
         return _db
 
     try:
+        if os.getenv("FIRESTORE_EMULATOR_HOST"):
+            # Local emulator: the Cloud client picks up the host and uses anonymous credentials
+            from google.cloud import firestore as gc_firestore
+            _db = gc_firestore.Client(project=os.getenv("FIRESTORE_PROJECT_ID", "demo-noc"))
+            print(f"Firestore emulator client initialized ({os.getenv('FIRESTORE_EMULATOR_HOST')}).")
+            return _db
         if os.path.exists(FIRESTORE_CREDENTIALS):
             cred = credentials.Certificate(FIRESTORE_CREDENTIALS)
             try:
@@ -48,45 +81,436 @@ def get_db():
         return init_firestore()
     return _db
 
-def upload_daily_flights(date_str: str, flights_map: dict):
+def set_firestore_client(client):
+    """Injects a Firestore client (e.g. an in-process fake for testing). Pass None to reset."""
+    global _db
+    _db = client
+
+class BatchWriteError(Exception):
+    """Raised by BatchWriter.close() when batches still failed after their retries."""
+    def __init__(self, label, stats):
+        super().__init__(f"[{label}] {stats['failed_writes']} of {stats['writes'] + stats['failed_writes']} writes failed")
+        self.stats = stats
+
+class BatchWriter:
+    """
+    Groups Firestore writes into WriteBatch commits of up to 500 operations.
+    Full batches are committed concurrently on a thread pool, each with
+    exponential backoff + jitter on failure. Call close() (or use as a context
+    manager) to commit the remainder and print throughput; it raises
+    BatchWriteError if any batch failed for good.
+    """
+    def __init__(self, db, max_workers=8, max_retries=5, label="Firestore Writer"):
+        self.db = db
+        self.max_retries = max_retries
+        self.label = label
+        self.lock = threading.Lock()
+        self.pending = []
+        self.pending_bytes = 0
+        self.futures = []
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stats = {"writes": 0, "commits": 0, "retries": 0, "failed_writes": 0}
+        self.started_at = time.perf_counter()
+
+    def set(self, doc_ref, data, merge=True):
+        self._queue([("set", doc_ref, data, merge)])
+
+    def delete(self, doc_ref):
+        self._queue([("delete", doc_ref, None, None)])
+
+    def set_group(self, items, merge=True, deletes=()):
+        """Queues [(doc_ref, data)] (and optional doc_refs to delete) so they are committed together in the same batch."""
+        self._queue([("delete", doc_ref, None, None) for doc_ref in deletes] +
+                    [("set", doc_ref, data, merge) for doc_ref, data in items])
+
+    def _queue(self, ops):
+        size = sum(_payload_bytes(op[2]) for op in ops)
+        with self.lock:
+            # Start a new batch rather than split a group across two commits
+            if self.pending and (len(self.pending) + len(ops) > MAX_BATCH_WRITES or self.pending_bytes + size > MAX_BATCH_BYTES):
+                self._submit_pending()
+            self.pending.extend(ops)
+            self.pending_bytes += size
+            if len(self.pending) >= MAX_BATCH_WRITES or self.pending_bytes >= MAX_BATCH_BYTES:
+                self._submit_pending()
+
+    def _submit_pending(self):
+        # Caller holds self.lock
+        ops, self.pending = self.pending, []
+        self.pending_bytes = 0
+        # Commits count towards the run that queued them, not whatever the pool thread last saw
+        self.futures.append(self.executor.submit(cloud_metrics.bind_run(self._commit), ops))
+
+    def _commit(self, ops):
+        op_name = "delete" if all(op[0] == "delete" for op in ops) else "write"
+        collection = collection_path(ops[0][1])
+        size = sum(estimate_size(op[2]) for op in ops if op[2])
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                batch = self.db.batch()
+                for kind, doc_ref, data, merge in ops:
+                    if kind == "set":
+                        batch.set(doc_ref, data, merge=merge)
+                    else:
+                        batch.delete(doc_ref)
+                batch.commit()
+                cloud_metrics.record(op_name, collection, len(ops), size, time.perf_counter() - started, retries=attempt)
+                with self.lock:
+                    self.stats["writes"] += len(ops)
+                    self.stats["commits"] += 1
+                return len(ops)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    cloud_metrics.record(op_name, collection, len(ops), size, time.perf_counter() - started, retries=attempt, error=True)
+                    with self.lock:
+                        self.stats["failed_writes"] += len(ops)
+                    print(f"[{self.label}] Batch of {len(ops)} writes failed after {attempt} retries: {e}")
+                    return 0
+                delay = min(30.0, 0.5 * (2 ** attempt)) * (0.5 + random.random())
+                with self.lock:
+                    self.stats["retries"] += 1
+                print(f"[{self.label}] Batch commit failed ({e}); retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def flush(self):
+        """Commits everything queued so far and waits for in-flight batches."""
+        with self.lock:
+            if self.pending:
+                self._submit_pending()
+            futures, self.futures = self.futures, []
+        wait(futures)
+        return dict(self.stats)
+
+    def close(self, report=True, raise_on_error=True):
+        """
+        Commits the remainder, shuts the pool down and returns the stats. Raises
+        BatchWriteError when writes failed, unless raise_on_error is False (for
+        callers that check stats["failed_writes"] themselves).
+        """
+        stats = self.flush()
+        self.executor.shutdown(wait=True)
+        elapsed = time.perf_counter() - self.started_at
+        stats["seconds"] = elapsed
+        stats["writes_per_sec"] = stats["writes"] / elapsed if elapsed > 0 else 0.0
+        if report:
+            print(f"[{self.label}] {stats['writes']} writes in {stats['commits']} commits over {elapsed:.1f}s "
+                  f"({stats['writes_per_sec']:.0f} writes/s, {stats['retries']} retries, {stats['failed_writes']} failed)")
+        if raise_on_error and stats["failed_writes"]:
+            raise BatchWriteError(self.label, stats)
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Don't mask the exception that is already propagating
+        self.close(raise_on_error=exc_type is None)
+
+def _set_doc(doc_ref, data, merge=True):
+    """Single instrumented write outside a BatchWriter."""
+    with cloud_metrics.track("write", collection_path(doc_ref)) as call:
+        doc_ref.set(data, merge=merge)
+        call["docs"] = 1
+        call["bytes"] = estimate_size(data)
+
+def _delete_doc(doc_ref):
+    with cloud_metrics.track("delete", collection_path(doc_ref)) as call:
+        doc_ref.delete()
+        call["docs"] = 1
+
+def _get_doc(doc_ref):
+    with cloud_metrics.track("read", collection_path(doc_ref)) as call:
+        doc = doc_ref.get()
+        call["docs"] = 1
+        call["bytes"] = estimate_size(doc.to_dict()) if doc.exists else 0
+    return doc
+
+def _stream_docs(query, collection, op="read"):
+    """Yields query results, recording each document with the time spent fetching it."""
+    started = time.perf_counter()
+    try:
+        for doc in query.stream():
+            cloud_metrics.record(op, collection, 1, estimate_size(doc.to_dict()), time.perf_counter() - started)
+            yield doc
+            started = time.perf_counter()
+    except Exception:
+        cloud_metrics.record(op, collection, 0, 0, time.perf_counter() - started, error=True)
+        raise
+
+def _iter_refs(coll_ref, collection, page_size=None):
+    """Yields document refs page by page; the listing is recorded once it is exhausted."""
+    started = time.perf_counter()
+    count = 0
+    for ref in (coll_ref.list_documents(page_size=page_size) if page_size else coll_ref.list_documents()):
+        count += 1
+        yield ref
+    cloud_metrics.record("list", collection, count, 0, time.perf_counter() - started)
+
+def _list_refs(coll_ref, collection, page_size=None):
+    return list(_iter_refs(coll_ref, collection, page_size))
+
+def _payload_bytes(data):
+    # Only blobs matter for the request-size cap; ordinary fields are tiny
+    if not data:
+        return 0
+    return sum(len(v) for v in data.values() if isinstance(v, (bytes, bytearray)))
+
+def _is_retryable(error):
+    # Malformed or unauthorized writes will never succeed; everything else (timeouts,
+    # contention, quota, 5xx) is worth another attempt
+    try:
+        from google.api_core import exceptions as api_exceptions
+        if isinstance(error, (api_exceptions.InvalidArgument, api_exceptions.PermissionDenied, api_exceptions.Unauthenticated)):
+            return False
+    except ImportError:
+        pass
+    return True
+
+def get_batch_writer(label="Firestore Writer"):
+    """Returns a BatchWriter on the active client, or None when cloud sync is unavailable."""
+    db = get_db()
+    if not db:
+        return None
+    return BatchWriter(db, label=label)
+
+def _encode_compact_bundle(flights_map):
+    """
+    Packs a day's flights into columnar form (one list per field, crew and
+    history flattened with a flight index), then JSON + zlib. Returns the
+    compressed blob split into chunks of at most COMPACT_CHUNK_BYTES.
+    """
+    keys = list(flights_map)
+    fields = []
+    for data in flights_map.values():
+        for field in data:
+            if field not in ("crew", "history") and field not in fields:
+                fields.append(field)
+
+    columns = {}
+    datetime_fields = []
+    for field in fields:
+        values = [flights_map[k].get(field) for k in keys]
+        if any(isinstance(v, datetime) for v in values):
+            datetime_fields.append(field)
+            values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+        columns[field] = values
+
+    crew = {"flight": [], "name": [], "id": [], "role": [], "flags": []}
+    history = {"flight": [], "timestamp": [], "changes_json": [], "description": []}
+    for idx, k in enumerate(keys):
+        for c in flights_map[k].get("crew") or []:
+            crew["flight"].append(idx)
+            for col in ("name", "id", "role", "flags"):
+                crew[col].append(c.get(col))
+        for h in flights_map[k].get("history") or []:
+            history["flight"].append(idx)
+            for col in ("timestamp", "changes_json", "description"):
+                history[col].append(h.get(col))
+
+    payload = {"keys": keys, "columns": columns, "datetime_fields": datetime_fields, "crew": crew, "history": history}
+    blob = zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 9)
+    return [blob[i:i + COMPACT_CHUNK_BYTES] for i in range(0, len(blob), COMPACT_CHUNK_BYTES)] or [blob]
+
+def _decode_compact_bundle(chunks):
+    """Inverse of _encode_compact_bundle: chunks (in order) -> {flight_key: flight_data}."""
+    payload = json.loads(zlib.decompress(b"".join(bytes(c) for c in chunks)).decode("utf-8"))
+    keys = payload["keys"]
+    flights_map = {k: {} for k in keys}
+    datetime_fields = set(payload.get("datetime_fields", []))
+    for field, values in payload["columns"].items():
+        for k, v in zip(keys, values):
+            if field in datetime_fields and v is not None:
+                v = datetime.fromisoformat(v)
+            flights_map[k][field] = v
+    for k in keys:
+        flights_map[k]["crew"] = []
+        flights_map[k]["history"] = []
+
+    crew = payload["crew"]
+    for i, idx in enumerate(crew["flight"]):
+        flights_map[keys[idx]]["crew"].append({col: crew[col][i] for col in ("name", "id", "role", "flags")})
+    history = payload["history"]
+    for i, idx in enumerate(history["flight"]):
+        flights_map[keys[idx]]["history"].append({col: history[col][i] for col in ("timestamp", "changes_json", "description")})
+    return flights_map
+
+def get_day_roots(date_strs):
+    """{date_str: root fields} of the stored daily_flights days; days that do not exist yet map to {}."""
+    db = get_db()
+    if not db: return {}
+    roots = {}
+    for date_str in date_strs:
+        doc = _get_doc(db.collection('daily_flights').document(date_str))
+        roots[date_str] = (doc.to_dict() if doc.exists else None) or {}
+    return roots
+
+def _convert_compact_day(doc_ref, root, flights_map, writer):
+    """
+    Rewrites a compact day as one document per flight. The flight documents are
+    committed first while readers still decode the chunks; then the chunks are
+    deleted and the root flipped to "documents" in one batch. Flight documents
+    left over from before the day went compact are deleted. Returns False (root
+    untouched) if the flight writes failed.
+    """
+    safe_ids = {str(f_id).replace("/", "-") for f_id in flights_map}
+    coll = f"{collection_path(doc_ref)}/flights"
+    for f_ref in _list_refs(doc_ref.collection('flights'), coll):
+        if f_ref.id not in safe_ids:
+            writer.delete(f_ref)
+    for f_id, f_data in flights_map.items():
+        writer.set(doc_ref.collection('flights').document(str(f_id).replace("/", "-")), f_data, merge=False)
+
+    failed_before = writer.stats["failed_writes"]
+    if writer.flush()["failed_writes"] > failed_before:
+        return False
+    chunk_refs = [doc_ref.collection('chunks').document(str(i)) for i in range(int(root.get("chunk_count") or 0))]
+    writer.set_group([(doc_ref, {
+        "last_updated": firestore.SERVER_TIMESTAMP,
+        "encoding": "documents",
+        "chunk_count": firestore.DELETE_FIELD,
+        "flight_count": firestore.DELETE_FIELD
+    })], deletes=chunk_refs)
+    return True
+
+def upload_daily_flights(date_str: str, flights_map: dict, writer=None, compact=None, root=None):
     """
     date_str: YYYY-MM-DD
     flights_map: { flight_id: { ...details... } }
+    writer: optional shared BatchWriter; otherwise the day is written in its own batches.
+    compact: store the day as compressed columnar chunks instead of one document per
+        flight (defaults to is_compact_encoding_enabled()). Compact uploads replace the
+        whole day, so flights_map must hold every flight for the date.
+    root: the stored root document's fields if the caller already read them (see
+        get_day_roots); otherwise a document-mode upload reads them. A day still
+        stored compact is converted to documents, so flights_map must then also hold
+        every flight for the date.
     
     Restructured to use subcollections to avoid the 1MB per document limit in Firestore.
+    Read and write errors are raised, including BatchWriteError when the day is
+    written in its own batches.
     """
     db = get_db()
     if not db: return
+    if compact is None:
+        compact = is_compact_encoding_enabled()
+    own_writer = writer is None
+    if own_writer:
+        writer = BatchWriter(db, label=f"daily_flights/{date_str}")
     try:
         # Root document for the date
         doc_ref = db.collection('daily_flights').document(date_str)
-        doc_ref.set({"last_updated": firestore.SERVER_TIMESTAMP}, merge=True)
+
+        if compact:
+            chunks = _encode_compact_bundle(flights_map)
+            # Root and chunks go in one batch so readers never see a mix of generations.
+            # Stale higher-numbered chunks from a larger past upload are ignored via chunk_count.
+            group = [(doc_ref.collection('chunks').document(str(i)), {"data": chunk}) for i, chunk in enumerate(chunks)]
+            group.append((doc_ref, {
+                "last_updated": firestore.SERVER_TIMESTAMP,
+                "encoding": COMPACT_ENCODING,
+                "chunk_count": len(chunks),
+                "flight_count": len(flights_map)
+            }))
+            writer.set_group(group)
+            if own_writer:
+                writer.close(report=False)
+            print(f"Updated daily flights for {date_str} ({len(flights_map)} flights in {len(chunks)} compact chunk(s), {sum(len(c) for c in chunks)} bytes)")
+            return
+
+        if root is None:
+            root_doc = _get_doc(doc_ref)
+            root = (root_doc.to_dict() if root_doc.exists else None) or {}
+        if root.get("encoding") == COMPACT_ENCODING:
+            converted = _convert_compact_day(doc_ref, root, flights_map, writer)
+            if own_writer:
+                writer.close(report=False)
+            if converted:
+                print(f"Converted daily flights for {date_str} from compact chunks to sub-collection 'flights' ({len(flights_map)} flights)")
+            else:
+                print(f"Daily flights for {date_str} left compact: flight writes failed.")
+            return
+
+        writer.set(doc_ref, {"last_updated": firestore.SERVER_TIMESTAMP, "encoding": "documents"}, merge=True)
         
         # Upload each flight to a subcollection
         for f_id, f_data in flights_map.items():
             # Sanitize document ID: Firestore IDs cannot contain '/'
             safe_f_id = str(f_id).replace("/", "-")
             f_doc_ref = doc_ref.collection('flights').document(safe_f_id)
-            f_doc_ref.set(f_data, merge=True)
-            
+            writer.set(f_doc_ref, f_data, merge=True)
+        
+        if own_writer:
+            writer.close(report=False)
         print(f"Updated daily flights for {date_str} (in sub-collection 'flights')")
+    except BatchWriteError:
+        raise
+    except Exception:
+        # Errors propagate so callers (e.g. the outbox) never mark an unsent day as pushed
+        if own_writer:
+            writer.close(report=False, raise_on_error=False)
+        raise
+
+def delete_daily_flight(date_str: str, flight_key: str, writer=None):
+    """Deletes one flight document from daily_flights/{date_str}/flights."""
+    db = get_db()
+    if not db: return
+    try:
+        safe_f_id = str(flight_key).replace("/", "-")
+        f_doc_ref = db.collection('daily_flights').document(date_str).collection('flights').document(safe_f_id)
+        if writer:
+            writer.delete(f_doc_ref)
+        else:
+            _delete_doc(f_doc_ref)
     except Exception as e:
-        print(f"Error updating daily flights for {date_str}: {e}")
+        print(f"Error deleting flight {flight_key} on {date_str}: {e}")
 
-def upload_pairing_bundle(doc_id: str, pairing_data: dict):
+def upload_pairing_bundle(doc_id: str, pairing_data: dict, writer=None, merge=True):
     """
     doc_id: PairingNumber_YYYYMMDD
     pairing_data: { "pairing_number": ..., "legs": { "1": {...}, "2": {...} } }
+    writer: optional shared BatchWriter; the write is committed with its batch.
+    merge: False replaces the document, dropping legs no longer in the bundle.
     """
     db = get_db()
     if not db: return
     try:
         doc_ref = db.collection('pairings').document(doc_id)
-        doc_ref.set(pairing_data, merge=True)
-        print(f"Uploaded pairing bundle {doc_id}")
+        if writer:
+            writer.set(doc_ref, pairing_data, merge=merge)
+        else:
+            _set_doc(doc_ref, pairing_data, merge=merge)
+            print(f"Uploaded pairing bundle {doc_id}")
     except Exception as e:
         print(f"Error uploading pairing bundle {doc_id}: {e}")
 
+def list_pairing_ids_between(start_date, end_date):
+    """Returns ids of pairing bundles whose start date is in [start_date, end_date)."""
+    db = get_db()
+    if not db: return []
+    try:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        query = db.collection('pairings')\
+            .where(filter=FieldFilter("date", ">=", start_date))\
+            .where(filter=FieldFilter("date", "<", end_date))\
+            .select(["date"])
+        return [doc.id for doc in _stream_docs(query, "pairings", op="query")]
+    except Exception as e:
+        print(f"Error listing pairings between {start_date} and {end_date}: {e}")
+        return []
+
+def delete_pairing_bundle(doc_id: str, writer=None):
+    db = get_db()
+    if not db: return
+    try:
+        doc_ref = db.collection('pairings').document(doc_id)
+        if writer:
+            writer.delete(doc_ref)
+        else:
+            _delete_doc(doc_ref)
+    except Exception as e:
+        print(f"Error deleting pairing bundle {doc_id}: {e}")
+
 def upload_flight(flight_data: dict, flight_id: str):
     # Backward compatibility - redirects to daily grouping
     # flight_id is usually YYYYMMDD_FlightNum
@@ -96,15 +520,18 @@ def upload_flight(flight_data: dict, flight_id: str):
             d_str, f_num = flight_id.split("_")
             formatted_date = f"{d_str[:4]}-{d_str[4:6]}-{d_str[6:]}"
             upload_daily_flights(formatted_date, {f_num: flight_data})
-    except:
-        pass
+    except Exception as e:
+        print(f"Error uploading flight {flight_id}: {e}")
 
-def upload_ioe_assignment(ioe_data: dict, doc_id: str):
+def upload_ioe_assignment(ioe_data: dict, doc_id: str, writer=None):
     db = get_db()
     if not db: return
     try:
         doc_ref = db.collection('ioe_assignments').document(str(doc_id))
-        doc_ref.set(ioe_data, merge=True)
+        if writer:
+            writer.set(doc_ref, ioe_data, merge=True)
+        else:
+            _set_doc(doc_ref, ioe_data)
     except Exception as e:
         print(f"Error uploading IOE {doc_id}: {e}")
 
@@ -112,6 +539,86 @@ def upload_scheduled_flight(sched_data: dict, doc_id: str):
     # Deprecated - use upload_pairing_bundle
     pass
 
+# --- Bulk Delete ---
+
+# Subcollections documents of each collection can hold. The delete walk lists only
+# these rather than calling collections() on every document (one extra RPC each)
+SUBCOLLECTIONS = {"daily_flights": ("flights", "chunks")}
+
+def _delete_document_tree(doc_ref, writer, page_size=500):
+    """Queues deletes for every document under doc_ref's subcollections, then doc_ref itself."""
+    deleted = 0
+    parent_path = collection_path(doc_ref)
+    for name in SUBCOLLECTIONS.get(parent_path, ()):
+        for child_ref in _iter_refs(doc_ref.collection(name), f"{parent_path}/{name}", page_size):
+            deleted += _delete_document_tree(child_ref, writer, page_size)
+    writer.delete(doc_ref)
+    return deleted + 1
+
+def delete_document_trees(doc_refs, label="Bulk Delete", max_workers=8, page_size=500, progress_every=1000):
+    """
+    Recursively deletes the given documents and all of their subcollections
+    (see SUBCOLLECTIONS). doc_refs may be a lazy iterable; only a bounded number
+    of subtrees are walked concurrently. Deletes go through a BatchWriter, so they
+    are committed in parallel batches of up to 500. Returns documents deleted.
+    """
+    db = get_db()
+    if not db: return 0
+    with cloud_metrics.run(label):
+        writer = BatchWriter(db, max_workers=max_workers, label=label)
+        queued = 0
+        next_report = progress_every
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            in_flight = set()
+            refs = iter(doc_refs)
+            while True:
+                for ref in refs:
+                    in_flight.add(pool.submit(cloud_metrics.bind_run(_delete_document_tree), ref, writer, page_size))
+                    if len(in_flight) >= max_workers * 4:
+                        break
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        queued += future.result()
+                    except Exception as e:
+                        print(f"[{label}] Error walking document tree: {e}")
+                if queued >= next_report:
+                    print(f"[{label}] Progress: {queued} documents queued, {writer.stats['writes']} deleted...")
+                    next_report = queued + progress_every
+        stats = writer.close(raise_on_error=False)
+        if stats["failed_writes"]:
+            print(f"[{label}] {stats['failed_writes']} deletes failed; run the delete again to finish.")
+    return stats["writes"]
+
+def delete_collection(collection_name, max_workers=8, page_size=500):
+    """Recursively deletes every document (and subcollection) in a top-level collection."""
+    db = get_db()
+    if not db: return 0
+    # list_documents() also yields parent docs that only exist through their subcollections
+    label = f"Delete {collection_name}"
+    with cloud_metrics.run(label):
+        refs = _iter_refs(db.collection(collection_name), collection_name, page_size)
+        return delete_document_trees(refs, label=label, max_workers=max_workers, page_size=page_size)
+
+@cloud_metrics.measured("Cloud Retention")
+def prune_cloud_days_older_than(days, max_workers=8, dry_run=False):
+    """
+    Retention: deletes daily_flights days (with their flights/chunks subcollections)
+    dated more than `days` days ago. Returns (day_ids, documents_deleted).
+    """
+    db = get_db()
+    if not db: return [], 0
+    cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    old_days = [d for d in list_daily_flight_dates() if d < cutoff]
+    if dry_run or not old_days:
+        return old_days, 0
+    print(f"[Cloud Retention] Pruning {len(old_days)} days before {cutoff}...")
+    refs = [db.collection('daily_flights').document(d) for d in old_days]
+    deleted = delete_document_trees(refs, label="Cloud Retention", max_workers=max_workers)
+    return old_days, deleted
+
 def get_cloud_count(collection_name):
     db = get_db()
     if not db: return 0
@@ -119,17 +626,23 @@ def get_cloud_count(collection_name):
     try:
         coll = db.collection(collection_name)
         count_query = coll.count()
-        return count_query.get()[0][0].value
+        with cloud_metrics.track("aggregate", collection_name) as call:
+            value = count_query.get()[0][0].value
+            call["docs"] = 1 # Billed as one read per batch of up to 1000 index entries
+        return value
     except Exception as e:
         print(f"Error getting count for {collection_name}: {e}")
         return -1
 
-def upload_metadata(key, value):
+def upload_metadata(key, value, writer=None):
     db = get_db()
     if not db: return
     try:
         doc_ref = db.collection('metadata').document(str(key))
-        doc_ref.set({"value": value}, merge=True)
+        if writer:
+            writer.set(doc_ref, {"value": value}, merge=True)
+        else:
+            _set_doc(doc_ref, {"value": value})
     except Exception as e:
         print(f"Error uploading metadata {key}: {e}")
 
@@ -138,7 +651,7 @@ def get_cloud_metadata(key):
     db = get_db()
     if not db: return None
     try:
-        doc = db.collection('metadata').document(str(key)).get()
+        doc = _get_doc(db.collection('metadata').document(str(key)))
         if doc.exists:
             return doc.to_dict().get("value")
     except Exception as e:
@@ -147,27 +660,64 @@ def get_cloud_metadata(key):
 
 # --- Download Functions for Two-Way Sync ---
 
+def list_daily_flight_dates():
+    """Returns the sorted YYYY-MM-DD ids of every daily_flights day document."""
+    db = get_db()
+    if not db: return []
+    try:
+        # list_documents() also returns day docs that only hold a subcollection
+        return sorted(ref.id for ref in _list_refs(db.collection('daily_flights'), 'daily_flights'))
+    except Exception as e:
+        print(f"Error listing daily_flights: {e}")
+        return []
+
+def list_updated_daily_flight_dates(updated_after):
+    """Returns the sorted ids of day documents whose last_updated stamp is after updated_after (aware UTC datetime)."""
+    db = get_db()
+    if not db: return []
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    # Projection keeps the read to the one field the filter needs
+    query = db.collection('daily_flights')\
+        .where(filter=FieldFilter("last_updated", ">", updated_after))\
+        .select(["last_updated"])
+    return sorted(doc.id for doc in _stream_docs(query, 'daily_flights', op="query"))
+
+def download_day_flights(date_str: str):
+    """Returns {flight_key: flight_data} for one day (compact chunks, subcollection, or legacy inline field)."""
+    db = get_db()
+    if not db: return {}
+    doc_ref = db.collection('daily_flights').document(date_str)
+    doc = _get_doc(doc_ref)
+    root = (doc.to_dict() if doc.exists else None) or {}
+
+    if root.get("encoding") == COMPACT_ENCODING:
+        chunks = []
+        for i in range(int(root.get("chunk_count") or 0)):
+            chunk_doc = _get_doc(doc_ref.collection('chunks').document(str(i)))
+            if not chunk_doc.exists:
+                raise ValueError(f"daily_flights/{date_str} is missing compact chunk {i}")
+            chunks.append(chunk_doc.to_dict()["data"])
+        return _decode_compact_bundle(chunks) if chunks else {}
+
+    # Check for data in subcollection first (New Format)
+    flights_map = {}
+    for fd in _stream_docs(doc_ref.collection('flights'), 'daily_flights/flights'):
+        flights_map[fd.id] = fd.to_dict()
+    
+    # Fallback to legacy field if subcollection is empty (Old Format)
+    if not flights_map and "flights" in root:
+        flights_map = root["flights"]
+    return flights_map
+
 def download_daily_flights():
     """Yields (doc_id, data_dict) for all daily flight bundles."""
     db = get_db()
     if not db: return
     try:
-        docs = db.collection('daily_flights').stream()
-        for doc in docs:
-            # Check for data in subcollection first (New Format)
-            flights_map = {}
-            f_docs = doc.reference.collection('flights').stream()
-            for fd in f_docs:
-                flights_map[fd.id] = fd.to_dict()
-            
-            # Fallback to legacy field if subcollection is empty (Old Format)
-            if not flights_map:
-                legacy_data = doc.to_dict()
-                if legacy_data and "flights" in legacy_data:
-                    flights_map = legacy_data["flights"]
-            
+        for date_str in list_daily_flight_dates():
+            flights_map = download_day_flights(date_str)
             if flights_map:
-                yield doc.id, {"flights": flights_map}
+                yield date_str, {"flights": flights_map}
                 
     except Exception as e:
         print(f"Error downloading daily_flights: {e}")
@@ -177,7 +727,7 @@ def download_pairings():
     db = get_db()
     if not db: return
     try:
-        docs = db.collection('pairings').stream()
+        docs = _stream_docs(db.collection('pairings'), 'pairings')
         for doc in docs:
             yield doc.id, doc.to_dict()
     except Exception as e:
@@ -188,7 +738,7 @@ def download_ioe():
     db = get_db()
     if not db: return
     try:
-        docs = db.collection('ioe_assignments').stream()
+        docs = _stream_docs(db.collection('ioe_assignments'), 'ioe_assignments')
         for doc in docs:
             yield doc.id, doc.to_dict()
     except Exception as e:
@@ -199,7 +749,7 @@ def download_metadata():
     db = get_db()
     if not db: return
     try:
-        docs = db.collection('metadata').stream()
+        docs = _stream_docs(db.collection('metadata'), 'metadata')
         for doc in docs:
             yield doc.id, doc.to_dict()
     except Exception as e:
@@ -0,0 +1,79 @@
+"""
+Full-text search over the scraped Station Ops text blocks (notes, pax, load).
+
+SQLite uses the flight_text_fts FTS5 table and Postgres the flights.search_tsv
+column; both are created in init_db and kept in sync with the flights table.
+"""
+import re
+from datetime import timedelta
+from sqlalchemy import text
+from database import Flight
+
+def _fts5_query(query):
+    """Turns free text into a safe FTS5 query: every token quoted, all tokens required, 'abc*' kept as a prefix."""
+    terms = []
+    for token in query.split():
+        prefix = token.endswith("*")
+        token = token.rstrip("*").replace('"', '""')
+        if token:
+            terms.append(f'"{token}"*' if prefix else f'"{token}"')
+    return " ".join(terms)
+
+def search_flight_text(session, query, start_date=None, end_date=None, limit=100):
+    """
+    Returns ranked matches as dicts: {"flight": Flight, "rank": float, "snippet": str}.
+    start_date / end_date (inclusive, by flight date) are optional.
+    """
+    if not query or not query.strip():
+        return []
+
+    params = {"limit": limit}
+    date_sql = ""
+    if start_date:
+        date_sql += " AND f.date >= :start_date"
+        params["start_date"] = start_date
+    if end_date:
+        date_sql += " AND f.date < :end_date"
+        params["end_date"] = end_date + timedelta(days=1)
+
+    dialect = session.bind.dialect.name
+    if dialect == "sqlite":
+        params["q"] = _fts5_query(query)
+        if not params["q"]:
+            return []
+        sql = f"""
+            SELECT f.id, bm25(flight_text_fts) AS rank,
+                   snippet(flight_text_fts, -1, '**', '**', '…', 12) AS snip
+            FROM flight_text_fts
+            JOIN flights f ON f.id = flight_text_fts.rowid
+            WHERE flight_text_fts MATCH :q{date_sql}
+            ORDER BY rank
+            LIMIT :limit
+        """
+    elif dialect == "postgresql":
+        params["q"] = query
+        sql = f"""
+            SELECT f.id, ts_rank(f.search_tsv, q) AS rank,
+                   ts_headline('simple',
+                       coalesce(f.notes_data, '') || ' ' || coalesce(f.pax_data, '') || ' ' || coalesce(f.load_data, ''),
+                       q, 'StartSel=**, StopSel=**, MaxFragments=1, MaxWords=20') AS snip
+            FROM flights f, websearch_to_tsquery('simple', :q) q
+            WHERE f.search_tsv @@ q{date_sql}
+            ORDER BY rank DESC
+            LIMIT :limit
+        """
+    else:
+        print(f"[Flight Search] Full-text search is not supported on '{dialect}'.")
+        return []
+
+    try:
+        rows = session.execute(text(sql), params).fetchall()
+    except Exception as e:
+        print(f"[Flight Search] Search failed for '{query}': {e}")
+        return []
+
+    flights = {f.id: f for f in session.query(Flight).filter(Flight.id.in_([r[0] for r in rows])).all()} if rows else {}
+    return [
+        {"flight": flights[f_id], "rank": rank, "snippet": re.sub(r"\s+", " ", snip or "").strip()}
+        for f_id, rank, snip in rows if f_id in flights
+    ]
@@ -3,12 +3,26 @@ import os
 from datetime import datetime, timedelta
 from database import get_session, ScheduledFlight, IOEAssignment, LCP, init_db
 from bid_periods import get_bid_period_date_range
+from cloud_metrics import cloud_metrics
 
 PAIRINGS_DIR = "pairings"
 IOE_DIR = "ioe"
 LCP_DIR = "lcp"
 
+# Per-machine sync bookkeeping; never mirrored to or restored from Firestore
+RESTORE_CHECKPOINT_KEY = "cloud_restore_checkpoint"
+# When the full restore that wrote the checkpoint started; a resumed run uses it as the watermark
+RESTORE_STARTED_KEY = "cloud_restore_started_at"
+PULL_WATERMARK_KEY = "cloud_pull_watermark"
+LOCAL_METADATA_KEYS = {RESTORE_CHECKPOINT_KEY, RESTORE_STARTED_KEY, PULL_WATERMARK_KEY, "cloud_sync_worker_status"}
+
+# Re-read this much before the watermark to cover clock skew and day docs whose
+# last_updated stamp committed before the rest of their flight batches
+PULL_WATERMARK_OVERLAP = timedelta(minutes=5)
+
 def ingest_all(session):
+    """Parses every input file. Returns the calendar months (first day) of the pairings it saved."""
+    pairing_months = set()
     # IOE Files
     if os.path.exists(IOE_DIR):
         for f in os.listdir(IOE_DIR):
@@ -19,7 +33,7 @@ def ingest_all(session):
     if os.path.exists(PAIRINGS_DIR):
         for f in os.listdir(PAIRINGS_DIR):
             if f.endswith(".txt") and not f.startswith("._"):
-                parse_pairings_file(os.path.join(PAIRINGS_DIR, f), session)
+                pairing_months |= parse_pairings_file(os.path.join(PAIRINGS_DIR, f), session)
 
     # LCP Files
     if os.path.exists(LCP_DIR):
@@ -29,6 +43,7 @@ def ingest_all(session):
                     parse_lcp_file(os.path.join(LCP_DIR, f), session)
                  elif f.endswith(".pdf"):
                     parse_lcp_pdf(os.path.join(LCP_DIR, f), session)
+    return pairing_months
 
 def parse_ioe_file(filepath, session):
     print(f"Parsing IOE file: {filepath}")
@@ -105,6 +120,7 @@ def parse_pairings_file(filepath, session):
     current_total_credit = None
     
     import_count = 0
+    months = set() # Start months of the saved pairings
     
     for line in lines:
         # 1. Header Detection
@@ -114,7 +130,7 @@ def parse_pairings_file(filepath, session):
         if header_match:
             # Save previous if exists
             if current_pairing and start_dates and legs:
-                save_pairing(session, current_pairing, month_year, start_dates, legs, current_total_credit)
+                months |= save_pairing(session, current_pairing, month_year, start_dates, legs, current_total_credit)
                 import_count += 1
             
             # Reset
@@ -266,11 +282,12 @@ def parse_pairings_file(filepath, session):
 
     # Save last one
     if current_pairing and start_dates and legs:
-        save_pairing(session, current_pairing, month_year, start_dates, legs, current_total_credit)
+        months |= save_pairing(session, current_pairing, month_year, start_dates, legs, current_total_credit)
         import_count += 1
         
     session.commit()
     print(f"Imported {import_count} pairings.")
+    return months
 
 def parse_lcp_file(filepath, session):
     print(f"Parsing LCP file: {filepath}")
@@ -405,6 +422,7 @@ def save_pairing(session, pairing_id, month_year, start_dates, legs, total_credi
     bp_start_dt = datetime.combine(bp_start, datetime.min.time())
     bp_end_dt = datetime.combine(bp_end, datetime.min.time())
 
+    saved_months = set() # Calendar months of the start dates saved, for the cloud upload
     for start_day in start_dates:
         # Construct actual start date
         base_date = None
@@ -498,13 +516,17 @@ def save_pairing(session, pairing_id, month_year, start_dates, legs, total_credi
                 is_deadhead=leg["is_dh"]
             )
             session.add(rec)
+        saved_months.add(_month_start(base_date))
+    return saved_months
 
 
 
+@cloud_metrics.measured("IOE Upload")
 def upload_ioe_to_cloud(session):
     print("Cloud Sync: Uploading IOE Assignments...")
-    from firestore_lib import upload_ioe_assignment
+    from firestore_lib import upload_ioe_assignment, get_batch_writer
     ioe_data = session.query(IOEAssignment).all()
+    writer = get_batch_writer("IOE Upload")
     count = 0
     for rec in ioe_data:
         # Create a unique ID for the document, e.g., emp_pairing_date
@@ -514,14 +536,37 @@ def upload_ioe_to_cloud(session):
             "pairing_number": rec.pairing_number,
             "start_date": rec.start_date
         }
-        upload_ioe_assignment(data, doc_id)
+        upload_ioe_assignment(data, doc_id, writer=writer)
         count += 1
+    if writer:
+        writer.close()
     print(f"Cloud Sync: Uploaded {count} IOE records.")
     return count
 
-def upload_pairings_to_cloud(session):
+def _bundle_hash(data):
+    import json
+    import hashlib
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+def _next_month(dt):
+    return datetime(dt.year + (dt.month // 12), dt.month % 12 + 1, 1)
+
+@cloud_metrics.measured("Pairing Upload")
+def upload_pairings_to_cloud(session, force=False, months=None):
+    """
+    Uploads only pairing bundles whose content hash differs from the one stored
+    at the last upload (all of them with force=True, e.g. after the cloud was
+    wiped), then deletes bundles that no longer exist locally.
+    months: the re-ingested months (first day). Only these are listed in the
+    cloud (one billed read per cloud bundle) to find bundles uploaded elsewhere;
+    without them, stale bundles are found from the local upload hashes alone.
+    """
     print("Cloud Sync: Uploading Scheduled Pairings...")
-    from firestore_lib import upload_pairing_bundle
+    from firestore_lib import upload_pairing_bundle, delete_pairing_bundle, list_pairing_ids_between, get_batch_writer
+    from database import PairingBundleHash
     sched_data = session.query(ScheduledFlight).all()
     
     # Group by pairing_number and pairing_start_date
@@ -548,47 +593,97 @@ def upload_pairings_to_cloud(session):
             "block_time": rec.block_time,
             "total_credit": rec.total_credit
         }
-        
+
+    writer = get_batch_writer("Pairing Upload")
+    if not writer:
+        return 0
+
+    known = {h.doc_id: h for h in session.query(PairingBundleHash).all()}
+    hashes = {doc_id: _bundle_hash(data) for doc_id, data in bundles.items()}
+    changed = [doc_id for doc_id in bundles if force or doc_id not in known or known[doc_id].content_hash != hashes[doc_id]]
+
     count = 0
-    for doc_id, data in bundles.items():
-        upload_pairing_bundle(doc_id, data)
+    for doc_id in changed:
+        # Full replace so legs dropped from a pairing don't linger in the cloud doc
+        upload_pairing_bundle(doc_id, bundles[doc_id], writer=writer, merge=False)
         count += 1
-    print(f"Cloud Sync: Uploaded {count} pairing bundles.")
+
+    # Bundles in the re-ingested months that disappeared locally are stale in the cloud
+    stale = set()
+    for month in months or ():
+        for doc_id in list_pairing_ids_between(month, _next_month(month)):
+            if doc_id not in bundles:
+                stale.add(doc_id)
+    local_months = {_month_start(data["date"]) for data in bundles.values() if data["date"]} | set(months or ())
+    stale.update(doc_id for doc_id, h in known.items()
+                 if doc_id not in bundles and h.start_date and _month_start(h.start_date) in local_months)
+    for doc_id in stale:
+        delete_pairing_bundle(doc_id, writer=writer)
+
+    stats = writer.close(raise_on_error=False)
+    if stats["failed_writes"]:
+        # Can't tell which writes failed; leave hashes untouched so everything changed is retried
+        print(f"Cloud Sync: {stats['failed_writes']} pairing writes failed; hashes not updated.")
+    else:
+        now = datetime.now()
+        for doc_id in changed:
+            rec = known.get(doc_id)
+            if not rec:
+                rec = PairingBundleHash(doc_id=doc_id)
+                session.add(rec)
+            rec.content_hash = hashes[doc_id]
+            rec.start_date = bundles[doc_id]["date"]
+            rec.uploaded_at = now
+        if stale:
+            session.query(PairingBundleHash).filter(PairingBundleHash.doc_id.in_(stale)).delete(synchronize_session=False)
+        session.commit()
+
+    print(f"Cloud Sync: Uploaded {count} changed pairing bundles ({len(bundles) - count} unchanged), deleted {len(stale)} stale.")
     return count
 
-def upload_flights_to_cloud(session, start_date=None, end_date=None):
-    print("Cloud Sync: Uploading Historical Flights...")
-    from firestore_lib import upload_daily_flights
-    from database import Flight
-    query = session.query(Flight)
-    if start_date:
-        query = query.filter(Flight.date >= start_date)
-    if end_date:
-        query = query.filter(Flight.date <= end_date)
-        
-    flights = query.all()
-    
-    # Pre-load ALL crew association rows for these flights in one query (avoids N+1)
-    from database import flight_crew_association
+def cloud_flight_key(f):
+    """Document id of a flight inside its daily_flights/{date}/flights subcollection."""
+    return f"{f.flight_number}_{f.departure_airport or 'UNK'}_{f.arrival_airport or 'UNK'}"
+
+def _serialize_flight_chunk(session, flights):
+    """
+    Serializes a chunk of flights (with crew and history) into
+    [(date_str, doc_key, flight_data)], bulk-loading crew and history for the
+    whole chunk instead of querying per flight.
+    """
+    from database import flight_crew_association, FlightHistory, CrewMember
     flight_ids = [f.id for f in flights]
-    assoc_map = {}
+    crew_map = {}
+    history_map = {}
     if flight_ids:
-        assoc_rows = session.execute(
-            flight_crew_association.select().where(
-                flight_crew_association.c.flight_id.in_(flight_ids)
-            )
-        ).fetchall()
-        for row in assoc_rows:
-            assoc_map[(row.flight_id, row.crew_id)] = row
-    
-    # Group by date
-    daily_bundles = {}
+        crew_rows = session.query(
+            flight_crew_association.c.flight_id,
+            flight_crew_association.c.role,
+            flight_crew_association.c.flags,
+            CrewMember.name,
+            CrewMember.employee_id
+        ).join(CrewMember, CrewMember.id == flight_crew_association.c.crew_id)\
+            .filter(flight_crew_association.c.flight_id.in_(flight_ids)).all()
+        for row in crew_rows:
+            crew_map.setdefault(row.flight_id, []).append({
+                "name": row.name,
+                "id": row.employee_id,
+                "role": row.role or "Unknown",
+                "flags": row.flags or ""
+            })
+
+        history_rows = session.query(FlightHistory)\
+            .filter(FlightHistory.flight_id.in_(flight_ids))\
+            .order_by(FlightHistory.flight_id, FlightHistory.id).all()
+        for h in history_rows:
+            history_map.setdefault(h.flight_id, []).append({
+                "timestamp": h.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                "changes_json": h.changes_json,
+                "description": h.description
+            })
+
+    serialized = []
     for f in flights:
-        date_str = f.date.strftime('%Y-%m-%d')
-        if date_str not in daily_bundles:
-            daily_bundles[date_str] = {}
-        
-        # Serialize flight details
         flight_data = {
             "flight_number": f.flight_number,
             "date": f.date,
@@ -603,69 +698,341 @@ def upload_flights_to_cloud(session, start_date=None, end_date=None):
             "aircraft_type": f.aircraft_type,
             "pax_data": f.pax_data,
             "load_data": f.load_data,
-            "notes_data": f.notes_data or ""
+            "notes_data": f.notes_data or "",
+            "crew": crew_map.get(f.id, []),
+            "history": history_map.get(f.id, [])
         }
-        # Add basic crew info
-        crew_list = []
-        for c in f.crew_members:
-            assoc = assoc_map.get((f.id, c.id))
-            crew_list.append({
-                "name": c.name, 
-                "id": c.employee_id,
-                "role": assoc.role if assoc else "Unknown",
-                "flags": assoc.flags if assoc else ""
-            })
-        flight_data["crew"] = crew_list
-        
-        # Add Flight History
-        from database import FlightHistory
-        history_recs = session.query(FlightHistory).filter_by(flight_id=f.id).all()
-        history_list = []
-        for h in history_recs:
-             history_list.append({
-                 "timestamp": h.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                 "changes_json": h.changes_json,
-                 "description": h.description
-             })
-        flight_data["history"] = history_list
-        
-        # Unique key within the daily bundle doc
-        unique_key = f"{f.flight_number}_{f.departure_airport or 'UNK'}_{f.arrival_airport or 'UNK'}"
-        daily_bundles[date_str][unique_key] = flight_data
+        serialized.append((f.date.strftime('%Y-%m-%d'), cloud_flight_key(f), flight_data))
+    return serialized
+
+def build_daily_bundles(session, flights):
+    """Serializes flights (with crew and history) into {date_str: {doc_key: flight_data}}."""
+    daily_bundles = {}
+    for date_str, doc_key, flight_data in _serialize_flight_chunk(session, flights):
+        daily_bundles.setdefault(date_str, {})[doc_key] = flight_data
+    return daily_bundles
+
+def iter_daily_bundles(session, start_date=None, end_date=None, chunk_size=1000):
+    """
+    Streams (date_str, flights_map) one day at a time, reading flights in
+    date-ordered keyset chunks so memory stays bounded by chunk_size plus one day.
+    """
+    from sqlalchemy import or_, and_
+    from database import Flight
+    base_query = session.query(Flight)
+    if start_date:
+        base_query = base_query.filter(Flight.date >= start_date)
+    if end_date:
+        base_query = base_query.filter(Flight.date <= end_date)
+
+    current_date = None
+    current_bundle = {}
+    last_key = None
+    while True:
+        query = base_query
+        if last_key:
+            last_date, last_id = last_key
+            query = query.filter(or_(Flight.date > last_date, and_(Flight.date == last_date, Flight.id > last_id)))
+        flights = query.order_by(Flight.date, Flight.id).limit(chunk_size).all()
+        if not flights:
+            break
+        last_key = (flights[-1].date, flights[-1].id)
+
+        for date_str, doc_key, flight_data in _serialize_flight_chunk(session, flights):
+            if current_date is not None and date_str != current_date:
+                yield current_date, current_bundle
+                current_bundle = {}
+            current_date = date_str
+            current_bundle[doc_key] = flight_data
+        # Nothing from this chunk is needed again; keep the identity map small
+        for f in flights:
+            session.expunge(f)
+
+    if current_date is not None:
+        yield current_date, current_bundle
+
+@cloud_metrics.measured("Flight Upload")
+def upload_flights_to_cloud(session, start_date=None, end_date=None):
+    print("Cloud Sync: Uploading Historical Flights...")
+    from firestore_lib import upload_daily_flights, get_batch_writer
         
+    # One writer across all days so small days share 500-write batches
+    writer = get_batch_writer("Flight Upload")
+    if not writer:
+        return 0
     count = 0
-    for date_str, flights_map in daily_bundles.items():
-        upload_daily_flights(date_str, flights_map)
+    for date_str, flights_map in iter_daily_bundles(session, start_date, end_date):
+        # Each day goes to the writer as soon as it is complete
+        upload_daily_flights(date_str, flights_map, writer=writer)
         count += 1
+    writer.close()
     print(f"Cloud Sync: Uploaded {count} daily flight bundles.")
     return count
 
+@cloud_metrics.measured("Metadata Upload")
 def upload_metadata_to_cloud(session):
     print("Cloud Sync: Uploading Application Metadata...")
-    from firestore_lib import upload_metadata
+    from firestore_lib import upload_metadata, get_batch_writer
     from database import AppMetadata
     meta = session.query(AppMetadata).all()
+    writer = get_batch_writer("Metadata Upload")
     count = 0
     for m in meta:
-        upload_metadata(m.key, m.value)
+        if m.key in LOCAL_METADATA_KEYS:
+            continue
+        upload_metadata(m.key, m.value, writer=writer)
         count += 1
+    if writer:
+        writer.close()
     print(f"Cloud Sync: Uploaded {count} metadata entries.")
     return count
 
+def _naive(dt):
+    # Firestore returns timezone-aware UTC datetimes for the naive values we uploaded
+    if isinstance(dt, datetime) and dt.tzinfo is not None:
+        return dt.replace(tzinfo=None)
+    return dt
+
+def _restore_day(session, date_str, flights_map, crew_by_emp, crew_by_name):
+    """
+    Upserts one day of cloud flights using prefetched lookups: one query for the
+    day's flights, one for existing history timestamps, and bulk inserts for new
+    flights, crew links and history. Returns the number of new flights.
+    """
+    from database import Flight, FlightHistory, CrewMember, flight_crew_association
+    day_start = datetime.strptime(date_str, '%Y-%m-%d')
+    existing = {}
+    for f in session.query(Flight).filter(Flight.date >= day_start, Flight.date < day_start + timedelta(days=1)).all():
+        existing.setdefault((f.flight_number, f.date, f.departure_airport, f.arrival_airport), f)
+
+    # Match by Number + Date + Departure + Arrival (for duplicates)
+    restored = []
+    new_flights = []
+    for unique_key, f_data in flights_map.items():
+        f_date = _naive(f_data.get("date"))
+        key = (f_data.get("flight_number"), f_date, f_data.get("departure_airport"), f_data.get("arrival_airport"))
+        flight = existing.get(key)
+        if flight:
+            flight.tail_number = f_data.get("tail_number")
+            flight.status = f_data.get("status")
+            flight.actual_departure = _naive(f_data.get("actual_departure"))
+            flight.actual_arrival = _naive(f_data.get("actual_arrival"))
+        else:
+            flight = Flight(
+                flight_number=f_data.get("flight_number"),
+                date=f_date,
+                tail_number=f_data.get("tail_number"),
+                scheduled_departure=_naive(f_data.get("scheduled_departure")),
+                scheduled_arrival=_naive(f_data.get("scheduled_arrival")),
+                actual_departure=_naive(f_data.get("actual_departure")),
+                actual_arrival=_naive(f_data.get("actual_arrival")),
+                departure_airport=f_data.get("departure_airport"),
+                arrival_airport=f_data.get("arrival_airport"),
+                status=f_data.get("status"),
+                aircraft_type=f_data.get("aircraft_type"),
+                pax_data=f_data.get("pax_data"),
+                load_data=f_data.get("load_data"),
+                notes_data=f_data.get("notes_data")
+            )
+            new_flights.append(flight)
+            existing[key] = flight
+        restored.append((flight, f_data))
+
+    if new_flights:
+        session.add_all(new_flights)
+        session.flush() # One batched INSERT for the whole day
+    flight_ids = list({f.id for f, _ in restored})
+    if not flight_ids:
+        return 0
+
+    # Existing history timestamps for the whole day, to skip duplicates
+    existing_ts = {}
+    for flight_id, ts in session.query(FlightHistory.flight_id, FlightHistory.timestamp)\
+            .filter(FlightHistory.flight_id.in_(flight_ids)).all():
+        existing_ts.setdefault(flight_id, set()).add(ts.strftime('%Y-%m-%d %H:%M:%S'))
+
+    session.execute(flight_crew_association.delete().where(flight_crew_association.c.flight_id.in_(flight_ids)))
+    assoc_rows = []
+    assoc_seen = set()
+    history_rows = []
+    for flight, f_data in restored:
+        for c_dict in f_data.get("crew", []):
+            c_name = c_dict.get("name")
+            c_id = c_dict.get("id")
+            if not c_name: continue
+
+            crew_pk = crew_by_emp.get(c_id) or crew_by_name.get(c_name)
+            if not crew_pk:
+                crew_rec = CrewMember(name=c_name, employee_id=c_id)
+                session.add(crew_rec)
+                session.flush()
+                crew_pk = crew_rec.id
+                if c_id: crew_by_emp[c_id] = crew_pk
+                crew_by_name.setdefault(c_name, crew_pk)
+
+            # (flight_id, crew_id) is the association's primary key
+            if (flight.id, crew_pk) in assoc_seen: continue
+            assoc_seen.add((flight.id, crew_pk))
+            assoc_rows.append({
+                "flight_id": flight.id,
+                "crew_id": crew_pk,
+                "role": c_dict.get("role", "Unknown"),
+                "flags": c_dict.get("flags", "")
+            })
+
+        seen_ts = existing_ts.setdefault(flight.id, set())
+        for h_data in f_data.get("history", []):
+            ts_str = h_data.get("timestamp")
+            if not ts_str or ts_str in seen_ts: continue
+            try:
+                ts = datetime.strptime(ts_str, '%Y-%m-%d %H:%M:%S')
+            except Exception as e:
+                print(f"Error restoring history record: {e}")
+                continue
+            seen_ts.add(ts_str)
+            history_rows.append({
+                "flight_id": flight.id,
+                "timestamp": ts,
+                "changes_json": h_data.get("changes_json"),
+                "description": h_data.get("description")
+            })
+
+    if assoc_rows:
+        session.execute(flight_crew_association.insert(), assoc_rows)
+    if history_rows:
+        session.execute(FlightHistory.__table__.insert(), history_rows)
+    return len(new_flights)
+
+@cloud_metrics.measured("Flight Restore")
+def restore_flights_from_cloud(session, max_workers=8, resume=True, incremental=False, stats=None):
+    """
+    Pulls daily_flights days from Firestore with a pool of fetch threads
+    (a bounded window ahead of the writer) and applies days in date order on
+    this session. After each committed day the date is saved as a checkpoint
+    in AppMetadata, so an interrupted full restore resumes from the next day.
+    A resumed restore sets the pull watermark to when the first, interrupted run
+    started, since the days before the checkpoint were downloaded back then.
+
+    incremental: only fetch day docs stamped after the last successful pull's
+    watermark (falls back to a full pull when there is no watermark yet).
+    stats: optional dict that receives the number of days applied under "days".
+    """
+    import time
+    from datetime import timezone
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    from firestore_lib import list_daily_flight_dates, list_updated_daily_flight_dates, download_day_flights
+    from database import CrewMember, get_metadata, set_metadata
+
+    started = time.perf_counter()
+    pull_started_at = datetime.now(timezone.utc)
+    watermark = get_metadata(session, PULL_WATERMARK_KEY) if incremental else None
+    if watermark:
+        since = datetime.fromisoformat(watermark) - PULL_WATERMARK_OVERLAP
+        dates = list_updated_daily_flight_dates(since)
+        print(f"Pulling flight days updated since {since.strftime('%Y-%m-%d %H:%M:%S')} UTC ({len(dates)} days)...")
+    else:
+        dates = list_daily_flight_dates()
+        checkpoint = get_metadata(session, RESTORE_CHECKPOINT_KEY) if resume else None
+        if checkpoint:
+            dates = [d for d in dates if d > checkpoint]
+            print(f"Resuming flight restore after {checkpoint} ({len(dates)} days left)...")
+            first_started = get_metadata(session, RESTORE_STARTED_KEY)
+            # Without the first run's start time no watermark is safe; the next pull is then a full one
+            pull_started_at = datetime.fromisoformat(first_started) if first_started else None
+        else:
+            set_metadata(session, RESTORE_STARTED_KEY, pull_started_at.isoformat())
+
+    crew_by_emp = {}
+    crew_by_name = {}
+    for crew_pk, name, employee_id in session.query(CrewMember.id, CrewMember.name, CrewMember.employee_id).all():
+        if employee_id: crew_by_emp.setdefault(employee_id, crew_pk)
+        if name: crew_by_name.setdefault(name, crew_pk)
+
+    new_flights = 0
+    done = 0
+    failed = False
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        date_iter = iter(dates)
+        window = deque()
+        # Keep a bounded number of days in flight so memory doesn't grow with history size
+        for date_str in date_iter:
+            window.append((date_str, pool.submit(cloud_metrics.bind_run(download_day_flights), date_str)))
+            if len(window) >= max_workers * 2:
+                break
+
+        while window:
+            date_str, future = window.popleft()
+            next_date = next(date_iter, None)
+            if next_date:
+                window.append((next_date, pool.submit(cloud_metrics.bind_run(download_day_flights), next_date)))
+
+            try:
+                flights_map = future.result()
+                new_flights += _restore_day(session, date_str, flights_map, crew_by_emp, crew_by_name)
+                session.commit()
+            except Exception as e:
+                print(f"Error restoring flights for {date_str}: {e}")
+                session.rollback()
+                # Crew created in the rolled-back day no longer exist; reload the lookups
+                crew_by_emp.clear()
+                crew_by_name.clear()
+                for crew_pk, name, employee_id in session.query(CrewMember.id, CrewMember.name, CrewMember.employee_id).all():
+                    if employee_id: crew_by_emp.setdefault(employee_id, crew_pk)
+                    if name: crew_by_name.setdefault(name, crew_pk)
+                failed = True
+                continue
+
+            done += 1
+            # The checkpoint only advances over an unbroken run of restored days
+            if not failed and not watermark:
+                set_metadata(session, RESTORE_CHECKPOINT_KEY, date_str)
+            if done % 25 == 0:
+                print(f"  Restored {done}/{len(dates)} days ({new_flights} new flights)...")
+
+    if not failed:
+        if not watermark:
+            set_metadata(session, RESTORE_CHECKPOINT_KEY, "")
+            set_metadata(session, RESTORE_STARTED_KEY, "")
+        # Everything stamped before this pull (or the restore it resumed) started is now local
+        set_metadata(session, PULL_WATERMARK_KEY, pull_started_at.isoformat() if pull_started_at else "")
+    if stats is not None:
+        stats["days"] = done
+    elapsed = time.perf_counter() - started
+    print(f"Restored {done} days ({new_flights} new flights) in {elapsed:.1f}s.")
+    return new_flights
+
+@cloud_metrics.measured("Cloud Pull")
+def pull_flight_updates(session):
+    """
+    Incremental Cloud -> Local refresh of flights only: reads just the day docs
+    changed since the previous pull. Cheap enough to run every few minutes.
+    """
+    print("Starting incremental Cloud -> Local flight pull...")
+    pull_stats = {}
+    count = restore_flights_from_cloud(session, incremental=True, stats=pull_stats)
+    # Updated days may have changed anyone's roster; cached months rebuild lazily
+    if pull_stats.get("days"):
+        from roster_engine import clear_roster_cache
+        clear_roster_cache(session)
+    return count
+
+@cloud_metrics.measured("Cloud Restore")
 def sync_down_from_cloud(session):
     """
     Restores/Hydrates the local database from Firestore.
     """
     # Import inside function to avoid circular dependency
-    from firestore_lib import download_daily_flights, download_pairings, download_ioe, download_metadata
-    from database import Flight, ScheduledFlight, IOEAssignment, AppMetadata, CrewMember, flight_crew_association
-    import datetime
+    from firestore_lib import download_pairings, download_ioe, download_metadata
+    from database import ScheduledFlight, IOEAssignment, AppMetadata
 
     print("Starting Cloud -> Local Sync...")
     stats = {"flights": 0, "pairings": 0, "ioe": 0, "metadata": 0}
 
     # 1. METADATA
     for key, val_dict in download_metadata():
+        if key in LOCAL_METADATA_KEYS:
+            continue
         if "value" in val_dict:
             # Upsert
             existing = session.query(AppMetadata).filter_by(key=key).first()
@@ -737,111 +1104,12 @@ def sync_down_from_cloud(session):
     print("Pairings synced.")
 
     # 4. FLIGHTS
-    for doc_id, bundle in download_daily_flights():
-        try:
-            flights_map = bundle.get("flights", {})
-            for unique_key, f_data in flights_map.items():
-                f_num = f_data.get("flight_number")
-                f_date = f_data.get("date")
-                f_dep_apt = f_data.get("departure_airport")
-                f_arr_apt = f_data.get("arrival_airport")
-                
-                # Match by Number + Date + Departure + Arrival (for duplicates)
-                existing_f = session.query(Flight).filter_by(
-                    flight_number=f_num, 
-                    date=f_date,
-                    departure_airport=f_dep_apt,
-                    arrival_airport=f_arr_apt
-                ).first()
-                crew_list = f_data.get("crew", [])
-                
-                if existing_f:
-                    existing_f.tail_number = f_data.get("tail_number")
-                    existing_f.status = f_data.get("status")
-                    existing_f.actual_departure = f_data.get("actual_departure")
-                    existing_f.actual_arrival = f_data.get("actual_arrival")
-                    existing_f.departure_airport = f_data.get("departure_airport")
-                    existing_f.arrival_airport = f_data.get("arrival_airport")
-                else:
-                    new_f = Flight(
-                        flight_number=f_num,
-                        date=f_date,
-                        tail_number=f_data.get("tail_number"),
-                        scheduled_departure=f_data.get("scheduled_departure"),
-                        scheduled_arrival=f_data.get("scheduled_arrival"),
-                        actual_departure=f_data.get("actual_departure"),
-                        actual_arrival=f_data.get("actual_arrival"),
-                        departure_airport=f_data.get("departure_airport"),
-                        arrival_airport=f_data.get("arrival_airport"),
-                        status=f_data.get("status"),
-                        aircraft_type=f_data.get("aircraft_type"),
-                        pax_data=f_data.get("pax_data"),
-                        load_data=f_data.get("load_data"),
-                        notes_data=f_data.get("notes_data")
-                    )
-                    session.add(new_f)
-                    session.flush()
-                    existing_f = new_f
-                    stats["flights"] += 1
-
-                # Sync Crew
-                if existing_f.id:
-                    session.execute(flight_crew_association.delete().where(
-                        flight_crew_association.c.flight_id == existing_f.id
-                    ))
-                    
-                    for c_dict in crew_list:
-                        c_name = c_dict.get("name")
-                        c_id = c_dict.get("id")
-                        if not c_name: continue
-                        
-                        crew_rec = session.query(CrewMember).filter_by(employee_id=c_id).first()
-                        if not crew_rec and c_name:
-                             crew_rec = session.query(CrewMember).filter_by(name=c_name).first()
-                        
-                        if not crew_rec:
-                            crew_rec = CrewMember(name=c_name, employee_id=c_id)
-                            session.add(crew_rec)
-                            session.flush()
-                        
-                        ins = flight_crew_association.insert().values(
-                            flight_id=existing_f.id,
-                            crew_id=crew_rec.id,
-                            role=c_dict.get("role", "Unknown"),
-                            flags=c_dict.get("flags", "")
-                        )
-                        session.execute(ins)
-
-                    # Sync History
-                    history_list = f_data.get("history", [])
-                    if history_list and existing_f.id:
-                        from database import FlightHistory
-                        # Get existing timestamps to prevent duplicates
-                        existing_timestamps = set(
-                            [h.timestamp.strftime('%Y-%m-%d %H:%M:%S') for h in 
-                             session.query(FlightHistory).filter_by(flight_id=existing_f.id).all()]
-                        )
-                        
-                        for h_data in history_list:
-                            ts_str = h_data.get("timestamp")
-                            if ts_str not in existing_timestamps:
-                                try:
-                                    ts = datetime.datetime.strptime(ts_str, '%Y-%m-%d %H:%M:%S')
-                                    new_h = FlightHistory(
-                                        flight_id=existing_f.id,
-                                        timestamp=ts,
-                                        changes_json=h_data.get("changes_json"),
-                                        description=h_data.get("description")
-                                    )
-                                    session.add(new_h)
-                                except Exception as e:
-                                    print(f"Error restoring history record: {e}")
-
-        except Exception as e:
-            print(f"Error restoring flights for {doc_id}: {e}")
-    
-    session.commit()
+    stats["flights"] = restore_flights_from_cloud(session)
     print("Flights synced.")
+
+    # Restored flights bypass the scraper's incremental roster refresh; rebuild lazily
+    from roster_engine import clear_roster_cache
+    clear_roster_cache(session)
     return stats
 
 if __name__ == "__main__":
@@ -861,7 +1129,7 @@ if __name__ == "__main__":
     session.commit()
     
     # 2. Ingest
-    ingest_all(session)
+    ingested_months = ingest_all(session)
     
     # 3. Check Cloud Sync
     # Check DB preference first (like app.py)
@@ -897,7 +1165,7 @@ if __name__ == "__main__":
         
         try:
             print("  - Uploading Pairings...")
-            p_count = upload_pairings_to_cloud(session)
+            p_count = upload_pairings_to_cloud(session, months=ingested_months)
             print(f"    Uploaded {p_count} pairing bundles.")
             
             print("  - Uploading IOE Assignments...")
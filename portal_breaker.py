@@ -0,0 +1,200 @@
+"""
+Circuit breaker for the NOC portal.
+
+During a portal outage every scheduled cycle used to open a full browser
+session, time out on each date and try again on the next cycle. The breaker
+counts consecutive failures (failed dates, failed logins, browser errors) and
+consecutive timeouts. Once either reaches its threshold the circuit opens:
+sweeps stop at the next date and nothing touches the portal until the
+backoff has passed. The backoff doubles on each trip (with jitter so several
+schedulers do not retry in lockstep), up to MAX_BACKOFF.
+
+When the backoff is over, a single plain HTTP request to Station Ops (no
+browser, no login) probes the portal. If it answers, the circuit goes
+half-open and the next sweep runs; its first date closes the circuit, or
+re-opens it with the next, longer backoff.
+
+Failures that belong to one date rather than the portal (the scraper raises
+ValueError when the page answered with the wrong station) are not counted;
+the planner backs those station-dates off on their own.
+
+State is kept in memory for this process and mirrored to AppMetadata so the
+Sync tab can show it even when the scraper runs in another process.
+"""
+import json
+import random
+import threading
+import urllib.request
+import urllib.error
+from datetime import datetime, timedelta
+from config import STATION_OPS_URL
+from database import get_session, set_metadata
+
+STATUS_KEY = "portal_breaker_status"
+FAILURE_THRESHOLD = 3
+# Timeouts are the usual outage signature and each one costs a full navigation timeout
+TIMEOUT_THRESHOLD = 2
+BASE_BACKOFF = timedelta(minutes=2)
+MAX_BACKOFF = timedelta(hours=2)
+JITTER = 0.25 # Backoff is scaled by a random factor in [1 - JITTER, 1 + JITTER]
+PROBE_TIMEOUT_SECONDS = 15
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+def backoff_delay(trips, rng=random):
+    """Delay before probing again after the circuit opened for the `trips`-th time in a row."""
+    delay = min(MAX_BACKOFF, BASE_BACKOFF * (2 ** max(0, trips - 1)))
+    return delay * rng.uniform(1 - JITTER, 1 + JITTER)
+
+def is_timeout(error):
+    """Playwright's TimeoutError, socket timeouts, and error text mentioning a timeout."""
+    if error is None:
+        return False
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return True
+    return "timeout" in str(error).lower() or "timed out" in str(error).lower()
+
+def is_portal_failure(error):
+    """False for date-specific errors the portal answered with (ValueError from the scraper)."""
+    return not isinstance(error, ValueError)
+
+def probe_portal(url=STATION_OPS_URL, timeout=PROBE_TIMEOUT_SECONDS):
+    """
+    One GET without cookies. Unauthenticated requests end on the login page,
+    so any non-5xx answer means the portal is up. Returns (ok, error).
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read(1024)
+        return True, None
+    except urllib.error.HTTPError as e:
+        if e.code < 500:
+            return True, None
+        return False, e
+    except Exception as e:
+        return False, e
+
+class PortalBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, timeout_threshold=TIMEOUT_THRESHOLD, probe=probe_portal):
+        self.lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.timeout_threshold = timeout_threshold
+        self.probe = probe
+        self.state = CLOSED
+        self.failures = 0 # Consecutive
+        self.timeouts = 0 # Consecutive
+        self.trips = 0 # Consecutive openings without a success in between
+        self.open_until = None
+        self.last_error = None
+        self.stats = {"total_failures": 0, "total_timeouts": 0, "total_trips": 0, "probes": 0, "failed_probes": 0}
+
+    def is_open(self):
+        with self.lock:
+            return self.state == OPEN
+
+    def retry_at(self):
+        """When the next probe is allowed, or None while the circuit is not open."""
+        with self.lock:
+            return self.open_until if self.state == OPEN else None
+
+    def allow_sweep(self, force_probe=False):
+        """
+        True when a sweep may touch the portal. An open circuit whose backoff has
+        passed (or any open circuit with force_probe, e.g. scrape-now) is probed first.
+        """
+        with self.lock:
+            if self.state != OPEN:
+                return True
+            if not force_probe and datetime.now() < self.open_until:
+                return False
+
+        ok, error = self.probe()
+        with self.lock:
+            self.stats["probes"] += 1
+            if ok:
+                self.state = HALF_OPEN
+                print("[Portal Breaker] Probe succeeded; circuit half-open, allowing one trial sweep.")
+            else:
+                self.stats["failed_probes"] += 1
+                self._trip(error)
+        self._persist()
+        return ok
+
+    def record(self, ok, error=None):
+        if ok:
+            self.record_success()
+        elif is_portal_failure(error):
+            self.record_failure(error)
+
+    def record_success(self):
+        with self.lock:
+            changed = self.state != CLOSED or self.failures
+            if self.state != CLOSED:
+                print("[Portal Breaker] Portal responding again; circuit closed.")
+            self.state = CLOSED
+            self.failures = 0
+            self.timeouts = 0
+            self.trips = 0
+            self.open_until = None
+        if changed:
+            self._persist()
+
+    def record_failure(self, error=None):
+        timed_out = is_timeout(error)
+        with self.lock:
+            self.failures += 1
+            self.timeouts = self.timeouts + 1 if timed_out else 0
+            self.stats["total_failures"] += 1
+            self.stats["total_timeouts"] += 1 if timed_out else 0
+            self.last_error = str(error)[:300] if error else "Scrape failed"
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold or self.timeouts >= self.timeout_threshold:
+                self._trip(error)
+        self._persist()
+
+    def reset(self):
+        """Closes the circuit by hand (Sync tab)."""
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.timeouts = 0
+            self.trips = 0
+            self.open_until = None
+        self._persist()
+
+    def _trip(self, error):
+        # Called with the lock held
+        self.trips += 1
+        self.stats["total_trips"] += 1
+        self.state = OPEN
+        self.open_until = datetime.now() + backoff_delay(self.trips)
+        if error:
+            self.last_error = str(error)[:300]
+        print(f"[Portal Breaker] Circuit open after {self.failures} consecutive failures ({self.timeouts} timeouts); "
+              f"next probe at {self.open_until.strftime('%H:%M:%S')}. Last error: {self.last_error}")
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "trips": self.trips,
+                "open_until": self.open_until.strftime('%Y-%m-%d %H:%M:%S') if self.open_until else None,
+                "last_error": self.last_error,
+                "updated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                **self.stats
+            }
+
+    def _persist(self):
+        session = get_session()
+        try:
+            set_metadata(session, STATUS_KEY, json.dumps(self.get_status()))
+        except Exception as e:
+            print(f"[Portal Breaker] Could not persist status: {e}")
+        finally:
+            session.close()
+
+# Global singleton
+portal_breaker = PortalBreaker()
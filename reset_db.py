@@ -1,7 +1,7 @@
 import os
 from database import init_db, Base
 from config import DB_NAME
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from config import DB_URL
 
 # Force reset
@@ -10,8 +10,14 @@ print(f"Connecting to {DB_URL}...")
 
 # Drop all tables to reset schema
 Base.metadata.drop_all(engine)
+if engine.dialect.name == "sqlite":
+    # Full-text index isn't part of the ORM metadata
+    with engine.connect() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS flight_text_fts"))
+        conn.commit()
 print("Dropped all tables.")
 
-# Recreate all tables
+# Recreate all tables (and indexes / full-text triggers)
 Base.metadata.create_all(engine)
+init_db()
 print("Database initialized with new schema.")
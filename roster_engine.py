@@ -0,0 +1,253 @@
+"""
+Roster engine: precomputes per-employee monthly roster summaries (daily legs,
+block totals, removals, cancellations) into the roster_cache table.
+
+Months are built on first view and afterwards only the employee-days touched
+by a scrape are recomputed and patched into the cached month.
+"""
+import json
+import calendar
+from collections import defaultdict
+from datetime import datetime, timedelta
+from database import Flight, FlightHistory, CrewMember, RosterCache, flight_crew_association
+
+def _month_bounds(year, month):
+    start = datetime(year, month, 1)
+    _, num_days = calendar.monthrange(year, month)
+    return start, start + timedelta(days=num_days)
+
+def _serialize_leg(f):
+    return {
+        "id": f.id,
+        "flight_number": f.flight_number,
+        "date": f.date.strftime('%Y-%m-%d'),
+        "departure_airport": f.departure_airport,
+        "arrival_airport": f.arrival_airport,
+        "actual_out": f.actual_out.strftime("%H:%M") if f.actual_out else None,
+        "actual_in": f.actual_in.strftime("%H:%M") if f.actual_in else None,
+        "planned_block_minutes": f.planned_block_minutes,
+        "actual_block_minutes": f.actual_block_minutes,
+        "tail_number": f.tail_number,
+        "status": f.status
+    }
+
+def _removed_employee_ids(changes_json):
+    """Returns the employee ids this history entry dropped off the crew list."""
+    try:
+        changes = json.loads(changes_json)
+    except:
+        return set()
+    crew_change = changes.get("Crew") if isinstance(changes, dict) else None
+    if not crew_change:
+        return set()
+    old_ids = {str(c.get("id")) for c in crew_change.get("old", [])}
+    new_ids = {str(c.get("id")) for c in crew_change.get("new", [])}
+    return old_ids - new_ids
+
+def _assemble_days(flights, removal_candidates):
+    """
+    flights: Flight rows currently assigned to the employee.
+    removal_candidates: Flight rows (in history order) the employee was dropped from.
+    """
+    days = {}
+    active_ids = set()
+    for f in flights:
+        entry = days.setdefault(f.date.day, {"legs": [], "removed": [], "canceled": []})
+        if f.status == "Canceled":
+            entry["canceled"].append(_serialize_leg(f))
+        else:
+            entry["legs"].append(_serialize_leg(f))
+            active_ids.add(f.id)
+
+    # Removals only count for flights the employee is no longer active on
+    removed_ids = set()
+    for f in removal_candidates:
+        if f.id in active_ids or f.id in removed_ids:
+            continue
+        removed_ids.add(f.id)
+        days.setdefault(f.date.day, {"legs": [], "removed": [], "canceled": []})["removed"].append(_serialize_leg(f))
+
+    return days
+
+def _build_days(session, crew_id, employee_id, start, end):
+    """Computes {day_of_month: {"legs", "removed", "canceled"}} for flights in [start, end)."""
+    flights = session.query(Flight).join(flight_crew_association).filter(
+        flight_crew_association.c.crew_id == crew_id,
+        Flight.date >= start,
+        Flight.date < end
+    ).order_by(Flight.date, Flight.scheduled_departure, Flight.id).all()
+
+    removal_candidates = []
+    if employee_id:
+        # The LIKE pre-filter keeps json.loads off rows that can't possibly match
+        history_rows = session.query(FlightHistory.changes_json, Flight)\
+            .join(Flight, Flight.id == FlightHistory.flight_id)\
+            .filter(
+                Flight.date >= start,
+                Flight.date < end,
+                FlightHistory.changes_json.like(f"%{employee_id}%")
+            ).order_by(FlightHistory.timestamp).all()
+        removal_candidates = [f for changes_json, f in history_rows if str(employee_id) in _removed_employee_ids(changes_json)]
+
+    return _assemble_days(flights, removal_candidates)
+
+def _store_days(rec, days):
+    rec.days_json = json.dumps({str(k): v for k, v in days.items()})
+    rec.leg_count = sum(len(d["legs"]) for d in days.values())
+    rec.scheduled_block_minutes = sum((l["planned_block_minutes"] or 0) for d in days.values() for l in d["legs"])
+    rec.actual_block_minutes = sum((l["actual_block_minutes"] or 0) for d in days.values() for l in d["legs"])
+    rec.removed_count = sum(len(d["removed"]) for d in days.values())
+    rec.canceled_count = sum(len(d["canceled"]) for d in days.values())
+    rec.updated_at = datetime.now()
+
+def load_days(rec):
+    """Returns the cached days map keyed by integer day-of-month."""
+    if not rec or not rec.days_json:
+        return {}
+    return {int(k): v for k, v in json.loads(rec.days_json).items()}
+
+def build_month_roster(session, crew, year, month):
+    """(Re)builds the full cached roster for one employee-month."""
+    start, end = _month_bounds(year, month)
+    days = _build_days(session, crew.id, crew.employee_id, start, end)
+
+    rec = session.query(RosterCache).filter_by(crew_id=crew.id, year=year, month=month).first()
+    if not rec:
+        rec = RosterCache(crew_id=crew.id, year=year, month=month)
+        session.add(rec)
+    _store_days(rec, days)
+    session.commit()
+    return rec
+
+def build_month_rosters_bulk(session, crews, year, month, chunk_size=500):
+    """
+    Builds cached rosters for many employees with one flight query and one history
+    scan per chunk instead of two queries per employee. Returns {crew_id: RosterCache}.
+    """
+    start, end = _month_bounds(year, month)
+    crews = [c for c in crews if c]
+    results = {}
+    if not crews:
+        return results
+
+    # Every crew removal in the month, parsed once and indexed by employee id
+    removals_by_emp = defaultdict(list)
+    history_rows = session.query(FlightHistory.changes_json, Flight)\
+        .join(Flight, Flight.id == FlightHistory.flight_id)\
+        .filter(
+            Flight.date >= start,
+            Flight.date < end,
+            FlightHistory.changes_json.like('%"Crew"%')
+        ).order_by(FlightHistory.timestamp).all()
+    for changes_json, f in history_rows:
+        for emp_id in _removed_employee_ids(changes_json):
+            removals_by_emp[emp_id].append(f)
+
+    for i in range(0, len(crews), chunk_size):
+        chunk = crews[i:i + chunk_size]
+        chunk_ids = [c.id for c in chunk]
+
+        flights_by_crew = defaultdict(list)
+        rows = session.query(flight_crew_association.c.crew_id, Flight)\
+            .join(Flight, Flight.id == flight_crew_association.c.flight_id)\
+            .filter(
+                flight_crew_association.c.crew_id.in_(chunk_ids),
+                Flight.date >= start,
+                Flight.date < end
+            ).order_by(Flight.date, Flight.scheduled_departure, Flight.id).all()
+        for crew_id, f in rows:
+            flights_by_crew[crew_id].append(f)
+
+        cached = {
+            r.crew_id: r for r in session.query(RosterCache).filter(
+                RosterCache.crew_id.in_(chunk_ids),
+                RosterCache.year == year,
+                RosterCache.month == month
+            ).all()
+        }
+        for c in chunk:
+            candidates = removals_by_emp.get(str(c.employee_id), []) if c.employee_id else []
+            days = _assemble_days(flights_by_crew.get(c.id, []), candidates)
+            rec = cached.get(c.id)
+            if not rec:
+                rec = RosterCache(crew_id=c.id, year=year, month=month)
+                session.add(rec)
+            _store_days(rec, days)
+            results[c.id] = rec
+
+    session.commit()
+    return results
+
+def get_month_rosters(session, crews, year, month):
+    """Returns {crew_id: RosterCache} for many employees, bulk-building any that aren't cached yet."""
+    crew_ids = [c.id for c in crews]
+    results = {}
+    for i in range(0, len(crew_ids), 500):
+        for r in session.query(RosterCache).filter(
+            RosterCache.crew_id.in_(crew_ids[i:i + 500]),
+            RosterCache.year == year,
+            RosterCache.month == month
+        ).all():
+            results[r.crew_id] = r
+
+    missing = [c for c in crews if c.id not in results]
+    if missing:
+        results.update(build_month_rosters_bulk(session, missing, year, month))
+    return results
+
+def get_month_roster(session, crew, year, month):
+    """Returns the cached roster for an employee-month, building it on first access."""
+    rec = session.query(RosterCache).filter_by(crew_id=crew.id, year=year, month=month).first()
+    if rec is None:
+        rec = build_month_roster(session, crew, year, month)
+    return rec
+
+def refresh_roster_days(session, crew_days):
+    """
+    Recomputes only the given employee-days.
+    crew_days: iterable of (crew_id, date) pairs touched by a scrape.
+
+    Months that were never cached are skipped; they are built lazily on first view.
+    """
+    by_month = defaultdict(set)
+    for crew_id, d in crew_days:
+        if crew_id and d:
+            by_month[(crew_id, d.year, d.month)].add(d.day)
+    if not by_month:
+        return 0
+
+    crew_ids = {k[0] for k in by_month}
+    cached = {
+        (r.crew_id, r.year, r.month): r
+        for r in session.query(RosterCache).filter(RosterCache.crew_id.in_(crew_ids)).all()
+    }
+    crew_map = {c.id: c for c in session.query(CrewMember).filter(CrewMember.id.in_(crew_ids)).all()}
+
+    refreshed_days = 0
+    for (crew_id, year, month), day_set in by_month.items():
+        rec = cached.get((crew_id, year, month))
+        crew = crew_map.get(crew_id)
+        if not rec or not crew:
+            continue
+
+        days = load_days(rec)
+        for day in day_set:
+            day_start = datetime(year, month, day)
+            fresh = _build_days(session, crew_id, crew.employee_id, day_start, day_start + timedelta(days=1))
+            if day in fresh:
+                days[day] = fresh[day]
+            else:
+                days.pop(day, None)
+            refreshed_days += 1
+        _store_days(rec, days)
+
+    session.commit()
+    if refreshed_days:
+        print(f"[Roster Cache] Refreshed {refreshed_days} cached employee-days.")
+    return refreshed_days
+
+def clear_roster_cache(session):
+    """Drops every cached month; rosters are rebuilt lazily on next view."""
+    count = session.query(RosterCache).delete()
+    session.commit()
+    return count
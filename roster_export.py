@@ -0,0 +1,209 @@
+"""
+Roster PDF rendering and batch export.
+
+Single rosters are rendered on demand by the Roster tab; batch exports fetch
+every roster in bulk through the roster cache and render the PDFs in a
+process pool, bundling them into a zip.
+"""
+import io
+import os
+import time
+import zipfile
+import calendar
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fpdf import FPDF
+from database import Flight, CrewMember, flight_crew_association
+from roster_engine import get_month_rosters, load_days, _month_bounds
+
+def generate_roster_pdf(crew_name, employee_id, month_name, year, days_map, num_days, fmt_block):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("helvetica", 'B', 16)
+    
+    # Header
+    pdf.cell(0, 10, f"Flight Roster: {crew_name} ({employee_id})", ln=True, align='C')
+    pdf.set_font("helvetica", '', 12)
+    pdf.cell(0, 10, f"Period: {month_name} {year}", ln=True, align='C')
+    pdf.ln(5)
+    
+    # Table Header
+    pdf.set_fill_color(200, 220, 255)
+    pdf.set_font("helvetica", 'B', 8)
+    # Adjusted widths to fit 190mm (A4 is 210mm - 20mm margins)
+    cols = [("Day", 18), ("Flight", 18), ("Route", 28), ("Out", 18), ("In", 18), ("Schd Blk", 25), ("Act Blk", 25), ("Tail", 30)]
+    for col_name, width in cols:
+        pdf.cell(width, 10, col_name, 1, 0, 'C', True)
+    pdf.ln()
+    
+    # Data Rows
+    pdf.set_font("helvetica", '', 8)
+    total_act = 0
+    total_sch = 0
+    
+    fill = False
+    for day in range(1, num_days + 1):
+        # Calculate weekday
+        day_date = date(year, list(calendar.month_name).index(month_name), day)
+        weekday = day_date.strftime("%a")
+        day_active = days_map.get(day, [])
+        
+        if not day_active:
+            # Empty day row
+            pdf.set_fill_color(245, 245, 245) if fill else pdf.set_fill_color(255, 255, 255)
+            pdf.set_text_color(150, 150, 150)
+            pdf.cell(18, 8, f"{weekday} {day}", 1, 0, 'C', True)
+            pdf.cell(172, 8, "No active flights", 1, 1, 'L', True)
+            pdf.set_text_color(0, 0, 0)
+            fill = not fill
+            continue
+            
+        def clean_apt(apt_str):
+            if not apt_str: return "??"
+            return str(apt_str).split(' - ')[0]
+
+        for i, f in enumerate(day_active):
+            pdf.set_fill_color(245, 245, 245) if fill else pdf.set_fill_color(255, 255, 255)
+            
+            day_str = f"{weekday} {day}" if i == 0 else ""
+            f_num = f["flight_number"][2:] if f["flight_number"].startswith("C5") else f["flight_number"]
+            
+            pdf.cell(18, 8, day_str, 1, 0, 'C', True)
+            pdf.cell(18, 8, f_num, 1, 0, 'C', True)
+            route_str = f"{clean_apt(f['departure_airport'])}-{clean_apt(f['arrival_airport'])}"
+            pdf.cell(28, 8, route_str, 1, 0, 'C', True)
+            pdf.cell(18, 8, f["actual_out"] or "--", 1, 0, 'C', True)
+            pdf.cell(18, 8, f["actual_in"] or "--", 1, 0, 'C', True)
+            pdf.cell(25, 8, fmt_block(f["planned_block_minutes"]), 1, 0, 'C', True)
+            pdf.cell(25, 8, fmt_block(f["actual_block_minutes"]), 1, 0, 'C', True)
+            pdf.cell(30, 8, f["tail_number"] or "--", 1, 1, 'C', True)
+            
+            total_act += (f["actual_block_minutes"] or 0)
+            total_sch += (f["planned_block_minutes"] or 0)
+        
+        fill = not fill
+
+    # Totals Section
+    pdf.ln(5)
+    pdf.set_font("helvetica", 'B', 8)
+    pdf.set_text_color(100, 100, 100)
+    pdf.cell(118, 5, "", 0, 0)
+    pdf.cell(25, 5, "Total Sch", 0, 0, 'C')
+    pdf.cell(25, 5, "Total Act", 0, 1, 'C')
+    
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("helvetica", 'B', 10)
+    pdf.cell(118, 10, "MONTHLY SUMMARY", 0, 0, 'R')
+    pdf.cell(25, 10, fmt_block(total_sch), 1, 0, 'C')
+    pdf.cell(25, 10, fmt_block(total_act), 1, 1, 'C')
+    
+    return bytes(pdf.output())
+
+def fmt_block(mins):
+    if mins is None: return "0:00"
+    h = abs(mins) // 60
+    m = abs(mins) % 60
+    return f"{h}:{m:02d}"
+
+
+def _render_roster_job(job):
+    """Process-pool worker: renders one roster PDF and reports how long it took."""
+    t0 = time.perf_counter()
+    pdf_bytes = generate_roster_pdf(job["crew_name"], job["employee_id"], job["month_name"], job["year"], job["days_map"], job["num_days"], fmt_block)
+    return job["file_name"], pdf_bytes, time.perf_counter() - t0
+
+def crews_for_base(session, base, year, month):
+    """
+    Returns every crew member on a flight touching `base` during calendar month
+    (year, month), the same period the exported rosters render.
+    """
+    start_dt, end_dt = _month_bounds(year, month)
+    return session.query(CrewMember).join(
+        flight_crew_association, CrewMember.id == flight_crew_association.c.crew_id
+    ).join(
+        Flight, Flight.id == flight_crew_association.c.flight_id
+    ).filter(
+        Flight.date >= start_dt,
+        Flight.date < end_dt,
+        Flight.departure_airport.like(f"{base}%")
+    ).distinct().order_by(CrewMember.name).all()
+
+def crews_for_employee_ids(session, employee_ids):
+    ids = [str(e).strip() for e in employee_ids if str(e).strip()]
+    crews = []
+    for i in range(0, len(ids), 500):
+        crews += session.query(CrewMember).filter(CrewMember.employee_id.in_(ids[i:i + 500])).all()
+    return sorted(crews, key=lambda c: c.name or "")
+
+def export_roster_batch(session, crews, year, month, output_path=None, max_workers=None, progress_callback=None):
+    """
+    Renders rosters for `crews` for calendar month (year, month) into a zip.
+
+    output_path: write the zip there; otherwise the zip bytes are returned.
+    progress_callback: called as progress_callback(done, total, file_name).
+
+    Returns (zip_bytes_or_path, timings) where timings is a list of per-PDF dicts.
+    The roster fetch is one bulk query, so fetch_avg_s is its time split evenly across PDFs.
+    """
+    month_name = calendar.month_name[month]
+    _, num_days = calendar.monthrange(year, month)
+
+    # 1. Bulk fetch: cached rosters for everyone, building missing months in one pass
+    t_fetch = time.perf_counter()
+    rosters = get_month_rosters(session, crews, year, month)
+    fetch_secs = time.perf_counter() - t_fetch
+
+    jobs = []
+    for c in crews:
+        days = load_days(rosters.get(c.id))
+        jobs.append({
+            "crew_name": c.name,
+            "employee_id": c.employee_id,
+            "month_name": month_name,
+            "year": year,
+            "num_days": num_days,
+            "days_map": {day: d["legs"] for day, d in days.items() if d["legs"]},
+            # Crew without an employee id fall back to their row id so zip entries stay unique
+            "file_name": f"Roster_{c.employee_id or f'crew{c.id}'}_{month_name}_{year}.pdf",
+            "legs": sum(len(d["legs"]) for d in days.values())
+        })
+    print(f"[Roster Export] Loaded {len(jobs)} rosters for {month_name} {year} in {fetch_secs:.2f}s.")
+
+    # 2. Render in a process pool and stream into the zip as each PDF finishes
+    buffer = output_path or io.BytesIO()
+    timings = []
+    per_job_fetch = fetch_secs / len(jobs) if jobs else 0
+    legs_by_file = {j["file_name"]: j["legs"] for j in jobs}
+    t_total = time.perf_counter()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            futures = [pool.submit(_render_roster_job, job) for job in jobs]
+            for done, fut in enumerate(as_completed(futures), 1):
+                try:
+                    file_name, pdf_bytes, render_secs = fut.result()
+                except Exception as e:
+                    print(f"[Roster Export] Error rendering roster: {e}")
+                    # Keep the progress bar moving past failed renders
+                    if progress_callback:
+                        progress_callback(done, len(jobs), "render failed")
+                    continue
+                t_zip = time.perf_counter()
+                zf.writestr(file_name, pdf_bytes)
+                timings.append({
+                    "file": file_name,
+                    "legs": legs_by_file.get(file_name, 0),
+                    "fetch_avg_s": round(per_job_fetch, 4),
+                    "render_s": round(render_secs, 4),
+                    "zip_s": round(time.perf_counter() - t_zip, 4),
+                    "kb": round(len(pdf_bytes) / 1024, 1)
+                })
+                if progress_callback:
+                    progress_callback(done, len(jobs), file_name)
+
+    total_secs = time.perf_counter() - t_total
+    render_sum = sum(t["render_s"] for t in timings)
+    print(f"[Roster Export] Rendered {len(timings)}/{len(jobs)} PDFs in {total_secs:.2f}s wall ({render_sum:.2f}s render CPU).")
+
+    if output_path:
+        return output_path, timings
+    return buffer.getvalue(), timings
@@ -1,9 +1,13 @@
-import time
 import os
 from datetime import datetime, timedelta
-from scraper import NOCScraper
-from config import NOC_USERNAME, NOC_PASSWORD, SCRAPE_INTERVAL_HOURS, STATION_OPS_URL, SESSION_STATE_PATH
+from browser_service import BrowserService
+from scraper import get_scrape_stations, scrape_targets
+from config import NOC_USERNAME, NOC_PASSWORD, SCRAPE_INTERVAL_HOURS, SESSION_STATE_PATH
 from database import init_db, get_session, get_metadata
+from scheduler_worker import wait_until, consume_scrape_now, RETRY_DELAY
+from scrape_lock import ScrapeLock
+from scrape_telemetry import ScrapeRunRecorder
+from portal_breaker import portal_breaker
 
 def run_scheduled_scrape():
     print("Initializing Database...")
@@ -13,71 +17,118 @@ def run_scheduled_scrape():
     auth_mode = get_metadata(session, "auth_mode", "legacy")
     session.close()
     
-    scraper = NOCScraper(headless=True)
+    # Keeps Chromium warm between sweeps, recycling the context and relaunching when unhealthy
+    browser = BrowserService(headless=True)
     
     try:
-        scraper.start(auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH)
         print(f"Attempting initial login using {auth_mode.upper()} mode...")
-        if not scraper.login(NOC_USERNAME, NOC_PASSWORD, auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH):
+        if not browser.get_scraper(auth_mode, NOC_USERNAME, NOC_PASSWORD, SESSION_STATE_PATH):
             print("Failed to login. Please check your credentials/session in Settings.")
             return
+        browser.release()
 
+        scrape_now = False
         while True:
             # Refresh interval and auth mode from metadata in case it changed in DB
             session = get_session()
             db_interval = get_metadata(session, "scrape_interval_hours")
             current_interval = int(db_interval) if db_interval else SCRAPE_INTERVAL_HOURS
             auth_mode = get_metadata(session, "auth_mode", "legacy")
+            stations = get_scrape_stations(session)
             session.close()
 
+            # While the portal is down, wait out the backoff; a cheap probe decides when to resume
+            if not portal_breaker.allow_sweep(force_probe=scrape_now):
+                retry_at = portal_breaker.retry_at()
+                print(f"NOC portal circuit open. Next probe at {retry_at.strftime('%H:%M:%S')}.")
+                while datetime.now() < retry_at:
+                    wait_until(retry_at)
+                    session = get_session()
+                    scrape_now = consume_scrape_now(session)
+                    session.close()
+                    if scrape_now:
+                        print("Scrape-now requested; probing the portal early.")
+                        break
+                continue
+            scrape_now = False
+
             now = datetime.now()
+            sweep_started = now
             print(f"\n[{now.strftime('%H:%M:%S')}] Starting scheduled scrape sweep...")
             
             # Scrape range: Today and Tomorrow are most critical for crew changes
             today = now.replace(hour=0, minute=0, second=0, microsecond=0)
             tomorrow = today + timedelta(days=1)
             
-            try:
-                # Check if we are still logged in by visiting Station Ops
-                scraper.page.goto(STATION_OPS_URL)
-                scraper.page.wait_for_load_state("networkidle")
-                
-                # Check if we've been redirected to a login page
-                current_url = scraper.page.url
-                current_title = scraper.page.title()
-                if "StationOperations.aspx" not in current_url or "login" in current_url.lower() or "Login" in current_title or "Sign in" in current_title:
-                    print("Session expired. Re-logging...")
-                    if not scraper.login(NOC_USERNAME, NOC_PASSWORD, auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH):
-                        print("Re-login failed. Scrape sweep skipped.")
-                        # Wait for a bit before trying again
-                        time.sleep(300)
-                        continue
+            # Same cross-process lease as the app's background worker and manual syncs
+            scrape_lock = ScrapeLock("run_scheduler")
+            if not scrape_lock.acquire():
+                print("Another scrape holds the lock. Retrying in a minute...")
+                wait_until(None)
+                continue
 
-                scraper.scrape_date_range(today, tomorrow)
-                print(f"Sweep completed successfully.")
+            sweep_ok = False
+            sweep_error = None
+            telemetry = ScrapeRunRecorder("run_scheduler")
+            try:
+                # Health check, context recycling and (when due) the session check happen here
+                scraper = browser.get_scraper(auth_mode, NOC_USERNAME, NOC_PASSWORD, SESSION_STATE_PATH, telemetry=telemetry)
+                if not scraper:
+                    print("Re-login failed. Scrape sweep skipped.")
+                    sweep_error = "Re-login failed"
+                    portal_breaker.record_failure(sweep_error)
+                else:
+                    for station, target_date in scrape_targets([today, tomorrow], stations):
+                        if scrape_lock.lost:
+                            print("Scrape lease lost to another process; stopping this sweep.")
+                            sweep_error = "Scrape lease lost"
+                            break
+                        if portal_breaker.is_open():
+                            print("NOC portal circuit open; skipping the rest of this sweep.")
+                            break
+                        print(f"Scraping data for {target_date.strftime('%Y-%m-%d')}{f' at {station}' if station else ''}...")
+                        ok = scraper.scrape_date(target_date, station)
+                        portal_breaker.record(ok, scraper.last_error)
+                    sweep_ok = not portal_breaker.is_open() and not scrape_lock.lost
+                    if sweep_ok:
+                        print(f"Sweep completed successfully.")
             except Exception as e:
+                # A dead browser ("Target closed", "context has been closed") is relaunched on the next sweep
                 print(f"Error during scrape sweep: {e}")
-                # Try to restart browser on next iteration if it's a "Target closed" error
-                if "Target closed" in str(e) or "context has been closed" in str(e):
-                    print("Browser context lost. Restarting scraper...")
-                    try: scraper.stop()
-                    except: pass
-                    scraper = NOCScraper(headless=True)
-                    scraper.start(auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH)
-                    scraper.login(NOC_USERNAME, NOC_PASSWORD, auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH)
+                sweep_error = e
+                portal_breaker.record_failure(e)
+            finally:
+                browser.release(healthy=sweep_ok)
+                scrape_lock.release()
+                telemetry.finish(error=sweep_error)
+
+            if portal_breaker.is_open():
+                # Backoff is handled at the top of the loop (lease already released)
+                continue
 
-            print(f"Waiting {current_interval} hour(s) for next run...")
-            # Sleep in 1-minute chunks to remain responsive to signals
-            for _ in range(current_interval * 60):
-                time.sleep(60)
+            # A failed sweep that did not open the circuit is retried sooner than the full interval
+            next_run = sweep_started + timedelta(hours=current_interval) if sweep_ok else datetime.now() + RETRY_DELAY
+            print(f"Waiting until {next_run.strftime('%H:%M:%S')} for next run...")
+            # Wake at the due time, or within a minute when the interval changes or a scrape-now is requested
+            while datetime.now() < next_run:
+                wait_until(next_run)
+                session = get_session()
+                db_interval = get_metadata(session, "scrape_interval_hours")
+                scrape_now = consume_scrape_now(session)
+                session.close()
+                if scrape_now:
+                    print("Scrape-now requested.")
+                    break
+                new_interval = int(db_interval) if db_interval else SCRAPE_INTERVAL_HOURS
+                if new_interval != current_interval:
+                    current_interval = new_interval
+                    next_run = sweep_started + timedelta(hours=current_interval)
+                    print(f"Interval changed to {current_interval}h; next run at {next_run.strftime('%H:%M:%S')}.")
             
     except KeyboardInterrupt:
         print("\nScheduler stopped by user.")
     finally:
-        try:
-            scraper.stop()
-        except:
-            pass
+        browser.shutdown()
 
 if __name__ == "__main__":
     init_db()
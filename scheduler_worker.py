@@ -1,21 +1,81 @@
 
-import time
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime
 from database import get_session, get_metadata, set_metadata
-from scraper import NOCScraper
+from browser_service import BrowserService
+from scraper import get_scrape_stations
+from scrape_scheduler import scrape_planner, RETRY_DELAY
+from scrape_lock import ScrapeLock
+from scrape_telemetry import ScrapeRunRecorder
+from portal_breaker import portal_breaker
 from config import SCRAPE_INTERVAL_HOURS, SCRAPE_DAYS, NOC_USERNAME, NOC_PASSWORD, SESSION_STATE_PATH
 import os
 from tools.backup_db import create_db_backup
 
+SCRAPE_NOW_KEY = "scrape_now_requested"
+# Longest the worker sleeps without re-reading config, so changes written by
+# other processes (run_scheduler.py, another app instance) still land within a minute
+MAX_IDLE_SECONDS = 60
+
+# Set from the UI thread on config changes or "scrape now" to cut a wait short
+scheduler_wake = threading.Event()
+
+def wake_scheduler():
+    """Wakes the in-process worker so it re-reads config and re-plans immediately."""
+    scheduler_wake.set()
+
+def request_scrape_now():
+    """Marks the whole forward window due now, for whichever scheduler process picks it up first."""
+    session = get_session()
+    set_metadata(session, SCRAPE_NOW_KEY, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    session.close()
+    wake_scheduler()
+
+def consume_scrape_now(session):
+    if not get_metadata(session, SCRAPE_NOW_KEY):
+        return False
+    set_metadata(session, SCRAPE_NOW_KEY, "")
+    return True
+
+def wait_until(deadline):
+    """
+    Sleeps until deadline (at most MAX_IDLE_SECONDS). Returns True when woken
+    early by wake_scheduler().
+    """
+    timeout = MAX_IDLE_SECONDS
+    if deadline:
+        timeout = min(timeout, max(0.0, (deadline - datetime.now()).total_seconds()))
+    woken = scheduler_wake.wait(timeout)
+    scheduler_wake.clear()
+    return woken
+
+def run_cloud_retention(session):
+    """Daily retention job: prunes cloud flight days older than the configured cloud_retention_days."""
+    days_str = get_metadata(session, "cloud_retention_days")
+    if not days_str or int(days_str) <= 0:
+        return
+    from firestore_lib import is_cloud_sync_enabled, prune_cloud_days_older_than
+    if not is_cloud_sync_enabled():
+        return
+    try:
+        pruned, deleted = prune_cloud_days_older_than(int(days_str))
+        if pruned:
+            print(f"[Background Scheduler] Cloud retention pruned {len(pruned)} days ({deleted} documents).")
+    except Exception as e:
+        print(f"[Background Scheduler] Cloud retention error: {e}")
+
 def background_worker():
     """
-    Background process that runs forever and scrapes data periodically.
+    Background process that runs forever and scrapes whichever dates the
+    priority planner says are due (see scrape_scheduler).
     """
     print("[Background Scheduler] Worker started.")
 
-    should_scrape = False
-    
+    # One warm browser for this thread, reused across cycles
+    browser = BrowserService(headless=True)
+    next_scrape_dt = None
+    retry_at = None
+    reported_idle_for = None
     while True:
         try:
             session = get_session()
@@ -23,101 +83,133 @@ def background_worker():
             # Fetch latest config from DB
             interval_str = get_metadata(session, "scrape_interval_hours")
             days_str = get_metadata(session, "scrape_days")
-            last_sync_str = get_metadata(session, "last_successful_sync")
             
             interval = int(interval_str) if interval_str else SCRAPE_INTERVAL_HOURS
             num_days = int(days_str) if days_str else SCRAPE_DAYS
+            stations = get_scrape_stations(session)
             
-            if not last_sync_str:
-                should_scrape = True
-                next_scrape_dt = datetime.now()
-            else:
-                last_sync_dt = datetime.strptime(last_sync_str, '%Y-%m-%d %H:%M:%S')
-                next_scrape_dt = last_sync_dt + timedelta(hours=interval)
-                if datetime.now() >= next_scrape_dt:
-                    should_scrape = True
+            # Per-date due times from proximity and recent change rate
+            scrape_now = consume_scrape_now(session)
+            if scrape_now:
+                print("[Background Scheduler] Scrape-now requested: refreshing the whole window.")
+            scrape_planner.refresh(session, interval, num_days, force=scrape_now, stations=stations)
+            due_targets = scrape_planner.pop_due()
+            if due_targets and retry_at and datetime.now() < retry_at and not scrape_now:
+                due_targets = []
+            # During a portal outage only a cheap probe runs, once the backoff has passed
+            if due_targets and not portal_breaker.allow_sweep(force_probe=scrape_now):
+                retry_at = portal_breaker.retry_at()
+                print(f"[Background Scheduler] NOC portal circuit open; {len(due_targets)} due station-dates wait until {retry_at.strftime('%H:%M:%S')}.")
+                due_targets = []
+            next_scrape_dt = datetime.now() if due_targets else (retry_at or scrape_planner.next_due())
             
             # Persist next scrape time for UI
-            set_metadata(session, "next_scheduled_scrape", next_scrape_dt.strftime('%Y-%m-%d %H:%M:%S'))
+            if next_scrape_dt:
+                set_metadata(session, "next_scheduled_scrape", next_scrape_dt.strftime('%Y-%m-%d %H:%M:%S'))
 
-            if should_scrape:
-                # 0. Safety Catch: check if another scrape is already active
-                if get_metadata(session, "is_scrape_in_progress") == "True":
+            if due_targets:
+                # 0. Safety Catch: take the cross-process scrape lease or skip this cycle
+                scrape_lock = ScrapeLock("background")
+                if not scrape_lock.acquire():
                     print("[Background Scheduler] Scrape requested but another sync is already in progress. Skipping cycle.")
+                    if scrape_now:
+                        set_metadata(session, SCRAPE_NOW_KEY, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
                     session.close()
-                    time.sleep(60) # Try again sooner
+                    next_scrape_dt = None # Try again within a minute
+                    wait_until(next_scrape_dt)
                     continue
 
-                print(f"[Background Scheduler] Starting scrape: Interval={interval}h, Days={num_days}")
-                set_metadata(session, "is_scrape_in_progress", "True")
-                print(f"[Background Scheduler] Next run calculated for: {next_scrape_dt.strftime('%Y-%m-%d %H:%M:%S')}")
+                try:
+                    retry_at = None
+
+                    station_label = ", ".join(s for s in stations if s) or "default station"
+                    print(f"[Background Scheduler] Starting scrape of {len(due_targets)} due station-dates ({station_label}): Base Interval={interval}h, Days={num_days}")
                 
-                auth_mode = get_metadata(session, "auth_mode", "legacy")
-                has_sso_session = auth_mode == "sso" and os.path.exists(SESSION_STATE_PATH)
-                has_legacy_credentials = auth_mode == "legacy" and NOC_USERNAME and NOC_PASSWORD
-                has_legacy_session = auth_mode == "legacy" and os.path.exists(SESSION_STATE_PATH)
+                    auth_mode = get_metadata(session, "auth_mode", "legacy")
+                    has_sso_session = auth_mode == "sso" and os.path.exists(SESSION_STATE_PATH)
+                    has_legacy_credentials = auth_mode == "legacy" and NOC_USERNAME and NOC_PASSWORD
+                    has_legacy_session = auth_mode == "legacy" and os.path.exists(SESSION_STATE_PATH)
                 
-                if has_sso_session or has_legacy_credentials or has_legacy_session:
-                    # 1. Create a safety backup before any sync
-                    print("[Background Scheduler] Creating safety backup...")
-                    create_db_backup()
+                    if has_sso_session or has_legacy_credentials or has_legacy_session:
+                        # 1. Create a safety backup before any sync
+                        print("[Background Scheduler] Creating safety backup...")
+                        create_db_backup()
                     
-                    scraper = NOCScraper(headless=True)
-                    try:
-                        scraper.start(auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH)
-                        if scraper.login(username=NOC_USERNAME, password=NOC_PASSWORD, auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH):
-                            # Clear last scrape error on successful login
-                            set_metadata(session, "last_scrape_error", "")
-                            
-                            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+                        cycle_ok = False
+                        cycle_error = None
+                        telemetry = ScrapeRunRecorder("background")
+                        try:
+                            scraper = browser.get_scraper(auth_mode, NOC_USERNAME, NOC_PASSWORD, SESSION_STATE_PATH, telemetry=telemetry)
+                            if scraper:
+                                # Clear last scrape error on successful login
+                                set_metadata(session, "last_scrape_error", "")
                             
-                            # Deep Sync Logic: once a day, look back 7 days
-                            last_deep = get_metadata(session, "last_deep_sync_date")
-                            current_date_str = today.strftime('%Y-%m-%d')
+                                today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
                             
-                            start_offset = 0
-                            if last_deep != current_date_str:
-                                print("[Background Scheduler] Daily Deep Sync triggered: Looking back 7 days...")
-                                start_offset = -7
-                                set_metadata(session, "last_deep_sync_date", current_date_str)
+                                # Past dates are part of the plan (refreshed daily); retention still runs once a day
+                                last_deep = get_metadata(session, "last_deep_sync_date")
+                                current_date_str = today.strftime('%Y-%m-%d')
+                                if last_deep != current_date_str:
+                                    set_metadata(session, "last_deep_sync_date", current_date_str)
+                                    run_cloud_retention(session)
 
-                            for i in range(start_offset, num_days):
-                                target_date = today + timedelta(days=i)
-                                print(f"[Background Scheduler] Scraping {target_date.strftime('%Y-%m-%d')}...")
-                                scraper.scrape_date(target_date)
+                                for i, (station, target_date) in enumerate(due_targets):
+                                    if scrape_lock.lost:
+                                        print("[Background Scheduler] Scrape lease lost to another process; stopping this run.")
+                                        break
+                                    if portal_breaker.is_open():
+                                        print(f"[Background Scheduler] NOC portal circuit open; skipping the remaining {len(due_targets) - i} station-dates.")
+                                        break
+                                    print(f"[Background Scheduler] Scraping {target_date.strftime('%Y-%m-%d')}{f' at {station}' if station else ''}...")
+                                    ok = scraper.scrape_date(target_date, station)
+                                    portal_breaker.record(ok, scraper.last_error)
+                                    # A failed pair backs off on its own instead of being due again next wake-up
+                                    scrape_planner.record_result(station, target_date, ok)
+                                cycle_ok = not portal_breaker.is_open()
+                                retry_at = portal_breaker.retry_at()
                             
-                            now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            set_metadata(session, "last_successful_sync", now_str)
+                                if cycle_ok:
+                                    now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                                    set_metadata(session, "last_successful_sync", now_str)
                             
-                            # Recalculate next scrape for log
-                            next_val = datetime.now() + timedelta(hours=interval)
-                            set_metadata(session, "next_scheduled_scrape", next_val.strftime('%Y-%m-%d %H:%M:%S'))
+                                # Recalculate next scrape for log
+                                scrape_planner.refresh(session, interval, num_days, stations=stations)
+                                next_val = retry_at or scrape_planner.next_due() or datetime.now()
+                                set_metadata(session, "next_scheduled_scrape", next_val.strftime('%Y-%m-%d %H:%M:%S'))
                             
-                            print(f"[Background Scheduler] Scrape complete. Next run at: {next_val.strftime('%H:%M:%S')}")
-                            should_scrape = False
-                        else:
-                            print("[Background Scheduler] Login failed.")
-                            if auth_mode == "sso":
-                                set_metadata(session, "last_scrape_error", "Microsoft SSO session has expired or is invalid. Please log in again in the Settings tab.")
+                                print(f"[Background Scheduler] Scrape complete. Next run at: {next_val.strftime('%H:%M:%S')}")
                             else:
-                                set_metadata(session, "last_scrape_error", "Legacy login failed. Please verify credentials in the Settings tab.")
-                            should_scrape = False
-                    except Exception as e:
-                        print(f"[Background Scheduler] Error during scrape: {e}")
-                        set_metadata(session, "last_scrape_error", f"Scrape error: {str(e)}")
-                    finally:
-                        should_scrape = False
-                        set_metadata(session, "is_scrape_in_progress", "False")
-                        scraper.stop()
-                else:
-                    if auth_mode == "sso":
-                        print("[Background Scheduler] Missing active SSO session. Please log in interactively first.")
-                        set_metadata(session, "last_scrape_error", "Missing Microsoft SSO session. Please log in once in the Settings tab.")
+                                print("[Background Scheduler] Login failed.")
+                                cycle_error = "Login failed"
+                                portal_breaker.record_failure(cycle_error)
+                                retry_at = portal_breaker.retry_at() or datetime.now() + RETRY_DELAY
+                                if auth_mode == "sso":
+                                    set_metadata(session, "last_scrape_error", "Microsoft SSO session has expired or is invalid. Please log in again in the Settings tab.")
+                                else:
+                                    set_metadata(session, "last_scrape_error", "Legacy login failed. Please verify credentials in the Settings tab.")
+                        except Exception as e:
+                            print(f"[Background Scheduler] Error during scrape: {e}")
+                            cycle_error = e
+                            portal_breaker.record_failure(e)
+                            retry_at = portal_breaker.retry_at() or datetime.now() + RETRY_DELAY
+                            set_metadata(session, "last_scrape_error", f"Scrape error: {str(e)}")
+                        finally:
+                            browser.release(healthy=cycle_ok)
+                            telemetry.finish(error=cycle_error)
                     else:
-                        print("[Background Scheduler] Missing legacy credentials or saved session, skipping background scrape.")
-                        set_metadata(session, "last_scrape_error", "Missing legacy credentials. Please set them in the Settings tab or .env file.")
-            else:
-                # Console debug info
+                        retry_at = datetime.now() + RETRY_DELAY
+                        if auth_mode == "sso":
+                            print("[Background Scheduler] Missing active SSO session. Please log in interactively first.")
+                            set_metadata(session, "last_scrape_error", "Missing Microsoft SSO session. Please log in once in the Settings tab.")
+                        else:
+                            print("[Background Scheduler] Missing legacy credentials or saved session, skipping background scrape.")
+                            set_metadata(session, "last_scrape_error", "Missing legacy credentials. Please set them in the Settings tab or .env file.")
+                finally:
+                    scrape_lock.release()
+                next_scrape_dt = retry_at or scrape_planner.next_due()
+            elif next_scrape_dt and next_scrape_dt != reported_idle_for:
+                # Console debug info (once per planned run, not on every wake-up)
+                reported_idle_for = next_scrape_dt
                 time_to_wait = next_scrape_dt - datetime.now()
                 print(f"[Background Scheduler] Idle. Next scrape in {time_to_wait.total_seconds()/60:.1f} minutes ({next_scrape_dt.strftime('%H:%M:%S')})")
             
@@ -125,9 +217,11 @@ def background_worker():
             
         except Exception as e:
             print(f"[Background Scheduler] Worker loop error: {e}")
+            next_scrape_dt = None
             
-        # Sleep for a bit before checking again (e.g., 5 minutes)
-        time.sleep(300)
+        # Sleep until the next date is due; config changes and scrape-now requests wake us early
+        if wait_until(next_scrape_dt):
+            print("[Background Scheduler] Woken up: re-planning.")
 
 def start_background_scheduler():
     """
@@ -135,15 +229,7 @@ def start_background_scheduler():
     """
     # Use a global variable to track if thread is already started
     if not hasattr(start_background_scheduler, "_thread_started"):
-        # Reset Global Sync Lock on application startup
-        try:
-            session = get_session()
-            set_metadata(session, "is_scrape_in_progress", "False")
-            session.close()
-            print("[Background Scheduler] Global sync lock reset.")
-        except Exception as e:
-            print(f"[Background Scheduler] Failed to reset sync lock: {e}")
-
+        # No lock reset needed: a lease left by a crashed run expires on its own
         worker_thread = threading.Thread(target=background_worker, daemon=True)
         worker_thread.start()
         start_background_scheduler._thread_started = True
@@ -0,0 +1,127 @@
+"""
+Cross-process scrape lock built on a lease row in scrape_leases.
+
+A holder owns the lease until expires_at and keeps pushing that forward from
+a heartbeat thread. A holder that crashes stops heartbeating, and once the
+lease expires the next process takes it over. No startup reset is needed.
+Acquisition is a single conditional UPDATE (take over an expired lease or
+renew our own), or an INSERT that fails on the primary key when a live row
+already exists. Both are atomic on SQLite and Postgres.
+"""
+import os
+import uuid
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from database import get_session, ScrapeLease
+
+SCRAPE_LEASE = "scrape"
+LEASE_TTL = timedelta(minutes=5)
+HEARTBEAT_SECONDS = 60
+
+def make_owner_id(label):
+    return f"{socket.gethostname()}:{os.getpid()}:{label}:{uuid.uuid4().hex[:8]}"
+
+def try_acquire(session, owner, name=SCRAPE_LEASE, ttl=LEASE_TTL):
+    """Takes the lease if it is free, expired or already ours. Returns True on success."""
+    now = datetime.now()
+    taken = session.query(ScrapeLease).filter(
+        ScrapeLease.name == name,
+        or_(ScrapeLease.expires_at < now, ScrapeLease.owner == owner)
+    ).update({"owner": owner, "acquired_at": now, "heartbeat_at": now, "expires_at": now + ttl},
+             synchronize_session=False)
+    if taken:
+        session.commit()
+        return True
+    try:
+        session.add(ScrapeLease(name=name, owner=owner, acquired_at=now, heartbeat_at=now, expires_at=now + ttl))
+        session.commit()
+        return True
+    except IntegrityError:
+        # Someone else holds a live lease
+        session.rollback()
+        return False
+
+def heartbeat(session, owner, name=SCRAPE_LEASE, ttl=LEASE_TTL):
+    """Extends our lease. Returns False when it was lost (expired and taken over, or force-released)."""
+    now = datetime.now()
+    renewed = session.query(ScrapeLease).filter(ScrapeLease.name == name, ScrapeLease.owner == owner)\
+        .update({"heartbeat_at": now, "expires_at": now + ttl}, synchronize_session=False)
+    session.commit()
+    return bool(renewed)
+
+def release(session, owner, name=SCRAPE_LEASE):
+    session.query(ScrapeLease).filter(ScrapeLease.name == name, ScrapeLease.owner == owner)\
+        .delete(synchronize_session=False)
+    session.commit()
+
+def force_release(session, name=SCRAPE_LEASE):
+    """Drops the lease whoever holds it (UI escape hatch); the holder notices on its next heartbeat."""
+    session.query(ScrapeLease).filter(ScrapeLease.name == name).delete(synchronize_session=False)
+    session.commit()
+
+def get_active_lease(session, name=SCRAPE_LEASE):
+    """The live lease row, or None when the lock is free or expired."""
+    return session.query(ScrapeLease).filter(
+        ScrapeLease.name == name, ScrapeLease.expires_at >= datetime.now()
+    ).first()
+
+def is_scrape_locked(session):
+    return get_active_lease(session) is not None
+
+class ScrapeLock:
+    """
+    Holds the scrape lease for one run and heartbeats it in the background.
+    Check `lost` between units of work: once set, another process owns the lease.
+    """
+    def __init__(self, label, name=SCRAPE_LEASE, ttl=LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.owner = make_owner_id(label)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lost = False
+
+    def acquire(self):
+        session = get_session()
+        try:
+            acquired = try_acquire(session, self.owner, self.name, self.ttl)
+        finally:
+            session.close()
+        if acquired:
+            self.lost = False
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._heartbeat_loop, name="scrape-lease-heartbeat", daemon=True)
+            self.thread.start()
+        return acquired
+
+    def _heartbeat_loop(self):
+        while not self.stop_event.wait(HEARTBEAT_SECONDS):
+            session = get_session()
+            try:
+                if not heartbeat(session, self.owner, self.name, self.ttl):
+                    self.lost = True
+                    print(f"[Scrape Lock] Lease '{self.name}' lost by {self.owner}.")
+                    return
+            except Exception as e:
+                # Keep trying; the lease only lapses after a full TTL without a heartbeat
+                print(f"[Scrape Lock] Heartbeat error: {e}")
+                session.rollback()
+            finally:
+                session.close()
+
+    def release(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        session = get_session()
+        try:
+            release(session, self.owner, self.name)
+        except Exception as e:
+            print(f"[Scrape Lock] Release error: {e}")
+            session.rollback()
+        finally:
+            session.close()
@@ -0,0 +1,217 @@
+"""
+Priority-based scrape planning.
+
+Instead of re-scraping the whole window every interval, each date gets its
+own refresh interval from how close it is to today and how fast its flights
+have been changing (FlightHistory rows per flight over the last day). A date
+is due once DailySyncStatus.last_scraped_at + its interval has passed, and a
+heap ordered by (next_due, proximity) hands out the most overdue, nearest
+dates first. Past dates (the old daily deep sync) are refreshed once a day.
+
+Proximity and change rate only set the relative intervals. They are then
+scaled to a load budget: the configured scrape_interval_hours and scrape_days
+still cost what the old fixed sweep did (every date once per base interval),
+so today, tomorrow and busy dates get fresher data by taking refreshes from
+far-out and quiet ones, not by adding load on the NOC portal.
+
+With several stations configured each (station, date) pair is planned on its
+own from StationSyncStatus, so a newly added station makes every date due for
+that station only. A pair whose scrape failed is pushed back by its own
+backoff (RETRY_DELAY, doubling per consecutive failure) instead of being due
+again on the next wake-up, while the other pairs keep their schedule.
+"""
+import math
+import heapq
+import threading
+from datetime import datetime, timedelta
+from collections import defaultdict
+from sqlalchemy import func
+from database import Flight, FlightHistory, DailySyncStatus, StationSyncStatus
+
+LOOKBACK_DAYS = 7 # Past dates kept in the plan (replaces the daily 7-day deep sync)
+CHANGE_RATE_WINDOW = timedelta(hours=24)
+MIN_REFRESH = timedelta(minutes=15)
+MAX_REFRESH = timedelta(hours=24)
+PAST_REFRESH = timedelta(hours=24)
+# After a failed login or scrape, due dates wait this long instead of retrying every
+# wake-up; a failed (station, date) pair doubles it per consecutive failure
+RETRY_DELAY = timedelta(minutes=5)
+
+def proximity_factor(offset):
+    """Multiplier on the base interval for a date `offset` days from today."""
+    if offset <= 0:
+        return 0.25
+    if offset == 1:
+        return 0.5
+    if offset <= 3:
+        return 1.0
+    return 2.0
+
+def change_factor(changes_per_flight):
+    """2x slower for dates with no recent changes, down to 2x faster for busy ones."""
+    return min(2.0, max(0.5, 2.0 / (1.0 + 4.0 * changes_per_flight)))
+
+def relative_interval(offset, changes_per_flight):
+    """Refresh interval of a future date relative to the others, before the budget is applied."""
+    return proximity_factor(offset) * change_factor(changes_per_flight)
+
+def _clamped(weights, scale_hours):
+    return [min(MAX_REFRESH, max(MIN_REFRESH, timedelta(hours=w * scale_hours))) for w in weights]
+
+def scrapes_per_hour(intervals):
+    return sum(3600 / i.total_seconds() for i in intervals)
+
+def budget_intervals(weights, base_hours):
+    """
+    Scales relative intervals so the dates together cost at most the old fixed
+    sweep, len(weights) scrapes per base_hours (per station). The scale is found
+    by bisection with the MIN/MAX_REFRESH clamps applied, so clamping a busy date
+    to MIN_REFRESH is paid for by the others. Returns (intervals, budget per hour).
+    """
+    budget = len(weights) / base_hours
+    lo, hi = 1e-3, 1e3
+    for _ in range(60):
+        mid = math.sqrt(lo * hi)
+        if scrapes_per_hour(_clamped(weights, mid)) > budget:
+            lo = mid
+        else:
+            hi = mid
+    return _clamped(weights, hi), budget
+
+def failure_backoff(failures):
+    """Delay before retrying a (station, date) pair after `failures` consecutive failed scrapes."""
+    return min(MAX_REFRESH, RETRY_DELAY * (2 ** max(0, failures - 1)))
+
+def _per_day(rows):
+    counts = defaultdict(int)
+    for day, count in rows:
+        if day is not None:
+            counts[day.replace(hour=0, minute=0, second=0, microsecond=0)] += count
+    return counts
+
+def load_change_rates(session, start, end, now):
+    """Recent FlightHistory rows per flight, keyed by flight date (midnight)."""
+    flights = _per_day(session.query(Flight.date, func.count(Flight.id))
+                       .filter(Flight.date >= start, Flight.date < end)
+                       .group_by(Flight.date).all())
+    changes = _per_day(session.query(Flight.date, func.count(FlightHistory.id))
+                       .join(FlightHistory, FlightHistory.flight_id == Flight.id)
+                       .filter(Flight.date >= start, Flight.date < end,
+                               FlightHistory.timestamp >= now - CHANGE_RATE_WINDOW)
+                       .group_by(Flight.date).all())
+    return {day: changes.get(day, 0) / count for day, count in flights.items() if count}
+
+class ScrapePlanner:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heap = []
+        self.budget = {}
+        self.failures = {} # (station, day) -> (consecutive failures, retry not before)
+
+    def refresh(self, session, base_hours, num_days, now=None, force=False, stations=None):
+        """
+        Rebuilds the queue for [today - LOOKBACK_DAYS, today + num_days) from the
+        sync status tables, one entry per (station, date). force makes every date
+        from today on due immediately, failure backoffs included.
+        stations: explicit station codes scraped each sweep (None/[None]: the default station).
+        """
+        now = now or datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today - timedelta(days=LOOKBACK_DAYS)
+        end = today + timedelta(days=num_days)
+
+        stations = [s for s in (stations or []) if s]
+        if stations:
+            last_scraped = {(s.station, s.date): s.last_scraped_at for s in session.query(StationSyncStatus)
+                            .filter(StationSyncStatus.station.in_(stations),
+                                    StationSyncStatus.date >= start, StationSyncStatus.date < end).all()}
+        else:
+            stations = [None]
+            last_scraped = {(None, s.date): s.last_scraped_at for s in session.query(DailySyncStatus)
+                            .filter(DailySyncStatus.date >= start, DailySyncStatus.date < end).all()}
+        rates = load_change_rates(session, start, end, now)
+
+        with self.lock:
+            # Backoffs for pairs that left the window or the station list are dropped
+            self.failures = {key: v for key, v in self.failures.items() if key[0] in stations and start <= key[1] < end}
+            failures = dict(self.failures)
+
+        days = [today + timedelta(days=offset) for offset in range(-LOOKBACK_DAYS, num_days)]
+        future = [day for day in days if day >= today]
+        future_intervals, budget = budget_intervals(
+            [relative_interval((day - today).days, rates.get(day, 0.0)) for day in future], base_hours)
+        intervals = dict(zip(future, future_intervals))
+
+        heap = []
+        for day in days:
+            offset = (day - today).days
+            rate = rates.get(day, 0.0)
+            interval = intervals.get(day, PAST_REFRESH)
+            forced = force and offset >= 0
+            for station in stations:
+                last = last_scraped.get((station, day))
+                next_due = last + interval if last and not forced else now
+                if (station, day) in failures and not forced:
+                    next_due = max(next_due, failures[(station, day)][1])
+                # "" keeps the tuples comparable when the default station (None) is planned
+                heapq.heappush(heap, (next_due, abs(offset), day, station or "", interval, rate))
+        with self.lock:
+            self.heap = heap
+            self.budget = {
+                "budget_per_hour": round(budget * len(stations), 2),
+                "planned_per_hour": round(scrapes_per_hour(future_intervals) * len(stations), 2),
+                "past_per_hour": round(LOOKBACK_DAYS * len(stations) * 3600 / PAST_REFRESH.total_seconds(), 2),
+                "stations": len(stations)
+            }
+
+    def describe_budget(self):
+        """Scrapes per hour allowed (old fixed sweep) and planned for the future dates, plus the daily past-date refresh."""
+        with self.lock:
+            return dict(self.budget)
+
+    def record_result(self, station, day, ok, now=None):
+        """
+        Clears a (station, date) pair's backoff after a successful scrape, or
+        pushes its next attempt back by failure_backoff() after a failed one.
+        """
+        key = (station or None, day)
+        with self.lock:
+            if ok:
+                self.failures.pop(key, None)
+                return
+            count = self.failures.get(key, (0, None))[0] + 1
+            self.failures[key] = (count, (now or datetime.now()) + failure_backoff(count))
+
+    def pop_due(self, now=None):
+        """
+        Removes and returns the (station, date) pairs due by `now`, most overdue
+        (then nearest) first. station is None for the default station.
+        """
+        now = now or datetime.now()
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                entry = heapq.heappop(self.heap)
+                due.append((entry[3] or None, entry[2]))
+        return due
+
+    def next_due(self):
+        with self.lock:
+            return self.heap[0][0] if self.heap else None
+
+    def describe(self):
+        """Queue entries in due order, for display."""
+        with self.lock:
+            entries = sorted(self.heap)
+            failures = dict(self.failures)
+        return [{
+            "date": day.strftime('%Y-%m-%d'),
+            "station": station or "default",
+            "next_due": next_due.strftime('%Y-%m-%d %H:%M'),
+            "interval_minutes": int(interval.total_seconds() // 60),
+            "changes_per_flight": round(rate, 2),
+            "failures": failures.get((station or None, day), (0, None))[0]
+        } for next_due, _, day, station, interval, rate in entries]
+
+# Global singleton
+scrape_planner = ScrapePlanner()
@@ -0,0 +1,104 @@
+"""
+Per-run scrape telemetry.
+
+A ScrapeRunRecorder is attached to a NOCScraper (scraper.telemetry) for one
+scheduler cycle or manual sync. The scraper times each phase of each date
+(portal side: login_check, navigate, date_set, station_set, search_postback,
+content_capture; local side: parse, db_diff, prune, commit, roster_refresh,
+cloud_upload) and counts inserted/updated/pruned flights. With several
+stations, a date's phases are summed across its stations. finish() writes one scrape_runs row
+and its scrape_phases rows in a single transaction; repeated phases for the
+same date are summed, and each date also gets a 'total' row with its counts.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from database import get_session, ScrapeRun, ScrapePhase
+
+PORTAL_PHASES = ("login_check", "navigate", "date_set", "station_set", "search_postback", "content_capture")
+LOCAL_PHASES = ("parse", "db_diff", "prune", "commit", "roster_refresh", "cloud_upload")
+
+class ScrapeRunRecorder:
+    def __init__(self, source):
+        self.source = source
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.phases = {} # (date, phase) -> seconds, in first-seen order
+        self.date_counts = {} # date -> {"inserted", "updated", "pruned", "seconds"}
+        self.current_date = None
+        self.date_started = None
+        self.failed_dates = 0
+
+    def begin_date(self, date_obj):
+        self.current_date = date_obj.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.date_started = time.perf_counter()
+        self.date_counts.setdefault(self.current_date, {"inserted": 0, "updated": 0, "pruned": 0, "seconds": 0.0})
+
+    def end_date(self, ok=True):
+        if self.current_date is None:
+            return
+        self.date_counts[self.current_date]["seconds"] += time.perf_counter() - self.date_started
+        if not ok:
+            self.failed_dates += 1
+        self.current_date = None
+
+    def add_phase(self, name, seconds):
+        key = (self.current_date, name)
+        self.phases[key] = self.phases.get(key, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    def count(self, inserted=0, updated=0, pruned=0):
+        if self.current_date is None:
+            return
+        counts = self.date_counts[self.current_date]
+        counts["inserted"] += inserted
+        counts["updated"] += updated
+        counts["pruned"] += pruned
+
+    def finish(self, error=None):
+        """Persists the run. Status is Failed on error, Partial when some dates failed."""
+        self.end_date(ok=error is None)
+        totals = {k: sum(c[k] for c in self.date_counts.values()) for k in ("inserted", "updated", "pruned")}
+        if error:
+            status = "Failed"
+        elif self.failed_dates:
+            status = "Partial"
+        else:
+            status = "Success"
+        duration = time.perf_counter() - self.started
+
+        session = get_session()
+        try:
+            run = ScrapeRun(
+                source=self.source,
+                started_at=self.started_at,
+                finished_at=datetime.now(),
+                duration_seconds=round(duration, 2),
+                dates_scraped=len(self.date_counts),
+                status=status,
+                error=str(error)[:500] if error else None,
+                **totals
+            )
+            session.add(run)
+            session.flush()
+            rows = [ScrapePhase(run_id=run.id, date=d, phase=name, seconds=round(sec, 3))
+                    for (d, name), sec in self.phases.items()]
+            rows += [ScrapePhase(run_id=run.id, date=d, phase="total", seconds=round(c["seconds"], 3),
+                                 inserted=c["inserted"], updated=c["updated"], pruned=c["pruned"])
+                     for d, c in self.date_counts.items()]
+            session.add_all(rows)
+            session.commit()
+            print(f"[Scrape Telemetry] {self.source} run: {len(self.date_counts)} dates in {duration:.1f}s "
+                  f"({totals['inserted']} inserted, {totals['updated']} updated, {totals['pruned']} pruned, {status}).")
+        except Exception as e:
+            print(f"[Scrape Telemetry] Could not persist run: {e}")
+            session.rollback()
+        finally:
+            session.close()
@@ -1,6 +1,10 @@
 import os
+import time
 import asyncio
 import json
+from contextlib import nullcontext
+from sqlalchemy import or_
+from urllib.parse import urlparse
 from datetime import datetime, timedelta, timezone
 import zoneinfo
 import airportsdata
@@ -18,17 +22,74 @@ if os.name == 'nt':
 
 from playwright.sync_api import sync_playwright, TimeoutError
 from bs4 import BeautifulSoup
-from config import LOGIN_URL, STATION_OPS_URL, AUTH_MODE, SESSION_STATE_PATH
-from database import get_session, Flight, CrewMember, flight_crew_association, DailySyncStatus
+from config import LOGIN_URL, STATION_OPS_URL, AUTH_MODE, SESSION_STATE_PATH, SCRAPER_BLOCK_RESOURCES, SCRAPER_SCRIPT_HOSTS, SCRAPE_STATIONS
+from database import get_session, get_metadata, Flight, CrewMember, flight_crew_association, DailySyncStatus, StationSyncStatus
+from crew_search import crew_index, mark_crew_changed
+from cloud_outbox import record_flight_change
+
+# Station Ops only needs the document, its scripts (WebForms postback/ScriptResource.axd, CDN jQuery/MS Ajax) and XHRs
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet", "manifest", "texttrack", "beacon", "ping"}
+BLOCKED_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "clarity.ms", "hotjar.com",
+    "nr-data.net", "newrelic.com", "applicationinsights.azure.com", "dc.services.visualstudio.com",
+    "segment.io", "sentry.io", "fullstory.com", "mixpanel.com"
+)
+# Scripts are blocked only by BLOCKED_HOSTS unless SCRAPER_SCRIPT_HOSTS opts into an allowlist,
+# which always includes the portal itself and the login providers
+SCRIPT_HOSTS = (urlparse(STATION_OPS_URL).hostname, urlparse(LOGIN_URL).hostname,
+                "login.microsoftonline.com", "login.live.com", "aadcdn.msauth.net", "aadcdn.msftauth.net",
+                *SCRAPER_SCRIPT_HOSTS) if SCRAPER_SCRIPT_HOSTS else None
+
+def _host_matches(host, suffixes):
+    return any(host == s or host.endswith("." + s) for s in suffixes if s)
+
+STATION_FIELD = "#MasterMain_tbStation_StationFieldTextBox"
+# Where Station Ops shows the station it is displaying (varies between Raido/NOC versions)
+STATION_SELECTORS = ["#MasterMain_tbStation_StationNameField", STATION_FIELD, "#MasterMain_lbStationName", ".StationHeader"]
+
+def parse_stations(value):
+    """'iad, IAH,iad' -> ['IAD', 'IAH']."""
+    stations = []
+    for code in (value or "").split(","):
+        code = code.strip().upper()
+        if code and code not in stations:
+            stations.append(code)
+    return stations
+
+def get_scrape_stations(session):
+    """
+    Stations for scheduled sweeps: the 'scrape_stations' setting, else SCRAPE_STATIONS.
+    [None] means the station the account's Station Ops page defaults to.
+    """
+    value = get_metadata(session, "scrape_stations")
+    stations = parse_stations(value) if value is not None else SCRAPE_STATIONS
+    return stations or [None]
+
+def scrape_targets(dates, stations):
+    """(station, date) pairs, date by date so the most urgent date is covered for every station first."""
+    return [(station, d) for d in dates for station in stations]
 
 class NOCScraper:
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, block_resources=None):
         self.headless = headless
+        # Interactive (headful) logins load everything so the user sees a normal page
+        self.block_resources = (SCRAPER_BLOCK_RESOURCES and headless) if block_resources is None else block_resources
+        self.request_stats = {"allowed": 0, "blocked": 0, "blocked_by_type": {}}
+        # Script hosts already reported as blocked (a blocked script can break the page, so say so once)
+        self._blocked_script_hosts = set()
+        # Optional ScrapeRunRecorder (scrape_telemetry) set by whoever drives this scraper
+        self.telemetry = None
+        # Why the last scrape_date() returned False (read by the portal circuit breaker)
+        self.last_error = None
         self.playwright = None
         self.browser = None
         self.context = None
         self.page = None
         self.session = get_session()
+        # (crew_id, date) pairs whose cached roster needs recomputing after this scrape
+        self._touched_roster_days = set()
+        # crew pk -> (name, employee_id) created or changed since the last commit; indexed once committed
+        self._pending_crew_index = {}
 
     def _get_utc_time(self, local_dt, airport_str):
         if not local_dt or not airport_str:
@@ -57,9 +118,17 @@ class NOCScraper:
         if storage_state_path is None:
             storage_state_path = SESSION_STATE_PATH
 
+        self.launch_browser()
+        self.open_context(storage_state_path)
+
+    def launch_browser(self):
         self.playwright = sync_playwright().start()
         self.browser = self.playwright.chromium.launch(headless=self.headless)
-        
+
+    def open_context(self, storage_state_path=None):
+        """Opens a fresh context (cookies loaded from the saved session state) and page on the running browser."""
+        if storage_state_path is None:
+            storage_state_path = SESSION_STATE_PATH
         # Check if we should load the storage state
         if os.path.exists(storage_state_path):
             print(f"Loading persistent session state from {storage_state_path}...")
@@ -67,10 +136,79 @@ class NOCScraper:
         else:
             print("Creating new browser context (no saved session state found)...")
             self.context = self.browser.new_context()
-            
+
+        if self.block_resources:
+            self.context.route("**/*", self._route_request)
         self.page = self.context.new_page()
 
+    def _route_request(self, route):
+        request = route.request
+        host = urlparse(request.url).hostname or ""
+        kind = request.resource_type
+        if kind in BLOCKED_RESOURCE_TYPES or _host_matches(host, BLOCKED_HOSTS) or \
+                (kind == "script" and SCRIPT_HOSTS and not _host_matches(host, SCRIPT_HOSTS)):
+            if kind == "script" and host not in self._blocked_script_hosts:
+                self._blocked_script_hosts.add(host)
+                print(f"Blocked script from {host or 'unknown host'}: {request.url} "
+                      "(set SCRAPER_BLOCK_RESOURCES=False or adjust SCRAPER_SCRIPT_HOSTS if pages break)")
+            self.request_stats["blocked"] += 1
+            self.request_stats["blocked_by_type"][kind] = self.request_stats["blocked_by_type"].get(kind, 0) + 1
+            route.abort("blockedbyclient")
+            return
+        self.request_stats["allowed"] += 1
+        route.continue_()
+
+    def request_summary(self):
+        stats = self.request_stats
+        by_type = ", ".join(f"{k}={v}" for k, v in sorted(stats["blocked_by_type"].items()))
+        return f"{stats['allowed']} requests allowed, {stats['blocked']} blocked ({by_type or 'none'})"
+
+    def _phase(self, name):
+        return self.telemetry.phase(name) if self.telemetry else nullcontext()
+
+    def _add_phase(self, name, seconds):
+        if self.telemetry:
+            self.telemetry.add_phase(name, seconds)
+
+    def _count(self, **counts):
+        if self.telemetry:
+            self.telemetry.count(**counts)
+
+    def close_context(self):
+        if self.context:
+            try:
+                self.context.close()
+            except Exception as e:
+                print(f"Error closing browser context: {e}")
+        self.context = None
+        self.page = None
+
+    def is_alive(self):
+        """Cheap health check: browser process connected and page still open (no navigation)."""
+        try:
+            return bool(self.browser and self.browser.is_connected() and self.page and not self.page.is_closed())
+        except Exception:
+            return False
+
+    def js_heap_mb(self):
+        """Renderer JS heap in MB (Chromium's performance.memory), or None if unavailable."""
+        try:
+            used = self.page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : null")
+            return used / (1024 * 1024) if used else None
+        except Exception:
+            return None
+
+    def reset_run_state(self):
+        """Drops per-run DB state so a long-lived scraper starts each cycle like a fresh one."""
+        self.session.close()
+        self._touched_roster_days = set()
+        self._discard_pending_crew()
+
     def stop(self):
+        # Let queued cloud pushes finish before a short-lived process exits (the outbox keeps anything left)
+        from cloud_sync_worker import cloud_sync_worker
+        if cloud_sync_worker.thread and not cloud_sync_worker.flush(timeout=60):
+            print("[Cloud Sync Worker] Still pushing; remaining changes stay in the outbox.")
         if self.browser:
             self.browser.close()
         if self.playwright:
@@ -94,12 +232,13 @@ class NOCScraper:
         # First, try to verify if current session is already active/valid
         print("Checking session validity by navigating to Station Operations...")
         try:
-            self.page.goto(STATION_OPS_URL)
-            self.page.wait_for_load_state("networkidle")
+            with self._phase("login_check"):
+                self.page.goto(STATION_OPS_URL)
+                self.page.wait_for_load_state("networkidle")
             
-            # Check if we are on the station ops page and NOT redirected to a login/sign-in page
-            current_url = self.page.url
-            current_title = self.page.title()
+                # Check if we are on the station ops page and NOT redirected to a login/sign-in page
+                current_url = self.page.url
+                current_title = self.page.title()
             
             if "StationOperations.aspx" in current_url and "login" not in current_url.lower() and not ("Login" in current_title or "Sign in" in current_title):
                 print("Session is active and valid (already logged in). Bypassing login step.")
@@ -167,24 +306,43 @@ class NOCScraper:
                 print(f"Failed to scrape {current_date}")
             current_date += timedelta(days=1)
             
-    def scrape_date(self, date_obj):
+    def scrape_date(self, date_obj, station=None):
+        """Scrapes one date for `station` (None: whatever station the page is already on)."""
+        self.last_error = None
+        if self.telemetry:
+            self.telemetry.begin_date(date_obj)
+        ok = False
+        try:
+            ok = self._scrape_date(date_obj, station)
+            return ok
+        finally:
+            if self.telemetry:
+                self.telemetry.end_date(ok)
+
+    def _scrape_date(self, date_obj, station=None):
         # Navigate to Station Ops if not already there
         if "StationOperations.aspx" not in self.page.url:
-            self.page.goto(STATION_OPS_URL)
-            self.page.wait_for_load_state("networkidle")
+            with self._phase("navigate"):
+                self.page.goto(STATION_OPS_URL)
+                self.page.wait_for_load_state("networkidle")
 
         # 1. Interact with Date Picker (Only needed once if we stay on page)
         date_str = date_obj.strftime("%d%b%y").upper()
-        print(f"Setting date to {date_str}...")
+        print(f"Setting date to {date_str}{f' for {station}' if station else ''}...")
         
         try:
-            # Clear existing value first
-            self.page.click("#MasterMain_tbDate_DateFieldTextBox")
-            self.page.fill("#MasterMain_tbDate_DateFieldTextBox", "")
-            
-            # Type slowly to trigger events
-            self.page.type("#MasterMain_tbDate_DateFieldTextBox", date_str, delay=100)
-            self.page.press("#MasterMain_tbDate_DateFieldTextBox", "Tab")
+            with self._phase("date_set"):
+                # Clear existing value first
+                self.page.click("#MasterMain_tbDate_DateFieldTextBox")
+                self.page.fill("#MasterMain_tbDate_DateFieldTextBox", "")
+                
+                # Type slowly to trigger events
+                self.page.type("#MasterMain_tbDate_DateFieldTextBox", date_str, delay=100)
+                self.page.press("#MasterMain_tbDate_DateFieldTextBox", "Tab")
+
+            if station:
+                with self._phase("station_set"):
+                    self._set_station(station)
             
             # --- PASS 1: UTC ---
             # print("  [Pass 1] Switching to UTC...")
@@ -198,30 +356,56 @@ class NOCScraper:
             
             # --- PASS 2: Local ---
             print("Capturing in Local Time...")
-            self.page.select_option("#MasterMain_TimeMode_DP_TimeModes", label="Local time")
-            self.page.click("#MasterMain_btnSearch")
-            self.page.wait_for_load_state("networkidle")
-            self.page.wait_for_timeout(3000)
+            with self._phase("search_postback"):
+                self.page.select_option("#MasterMain_TimeMode_DP_TimeModes", label="Local time")
+                self.page.click("#MasterMain_btnSearch")
+                self.page.wait_for_load_state("networkidle")
+                self.page.wait_for_timeout(3000)
             
-            content_local = self.page.content()
+            with self._phase("content_capture"):
+                content_local = self.page.content()
+            if self.block_resources:
+                print(f"Network: {self.request_summary()}")
+            if station:
+                # Never file one station's board under another (e.g. the field rejected the code)
+                shown = self._read_station()
+                if shown and shown.upper() != station:
+                    raise ValueError(f"Station Ops shows {shown} instead of {station}")
             seen_ids = self.parse_and_save(content_local, date_obj, mode="Local")
             
             # --- Pruning / Reconciliation ---
             # If the scrape was basically successful, remove anything in the DB for this 
             # station/date that we DIDN'T see in the current portal view.
             if seen_ids is not None:
-                self._prune_missing_flights(date_obj, seen_ids)
+                with self._phase("prune"):
+                    self._prune_missing_flights(date_obj, seen_ids, station)
+
+            with self._phase("roster_refresh"):
+                self._refresh_roster_cache()
 
             # Update Sync Status (Only once)
-            self._update_sync_status(date_obj)
+            self._update_sync_status(date_obj, station)
             return True
             
         except Exception as e:
             print(f"Error interacting with page controls: {e}")
+            self.last_error = e
             if "Target closed" in str(e): raise
             return False
 
-    def _update_sync_status(self, date_obj):
+    def _refresh_roster_cache(self):
+        if not self._touched_roster_days:
+            return
+        try:
+            from roster_engine import refresh_roster_days
+            refresh_roster_days(self.session, self._touched_roster_days)
+        except Exception as e:
+            print(f"Error refreshing roster cache: {e}")
+            self.session.rollback()
+        finally:
+            self._touched_roster_days = set()
+
+    def _update_sync_status(self, date_obj, station=None):
         try:
             date_key = date_obj.replace(hour=0, minute=0, second=0, microsecond=0)
             sync_status = self.session.get(DailySyncStatus, date_key)
@@ -234,29 +418,49 @@ class NOCScraper:
             count = self.session.query(Flight).filter(Flight.date >= date_key, Flight.date < date_key + timedelta(days=1)).count()
             sync_status.flights_found = count
             sync_status.status = "Success"
-            self.session.commit()
+
+            if station:
+                station_status = self.session.get(StationSyncStatus, (station, date_key))
+                if not station_status:
+                    station_status = StationSyncStatus(station=station, date=date_key)
+                    self.session.add(station_status)
+                station_status.last_scraped_at = sync_status.last_scraped_at
+                station_status.flights_found = self._station_flights(date_key, station).count()
+                station_status.status = "Success"
+            with self._phase("commit"):
+                self.session.commit()
             
-            # Update Global Metadata
-            from database import set_metadata
-            now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            set_metadata(self.session, "last_successful_sync", now_str)
+                # Update Global Metadata
+                from database import set_metadata
+                now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                set_metadata(self.session, "last_successful_sync", now_str)
             
-            # Sync to Firestore if enabled
-            from config import ENABLE_CLOUD_SYNC
+            # Sync to Firestore if enabled. The background worker pushes the outbox
+            # (only flights journaled as changed) so the sweep never waits on the network.
             from firestore_lib import is_cloud_sync_enabled
             if is_cloud_sync_enabled():
-                from firestore_lib import upload_metadata
-                upload_metadata("last_successful_sync", now_str)
-                
-                # Auto-upload the flights for this specific day
-                from ingest_data import upload_flights_to_cloud
-                # scraper's session is already open
-                upload_flights_to_cloud(self.session, start_date=date_key, end_date=date_key)
+                from cloud_sync_worker import cloud_sync_worker
+                # Only the hand-off is timed here; the push itself is recorded in cloud_sync_runs
+                with self._phase("cloud_upload"):
+                    cloud_sync_worker.submit_metadata("last_successful_sync", now_str)
+                    cloud_sync_worker.submit_day(date_key)
             
             print(f"Sync status and global metadata updated for {date_key}")
         except Exception as e:
             print(f"Error updating sync status: {e}")
 
+    def _index_committed_crew(self):
+        for crew_pk, (name, employee_id) in self._pending_crew_index.items():
+            crew_index.add(crew_pk, name, employee_id)
+        self._pending_crew_index = {}
+
+    def _discard_pending_crew(self):
+        # Rolled-back crew rows must not reach the search index, and the cache may hold them
+        self._pending_crew_index = {}
+        if hasattr(self, '_crew_cache_by_id'):
+            del self._crew_cache_by_id
+            del self._crew_cache_by_name
+
     def _get_or_create_crew(self, c_id, c_name):
         if not hasattr(self, '_crew_cache_by_id'):
             self._crew_cache_by_id = {}
@@ -278,6 +482,7 @@ class NOCScraper:
             crew = CrewMember(name=c_name, employee_id=c_id)
             self.session.add(crew)
             self.session.flush()
+            self._pending_crew_index[crew.id] = (crew.name, crew.employee_id)
         else:
             changed = False
             if not crew.employee_id and c_id:
@@ -287,40 +492,58 @@ class NOCScraper:
                 crew.name = c_name
                 changed = True
             # Defer flush; session is committed once after all flights are processed
+            if changed:
+                mark_crew_changed(self.session)
+                self._pending_crew_index[crew.id] = (crew.name, crew.employee_id)
                 
         if c_id: self._crew_cache_by_id[c_id] = crew
         if c_name: self._crew_cache_by_name[c_name] = crew
         return crew
 
-    def _prune_missing_flights(self, date_obj, seen_ids):
+    def _set_station(self, station):
+        self.page.click(STATION_FIELD)
+        self.page.fill(STATION_FIELD, "")
+        # Typed like the date so the field's change handlers fire
+        self.page.type(STATION_FIELD, station, delay=100)
+        self.page.press(STATION_FIELD, "Tab")
+
+    def _read_station(self):
+        """Station code Station Ops is showing, or None when it cannot be read."""
+        try:
+            for sel in STATION_SELECTORS:
+                station_el = self.page.query_selector(sel)
+                if station_el:
+                    val = station_el.get_attribute("value") or station_el.inner_text()
+                    if val:
+                        return val.split(" - ")[0].strip()
+        except Exception:
+            pass
+        return None
+
+    def _station_flights(self, date_key, station_code):
+        return self.session.query(Flight).filter(
+            Flight.date == date_key,
+            or_(Flight.departure_airport.like(f"{station_code}%"), Flight.arrival_airport.like(f"{station_code}%"))
+        )
+
+    def _prune_missing_flights(self, date_obj, seen_ids, station=None):
         """
         Removes flights from the DB that are associated with the current station 
-        for date_obj but were not present in the seen_ids list.
+        for date_obj but were not present in the seen_ids list. With an explicit
+        station only that station's flights are candidates; otherwise the station
+        is read from the page or inferred from the scraped flights.
         """
         try:
             date_key = date_obj.replace(hour=0, minute=0, second=0, microsecond=0)
             
-            # 1. Identify the current station from the page or the flights
-            # Let's try to grab it from the typical Station Name field
-            station_code = None
-            try:
-                # Wide set of potential selectors for Raido/NOC
-                selectors = ["#MasterMain_tbStation_StationNameField", "#MasterMain_tbStation_StationFieldTextBox", "#MasterMain_lbStationName", ".StationHeader"]
-                for sel in selectors:
-                    station_el = self.page.query_selector(sel)
-                    if station_el:
-                        val = station_el.get_attribute("value") or station_el.inner_text()
-                        if val:
-                            station_code = val.split(" - ")[0].strip()
-                            break
-            except:
-                pass
+            # 1. Identify the current station: the one we set, else from the page or the flights
+            station_code = station or self._read_station()
             
             # --- Inference Fallback ---
             # If we couldn't find it in the UI, but we have seen flights, we can infer it!
             # The station is the airport that appears in EVERY flight of the scrape.
             seen_flight_numbers = []
-            if seen_ids:
+            if seen_ids and not station:
                 from collections import Counter
                 airport_counts = Counter()
                 # Query the objects we just saved to find the common station
@@ -344,11 +567,11 @@ class NOCScraper:
                 print("  [Prune] Could not detect current station in UI or via inference. Skipping reconciliation for safety.")
                 return
 
-            print(f"  [Prune] Reconciling flights on {date_key.date()}...")
+            print(f"  [Prune] Reconciling {station_code} flights on {date_key.date()}...")
             
             # 2. Query DB for all flights at this station on this day, 
-            # PLUS any flight that shares a flight number with one we just saw.
-            from sqlalchemy import or_
+            # PLUS (station not set explicitly) any flight that shares a flight number with one we just saw.
+            # With several stations per sweep that widening would prune legs only another station's view shows.
             db_flights = self.session.query(Flight).filter(
                 Flight.date == date_key,
                 or_(
@@ -369,9 +592,13 @@ class NOCScraper:
                     
                     # Cleanup associations
                     from database import flight_crew_association
+                    for row in self.session.execute(flight_crew_association.select().where(flight_crew_association.c.flight_id == f.id)).fetchall():
+                        self._touched_roster_days.add((row.crew_id, f.date.date()))
                     self.session.execute(flight_crew_association.delete().where(flight_crew_association.c.flight_id == f.id))
+                    record_flight_change(self.session, f, "delete")
                     self.session.delete(f)
                 self.session.commit()
+                self._count(pruned=len(to_delete))
                 print(f"  [Prune] Purged {len(to_delete)} flights.")
             else:
                 print("  [Prune] Database is already in sync with Ops view.")
@@ -381,6 +608,8 @@ class NOCScraper:
             self.session.rollback()
 
     def parse_and_save(self, html_content, date_obj, mode="Local"):
+        parse_started = time.perf_counter()
+        db_seconds = 0.0 # Time inside per-flight DB lookups/writes, reported as db_diff rather than parse
         soup = BeautifulSoup(html_content, 'html.parser')
         
         departure_panel = soup.find("div", id="MasterMain_panelUpper")
@@ -587,6 +816,7 @@ class NOCScraper:
                     planned_block = int((sta_utc - std_utc).total_seconds() // 60)
                 
                 # Modified Query: Match on Flight # AND Date AND Route (Dep/Arr)
+                db_started = time.perf_counter()
                 try:
                     query = self.session.query(Flight).filter(
                         Flight.flight_number == flight_number,
@@ -666,6 +896,14 @@ class NOCScraper:
                         if not in_utc: in_utc = existing.actual_in_utc
                         if has_duplicate_warning == 1: existing.has_duplicate_warning = 1
                         
+                        # Text blocks aren't change-tracked, but keep them current so the
+                        # full-text index (updated by DB triggers) reflects the latest notes
+                        text_changed = False
+                        for attr, new_text in (("pax_data", pax_val), ("load_data", load_val), ("notes_data", str(notes_val))):
+                            if new_text and getattr(existing, attr) != new_text:
+                                setattr(existing, attr, new_text)
+                                text_changed = True
+                        
                         changes = {}
                         fields_to_check = {
                             "Tail Number": ("tail_number", tail_number),
@@ -704,7 +942,8 @@ class NOCScraper:
                         flight_key = (flight_number, flight_date, dep_apt, arr_apt)
                         if existing:
                              seen_ids.add(existing.id)
-                             
+                        
+                        roster_crew_ids = set()
                         if flight_key not in processed_flights_in_session:
                             processed_flights_in_session.add(flight_key)
                             
@@ -712,6 +951,7 @@ class NOCScraper:
                             from database import flight_crew_association
                             existing_crew_res = self.session.execute(flight_crew_association.select().where(flight_crew_association.c.flight_id == existing.id)).fetchall()
                             for ec in existing_crew_res:
+                                roster_crew_ids.add(ec.crew_id)
                                 cm = self.session.query(CrewMember).get(ec.crew_id)
                                 current_crew_list.append({"id": cm.employee_id if cm else None, "name": cm.name if cm else "Unknown", "role": ec.role, "flags": ec.flags})
                             current_crew_list.sort(key=lambda x: (x['role'] or '', x['name'] or ''))
@@ -766,9 +1006,25 @@ class NOCScraper:
                             for c_dict in new_crew_list:
                                 c_id, c_name, c_role, c_flags = c_dict["id"], c_dict["name"], c_dict["role"], c_dict["flags"]
                                 crew = self._get_or_create_crew(c_id, c_name)
+                                roster_crew_ids.add(crew.id)
                                 self.session.execute(flight_crew_association.insert().values(flight_id=existing.id, crew_id=crew.id, role=c_role, flags=c_flags))
                             self.session.flush()
 
+                        # Mark every crew member on (or just dropped from) a changed flight for roster refresh
+                        if changes or was_new_flight:
+                            if not roster_crew_ids:
+                                roster_crew_ids = {row.crew_id for row in self.session.execute(flight_crew_association.select().where(flight_crew_association.c.flight_id == existing.id)).fetchall()}
+                            for crew_pk in roster_crew_ids:
+                                self._touched_roster_days.add((crew_pk, flight_date.date()))
+
+                        # Journal the change in this transaction so the cloud push only sends deltas
+                        if changes or was_new_flight or text_changed:
+                            record_flight_change(self.session, existing, "upsert")
+                            if was_new_flight:
+                                self._count(inserted=1)
+                            else:
+                                self._count(updated=1)
+
                     elif mode == "UTC" and existing:
                         existing.scheduled_departure_utc = parsed_std
                         existing.scheduled_arrival_utc = parsed_sta
@@ -778,10 +1034,16 @@ class NOCScraper:
                 except Exception as e:
                     print(f"Error during database sync for item: {e}")
                     self.session.rollback()
+                    self._discard_pending_crew()
+                db_seconds += time.perf_counter() - db_started
             except Exception as e:
                 print(f"Error parsing flight item structure: {e}")
                 
-        self.session.commit() # Single commit for the entire scrape run — much faster than per-flight
+        self._add_phase("parse", time.perf_counter() - parse_started - db_seconds)
+        self._add_phase("db_diff", db_seconds)
+        with self._phase("commit"):
+            self.session.commit() # Single commit for the entire scrape run — much faster than per-flight
+        self._index_committed_crew()
         print(f"Data saved to database ({mode}).")
         return seen_ids
 
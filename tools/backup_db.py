@@ -1,7 +1,33 @@
-import shutil
+"""
+Database backups: a gzipped FULL snapshot once a day and a chain of PATCH
+files in between, each holding only the pages that changed since the
+previous backup (FULL or PATCH) of the same chain.
+
+Every backup starts from a consistent copy made with SQLite's online backup
+API (sqlite3.Connection.backup), so a sync writing at the same time can no
+longer leave a torn file in the backup. Each chain keeps a manifest with the
+per-page checksums of its newest snapshot and the name of that backup (the
+chain head); a new patch is computed against it in one pass over the snapshot.
+
+Patch layout (see tools/restore_db.py), all integers little-endian:
+    PATCH_MAGIC
+    header length (u32) + JSON header: base, parent, page_size, db_size, pages
+    page index: pages x (page_no u32, data offset u64, data length u32)
+    data: each page zlib-compressed on its own, so a restore can seek to any page
+
+Patches written before the chain format (gzip, relative to the FULL backup)
+are still restorable.
+"""
 import os
 import gzip
+import json
+import time
+import zlib
 import struct
+import sqlite3
+import hashlib
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime
 import glob
 
@@ -9,8 +35,115 @@ import glob
 CHUNK_SIZE = 4096  # Standard SQLite page size
 FULL_BACKUP_PREFIX = "noc_data_FULL_"
 PATCH_BACKUP_PREFIX = "noc_data_PATCH_"
+MANIFEST_SUFFIX = ".manifest.json"
+PATCH_MAGIC = b"NOCPATCH2\n"
+INDEX_ENTRY = struct.Struct("<IQI") # page_no, data offset, data length
+SNAPSHOT_PREFIX = ".snapshot."
+LOCK_NAME = ".backup.lock"
+LOCK_WAIT_SECONDS = 120
+LOCK_STALE_SECONDS = 30 * 60 # A lock this old was left by a crashed backup
 RETENTION_DAYS = 15
 
+@contextmanager
+def backup_lock(backup_dir, timeout=LOCK_WAIT_SECONDS):
+    """
+    Serialises backups of one backup_dir across threads and processes (the
+    scheduler and the Settings tab can both start one) with an O_EXCL lock
+    file. Raises TimeoutError if another backup holds it for longer than timeout.
+    """
+    path = os.path.join(backup_dir, LOCK_NAME)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Another backup is still running ({path})")
+            time.sleep(0.5)
+    try:
+        os.write(fd, f"{os.getpid()} {datetime.now().isoformat()}".encode())
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def snapshot_db(db_path, snapshot_path):
+    """Consistent point-in-time copy of a live database (WAL included) via the online backup API."""
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(snapshot_path)
+    try:
+        # One step: readers never block the WAL writer, and a single pass cannot be restarted by its writes
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+def page_checksum(chunk):
+    return hashlib.blake2b(chunk, digest_size=8).hexdigest()
+
+def manifest_path_for(full_backup_path):
+    return full_backup_path[:-len(".db.gz")] + MANIFEST_SUFFIX
+
+def write_manifest(full_backup_path, checksums, size, head=None):
+    """Records the chain head's page checksums (written to a temp file first, so a crash keeps the old manifest)."""
+    path = manifest_path_for(full_backup_path)
+    with open(path + ".tmp", 'w') as f:
+        json.dump({
+            "full_backup": os.path.basename(full_backup_path),
+            "head": head or os.path.basename(full_backup_path),
+            "chunk_size": CHUNK_SIZE,
+            "size": size,
+            "checksums": checksums
+        }, f)
+    os.replace(path + ".tmp", path)
+
+def load_manifest(full_backup_path):
+    """
+    Page checksums of the newest snapshot in a FULL backup's chain. Backups
+    without a manifest get one built once from the archive; a manifest from
+    before chaining describes the FULL backup itself, which is a valid head.
+    """
+    path = manifest_path_for(full_backup_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("chunk_size") == CHUNK_SIZE:
+            manifest.setdefault("head", os.path.basename(full_backup_path))
+            return manifest
+
+    print(f"Building page manifest for {os.path.basename(full_backup_path)}...")
+    checksums = []
+    size = 0
+    with gzip.open(full_backup_path, 'rb') as f_base:
+        while True:
+            chunk = f_base.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            checksums.append(page_checksum(chunk))
+            size += len(chunk)
+    write_manifest(full_backup_path, checksums, size)
+    return {"checksums": checksums, "size": size, "head": os.path.basename(full_backup_path)}
+
+def read_patch_index(patch_path):
+    """Header and page index of a chained patch: (header, [(page_no, offset, length)], data_start). None for legacy patches."""
+    with open(patch_path, 'rb') as f:
+        if f.read(len(PATCH_MAGIC)) != PATCH_MAGIC:
+            return None
+        header_len = struct.unpack("<I", f.read(4))[0]
+        header = json.loads(f.read(header_len).decode('utf-8'))
+        index = [INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size)) for _ in range(header["pages"])]
+        return header, index, f.tell()
+
 def get_latest_full_backup(backup_dir):
     """Finds the most recent FULL backup file."""
     pattern = os.path.join(backup_dir, f"{FULL_BACKUP_PREFIX}*.db.gz")
@@ -21,74 +154,142 @@ def get_latest_full_backup(backup_dir):
     files.sort(reverse=True)
     return files[0]
 
-def create_full_backup(db_path, backup_dir, timestamp):
-    """Creates a compressed full copy of the database."""
+def create_full_backup(snapshot_path, backup_dir, timestamp):
+    """Compresses a snapshot into a FULL backup and records its page manifest."""
     backup_filename = f"{FULL_BACKUP_PREFIX}{timestamp}.db.gz"
     backup_path = os.path.join(backup_dir, backup_filename)
     
     print(f"Creating FULL backup: {backup_filename}")
-    with open(db_path, 'rb') as f_in:
+    checksums = []
+    size = 0
+    with open(snapshot_path, 'rb') as f_in:
         with gzip.open(backup_path, 'wb', compresslevel=6) as f_out:
-            shutil.copyfileobj(f_in, f_out)
+            while True:
+                chunk = f_in.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                checksums.append(page_checksum(chunk))
+                size += len(chunk)
+                f_out.write(chunk)
+    write_manifest(backup_path, checksums, size)
     
     return backup_path
 
-def create_patch_backup(db_path, full_backup_path, backup_dir, timestamp):
-    """Creates a compressed patch relative to a full backup."""
-    patch_filename = f"{PATCH_BACKUP_PREFIX}{timestamp}.patch.gz"
+def create_patch_backup(snapshot_path, full_backup_path, backup_dir, timestamp):
+    """Creates a patch holding the pages that changed since the previous backup in the FULL backup's chain."""
+    patch_filename = f"{PATCH_BACKUP_PREFIX}{timestamp}.patch"
     patch_path = os.path.join(backup_dir, patch_filename)
     
-    print(f"Creating DIFFERENTIAL backup from: {os.path.basename(full_backup_path)}")
+    manifest = load_manifest(full_backup_path)
+    prev_checksums = manifest["checksums"]
+    print(f"Creating INCREMENTAL backup on top of: {manifest['head']}")
     
-    # Store the reference to the full backup at the start of the patch
-    ref_name = os.path.basename(full_backup_path).encode('utf-8')
+    # Compare chunks against the previous snapshot's checksums (pages past its end are always new)
+    checksums = []
+    pages = []
+    size = 0
+    with open(snapshot_path, 'rb') as f_curr:
+        while True:
+            chunk = f_curr.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            checksum = page_checksum(chunk)
+            page_no = len(checksums)
+            if page_no >= len(prev_checksums) or checksum != prev_checksums[page_no]:
+                pages.append((page_no, zlib.compress(chunk, 6)))
+            checksums.append(checksum)
+            size += len(chunk)
     
-    changed_count = 0
-    with open(db_path, 'rb') as f_curr:
-        with gzip.open(full_backup_path, 'rb') as f_base:
-            with gzip.open(patch_path, 'wb', compresslevel=6) as f_patch:
-                # Header: Reference Full Backup Name
-                f_patch.write(struct.pack("<I", len(ref_name)))
-                f_patch.write(ref_name)
-                
-                # Compare chunks
-                offset = 0
-                while True:
-                    c_curr = f_curr.read(CHUNK_SIZE)
-                    c_base = f_base.read(CHUNK_SIZE)
-                    
-                    if not c_curr:
-                        break
-                    
-                    # If current is longer than base, assume base is 0-padded at end
-                    if not c_base:
-                        c_base = b'\x00' * len(c_curr)
-                    
-                    if c_curr != c_base:
-                        # Write [OFFSET(8)][DATA(CHUNK)]
-                        f_patch.write(struct.pack("<Q", offset))
-                        f_patch.write(c_curr)
-                        changed_count += 1
-                        
-                    offset += len(c_curr)
+    header = json.dumps({
+        "base": os.path.basename(full_backup_path),
+        "parent": manifest["head"],
+        "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "page_size": CHUNK_SIZE,
+        "db_size": size, # The snapshot can shrink (VACUUM); restore truncates to this
+        "pages": len(pages)
+    }).encode('utf-8')
+    with open(patch_path, 'wb') as f_patch:
+        f_patch.write(PATCH_MAGIC)
+        f_patch.write(struct.pack("<I", len(header)))
+        f_patch.write(header)
+        offset = 0
+        for page_no, data in pages:
+            f_patch.write(INDEX_ENTRY.pack(page_no, offset, len(data)))
+            offset += len(data)
+        for _, data in pages:
+            f_patch.write(data)
+    # Only advance the chain head once the patch is complete on disk
+    write_manifest(full_backup_path, checksums, size, head=patch_filename)
     
-    print(f"Differential backup complete. Changed {changed_count} pages (~{changed_count*CHUNK_SIZE/1024:.1f} KB raw diff).")
+    print(f"Incremental backup complete. Changed {len(pages)} pages (~{len(pages)*CHUNK_SIZE/1024:.1f} KB raw diff).")
     return patch_path
 
+def backup_timestamp(path):
+    """'noc_data_PATCH_20260301_120000.patch' -> '20260301_120000'."""
+    name = os.path.basename(path)
+    for prefix in (FULL_BACKUP_PREFIX, PATCH_BACKUP_PREFIX):
+        if name.startswith(prefix):
+            return name[len(prefix):len(prefix) + 15]
+    return None
+
+def cleanup_old_backups(backup_dir, cutoff):
+    """
+    Removes whole chains (FULL, manifest and its patches) once their newest file
+    is older than the cutoff, so a patch never outlives the backups it builds on.
+    The newest chain is always kept. Returns the number of files removed.
+    """
+    fulls = sorted(glob.glob(os.path.join(backup_dir, f"{FULL_BACKUP_PREFIX}*.db.gz")))
+    patches = sorted(glob.glob(os.path.join(backup_dir, f"{PATCH_BACKUP_PREFIX}*")))
+    chains = {full: [full, manifest_path_for(full)] for full in fulls}
+    orphans = []
+    for patch in patches:
+        # A patch belongs to the newest FULL backup taken before it
+        owners = [full for full in fulls if backup_timestamp(full) <= backup_timestamp(patch)]
+        if owners:
+            chains[owners[-1]].append(patch)
+        else:
+            orphans.append(patch)
+
+    expired = orphans + glob.glob(os.path.join(backup_dir, "noc_data_backup_*.db")) # Old full-backup format
+    expired = [f for f in expired if os.path.getmtime(f) < cutoff]
+    for full in fulls[:-1]:
+        files = [f for f in chains[full] if os.path.exists(f)]
+        if max(os.path.getmtime(f) for f in files) < cutoff:
+            expired += files
+
+    for f in expired:
+        os.remove(f)
+    return len(expired)
+
 def create_db_backup(db_path='db/noc_data.db', backup_dir='backups'):
     """
     Creates a backup of the database. 
-    Uses full backups once a day and differential patches in between.
+    Uses full backups once a day and chained incremental patches in between.
+    Concurrent calls for the same backup_dir run one after the other (backup_lock).
     """
     if not os.path.exists(db_path):
         print(f"Error: {db_path} not found. Nothing to backup.")
         return None
 
     if not os.path.exists(backup_dir):
-        os.makedirs(backup_dir)
+        os.makedirs(backup_dir, exist_ok=True)
         print(f"Created backup directory: {backup_dir}")
 
+    try:
+        with backup_lock(backup_dir):
+            return _create_db_backup(db_path, backup_dir)
+    except TimeoutError as e:
+        print(f"Backup skipped: {e}")
+        return None
+
+def _create_db_backup(db_path, backup_dir):
+    # Caller holds backup_lock
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if glob.glob(os.path.join(backup_dir, f"noc_data_*_{timestamp}*")):
+        # A backup finished this same second; a second one would overwrite it
+        print(f"Backup skipped: a backup was just taken ({timestamp}).")
+        return None
+    started = time.perf_counter()
     latest_full = get_latest_full_backup(backup_dir)
     
     # Logic: If no full backup exists, or the last full is > 24 hours old, make a new full.
@@ -98,31 +299,24 @@ def create_db_backup(db_path='db/noc_data.db', backup_dir='backups'):
         if (datetime.now().timestamp() - full_mtime) < (24 * 60 * 60):
             should_do_full = False
 
+    # Holding the lock, any snapshot still on disk was left by a crashed run
+    for stale in glob.glob(os.path.join(backup_dir, f"{SNAPSHOT_PREFIX}*tmp.db")):
+        os.remove(stale)
+    fd, snapshot_path = tempfile.mkstemp(prefix=SNAPSHOT_PREFIX, suffix=".tmp.db", dir=backup_dir)
+    os.close(fd)
     try:
+        snapshot_db(db_path, snapshot_path)
+        snapshot_seconds = time.perf_counter() - started
         if should_do_full:
-            result_path = create_full_backup(db_path, backup_dir, timestamp)
+            result_path = create_full_backup(snapshot_path, backup_dir, timestamp)
         else:
-            result_path = create_patch_backup(db_path, latest_full, backup_dir, timestamp)
+            result_path = create_patch_backup(snapshot_path, latest_full, backup_dir, timestamp)
+        print(f"Backup took {time.perf_counter() - started:.2f}s (snapshot {snapshot_seconds:.2f}s), "
+              f"{os.path.getsize(result_path) / 1024:.0f} KB written.")
             
         # Cleanup old backups
         cutoff = datetime.now().timestamp() - (RETENTION_DAYS * 24 * 60 * 60)
-        
-        # New patterns
-        patterns = [
-            f"{FULL_BACKUP_PREFIX}*",
-            f"{PATCH_BACKUP_PREFIX}*",
-            "noc_data_backup_*.db" # Old full-backup format
-        ]
-        
-        all_backups = []
-        for p in patterns:
-            all_backups += glob.glob(os.path.join(backup_dir, p))
-        
-        removed_count = 0
-        for b in all_backups:
-            if os.path.exists(b) and os.path.getmtime(b) < cutoff:
-                os.remove(b)
-                removed_count += 1
+        removed_count = cleanup_old_backups(backup_dir, cutoff)
         
         if removed_count > 0:
             print(f"Cleaned up {removed_count} old backups.")
@@ -133,6 +327,9 @@ def create_db_backup(db_path='db/noc_data.db', backup_dir='backups'):
         import traceback
         traceback.print_exc()
         return None
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
 
 if __name__ == "__main__":
     # Attempt to use path from config if it exists
@@ -0,0 +1,160 @@
+r"""
+check_batch_writer.py
+
+Usage (from project root):
+  venv\Scripts\python.exe tools/check_batch_writer.py
+
+Exercises firestore_lib.BatchWriter against a small in-process fake Firestore
+(collection / document / batch / commit), so batching can be checked without
+credentials or the emulator:
+  - 500-operation batch boundary, and groups never split across batches
+  - a transient commit failure that is retried
+  - a commit that keeps failing: close() raises BatchWriteError
+Exits non-zero if any check fails.
+"""
+import os
+import sys
+import threading
+
+# Change working directory to project root to ensure relative paths (like db/noc_data.db) work correctly
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(project_root)
+sys.path.append(project_root)
+
+from firestore_lib import BatchWriter, BatchWriteError, MAX_BATCH_WRITES
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self.db, f"{self.path}/{name}")
+
+    def set(self, data, merge=True):
+        self.db._apply([("set", self, data, merge)])
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def document(self, doc_id):
+        return FakeDocument(self.db, f"{self.path}/{doc_id}")
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, doc_ref, data, merge=True):
+        self.ops.append(("set", doc_ref, data, merge))
+
+    def delete(self, doc_ref):
+        self.ops.append(("delete", doc_ref, None, None))
+
+    def commit(self):
+        if len(self.ops) > MAX_BATCH_WRITES:
+            raise ValueError(f"Batch of {len(self.ops)} writes exceeds {MAX_BATCH_WRITES}")
+        self.db._commit(self.ops)
+
+class FakeFirestore:
+    """
+    Keeps documents in a dict keyed by path. fail_commits makes the next N
+    commits raise; fail_when(ops) can fail specific batches every time.
+    """
+    def __init__(self, fail_commits=0, fail_when=None):
+        self.lock = threading.Lock()
+        self.docs = {}
+        self.batch_sizes = []
+        self.fail_commits = fail_commits
+        self.fail_when = fail_when
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def _commit(self, ops):
+        with self.lock:
+            if self.fail_commits > 0:
+                self.fail_commits -= 1
+                raise ConnectionError("Simulated transient commit failure")
+        if self.fail_when and self.fail_when(ops):
+            raise ConnectionError("Simulated commit failure")
+        self._apply(ops)
+
+    def _apply(self, ops):
+        with self.lock:
+            self.batch_sizes.append(len(ops))
+            for kind, doc_ref, data, merge in ops:
+                if kind == "delete":
+                    self.docs.pop(doc_ref.path, None)
+                elif merge:
+                    self.docs.setdefault(doc_ref.path, {}).update(data)
+                else:
+                    self.docs[doc_ref.path] = dict(data)
+
+def check(name, ok, detail=""):
+    print(f"[{'PASS' if ok else 'FAIL'}] {name}{': ' + detail if detail and not ok else ''}")
+    return ok
+
+def check_batch_boundary():
+    db = FakeFirestore()
+    writer = BatchWriter(db, label="Boundary")
+    day = db.collection("daily_flights").document("2026-01-01")
+    for i in range(MAX_BATCH_WRITES + 1):
+        writer.set(day.collection("flights").document(str(i)), {"n": i})
+    stats = writer.close(report=False)
+    return check("501 writes commit as 500 + 1", sorted(db.batch_sizes) == [1, MAX_BATCH_WRITES] and stats["writes"] == MAX_BATCH_WRITES + 1,
+                 f"batches {db.batch_sizes}, stats {stats}")
+
+def check_group_not_split():
+    db = FakeFirestore()
+    writer = BatchWriter(db, label="Groups")
+    day = db.collection("daily_flights").document("2026-01-02")
+    for i in range(MAX_BATCH_WRITES - 2):
+        writer.set(day.collection("flights").document(str(i)), {"n": i})
+    # Would straddle the boundary: must go to the next batch whole
+    writer.set_group([(day.collection("chunks").document(str(i)), {"data": b"x"}) for i in range(5)])
+    writer.close(report=False)
+    return check("group crossing the boundary starts a new batch", sorted(db.batch_sizes) == [5, MAX_BATCH_WRITES - 2],
+                 f"batches {db.batch_sizes}")
+
+def check_transient_failure():
+    db = FakeFirestore(fail_commits=1)
+    writer = BatchWriter(db, max_retries=2, label="Transient")
+    writer.set(db.collection("app_metadata").document("k"), {"value": "v"})
+    stats = writer.close(report=False)
+    return check("transient commit failure is retried", stats["retries"] == 1 and stats["failed_writes"] == 0
+                 and db.docs.get("app_metadata/k") == {"value": "v"}, f"stats {stats}")
+
+def check_failed_commit_raises():
+    db = FakeFirestore(fail_when=lambda ops: any(op[1].id == "bad" for op in ops))
+    writer = BatchWriter(db, max_retries=0, label="Failing")
+    writer.set(db.collection("app_metadata").document("bad"), {"value": "v"})
+    try:
+        writer.close(report=False)
+    except BatchWriteError as e:
+        return check("failed commit raises BatchWriteError from close()", e.stats["failed_writes"] == 1, f"stats {e.stats}")
+    return check("failed commit raises BatchWriteError from close()", False, "close() returned normally")
+
+def check_failed_commit_reported():
+    db = FakeFirestore(fail_when=lambda ops: True)
+    writer = BatchWriter(db, max_retries=0, label="Failing")
+    writer.set(db.collection("app_metadata").document("k"), {"value": "v"})
+    stats = writer.close(report=False, raise_on_error=False)
+    return check("raise_on_error=False returns the failed count", stats["failed_writes"] == 1, f"stats {stats}")
+
+if __name__ == "__main__":
+    results = [
+        check_batch_boundary(),
+        check_group_not_split(),
+        check_transient_failure(),
+        check_failed_commit_raises(),
+        check_failed_commit_reported(),
+    ]
+    print(f"{sum(results)}/{len(results)} checks passed.")
+    sys.exit(0 if all(results) else 1)
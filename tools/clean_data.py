@@ -32,6 +32,10 @@ def clean_date_data(date_str):
         f_ids = [f.id for f in flights]
         print(f"Found {len(flights)} flights for {date_str}. Cleaning up...")
         
+        # Cached roster days of the crew on these flights are recomputed after the delete
+        touched_roster_days = {(row.crew_id, dt.date()) for row in session.execute(
+            flight_crew_association.select().where(flight_crew_association.c.flight_id.in_(f_ids))).fetchall()}
+
         # Delete associations
         session.execute(flight_crew_association.delete().where(flight_crew_association.c.flight_id.in_(f_ids)))
         
@@ -48,6 +52,9 @@ def clean_date_data(date_str):
         print(f"Reset Sync Status for {date_str}.")
     
     session.commit()
+    if flights:
+        from roster_engine import refresh_roster_days
+        refresh_roster_days(session, touched_roster_days)
     session.close()
     print(f"Cleanup complete for {date_str}. You can now re-scrape this day.")
 
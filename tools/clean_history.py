@@ -46,6 +46,9 @@ if ids_to_delete:
     count = session.query(FlightHistory).filter(FlightHistory.id.in_(ids_to_delete)).delete(synchronize_session=False)
     session.commit()
     print(f"Successfully deleted {count} history records.")
+    # Cached rosters use history to show crew removed from a flight; rebuild them lazily
+    from roster_engine import clear_roster_cache
+    print(f"Cleared {clear_roster_cache(session)} cached roster months.")
 else:
     print("No records to delete.")
 
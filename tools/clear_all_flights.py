@@ -67,6 +67,16 @@ def main():
     session.commit()
     print("   ✓ Flights deleted")
     
+    from roster_engine import clear_roster_cache
+    clear_roster_cache(session)
+    print("   ✓ Roster cache cleared")
+    
+    # Pending cloud deltas refer to flights that no longer exist
+    from database import CloudOutbox
+    session.query(CloudOutbox).delete()
+    session.commit()
+    print("   ✓ Cloud outbox cleared")
+    
     print(f"   Deleting {sync_status_count} sync status records...")
     session.query(DailySyncStatus).delete()
     session.commit()
@@ -83,38 +93,19 @@ def main():
     if cloud_enabled:
         print("\n2. Clearing Firestore...")
         try:
-            from firestore_lib import get_db
+            from firestore_lib import get_db, delete_collection
             db = get_db()
             
             if not db:
                 print("   ⚠ Could not connect to Firestore")
             else:
-                # Delete all daily_flights documents
-                daily_flights_ref = db.collection('daily_flights')
-                docs = list(daily_flights_ref.stream())
-                
-                if len(docs) == 0:
+                # Recursive bulk delete: day docs plus their flights/chunks subcollections
+                print("   Deleting daily_flights documents (including subcollections)...")
+                deleted_count = delete_collection('daily_flights')
+                if deleted_count == 0:
                     print("   ℹ No daily_flights documents in Firestore")
                 else:
-                    deleted_count = 0
-                    total_docs = len(docs)
-                    
-                    print(f"   Deleting {total_docs} daily_flights documents...")
-                    
-                    # Delete individually to avoid transaction size limits
-                    # (each daily_flights doc can be very large - contains all flights for a day)
-                    for i, doc in enumerate(docs, 1):
-                        try:
-                            doc.reference.delete()
-                            deleted_count += 1
-                            
-                            # Progress update every 10 documents
-                            if deleted_count % 10 == 0 or deleted_count == total_docs:
-                                print(f"   Progress: {deleted_count}/{total_docs} documents deleted")
-                        except Exception as e:
-                            print(f"   ⚠ Error deleting document {doc.id}: {e}")
-                    
-                    print(f"   ✓ Deleted {deleted_count} total daily_flights documents from Firestore")
+                    print(f"   ✓ Deleted {deleted_count} total documents from Firestore")
                 
                 # Update metadata
                 from firestore_lib import upload_metadata
@@ -0,0 +1,87 @@
+r"""
+export_rosters.py
+
+Usage (from project root):
+  venv\Scripts\python.exe tools/export_rosters.py --year 2026 --month 3 --base IAD
+  venv\Scripts\python.exe tools/export_rosters.py --year 2026 --month 3 --employee-ids 12345 23456 34567
+  venv\Scripts\python.exe tools/export_rosters.py --year 2026 --month 3 --employee-file crew.txt --workers 4
+
+Renders monthly roster PDFs for a list of employees, or for everyone who flew
+from a base during the bid period, and bundles them into a single zip file.
+A per-PDF timing breakdown is printed at the end (and saved as CSV with --timings-csv).
+"""
+import os
+import sys
+import csv
+import argparse
+
+# Change working directory to project root to ensure relative paths (like db/noc_data.db) work correctly
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(project_root)
+sys.path.append(project_root)
+
+from database import get_session, init_db
+from roster_export import export_roster_batch, crews_for_base, crews_for_employee_ids
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch export monthly roster PDFs to a zip file.")
+    parser.add_argument("--year", type=int, required=True, help="Roster year.")
+    parser.add_argument("--month", type=int, required=True, help="Roster month (1-12).")
+    parser.add_argument("--base", help="Export everyone who flew from this base (e.g. IAD) in the bid period.")
+    parser.add_argument("--employee-ids", nargs="*", default=[], help="Employee IDs to export.")
+    parser.add_argument("--employee-file", help="Text file with one employee ID per line.")
+    parser.add_argument("--output", help="Output zip path (default: Rosters_<selection>_<YYYY>_<MM>.zip).")
+    parser.add_argument("--workers", type=int, default=None, help="Number of render processes (default: CPU count).")
+    parser.add_argument("--timings-csv", help="Optional path to write the per-PDF timing breakdown as CSV.")
+    args = parser.parse_args()
+
+    employee_ids = list(args.employee_ids)
+    if args.employee_file:
+        with open(args.employee_file, "r", encoding="utf-8") as f:
+            employee_ids += [line.strip() for line in f if line.strip()]
+
+    if not args.base and not employee_ids:
+        parser.error("Provide --base and/or --employee-ids/--employee-file.")
+
+    init_db()
+    session = get_session()
+    try:
+        crews = []
+        if args.base:
+            crews += crews_for_base(session, args.base.upper(), args.year, args.month)
+        if employee_ids:
+            known = {c.id for c in crews}
+            crews += [c for c in crews_for_employee_ids(session, employee_ids) if c.id not in known]
+
+        if not crews:
+            print("No matching crew members found. Nothing to export.")
+            return
+
+        selection = args.base.upper() if args.base else "CrewList"
+        output = args.output or f"Rosters_{selection}_{args.year}_{args.month:02d}.zip"
+        print(f"Exporting {len(crews)} rosters to {output}...")
+
+        def report(done, total, file_name):
+            if done % 25 == 0 or done == total:
+                print(f"  Progress: {done}/{total} PDFs rendered")
+
+        _, timings = export_roster_batch(session, crews, args.year, args.month, output_path=output, max_workers=args.workers, progress_callback=report)
+
+        print("\nPer-PDF timing breakdown (slowest first):")
+        print(f"  {'File':<40} {'Legs':>5} {'Fetch avg':>9} {'Render s':>9} {'Zip s':>7} {'KB':>7}")
+        for t in sorted(timings, key=lambda x: x["render_s"], reverse=True):
+            print(f"  {t['file']:<40} {t['legs']:>5} {t['fetch_avg_s']:>9.3f} {t['render_s']:>9.3f} {t['zip_s']:>7.3f} {t['kb']:>7.1f}")
+
+        if args.timings_csv:
+            with open(args.timings_csv, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=["file", "legs", "fetch_avg_s", "render_s", "zip_s", "kb"])
+                writer.writeheader()
+                writer.writerows(timings)
+            print(f"Timing breakdown saved to {args.timings_csv}")
+
+        print(f"\nDone. {len(timings)} rosters written to {output}")
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    main()
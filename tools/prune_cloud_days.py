@@ -0,0 +1,57 @@
+r"""
+prune_cloud_days.py
+
+Usage (from project root):
+  venv\Scripts\python.exe tools/prune_cloud_days.py --days 400 --dry-run
+  venv\Scripts\python.exe tools/prune_cloud_days.py --days 400 --yes
+
+Cloud retention job: deletes Firestore daily_flights days older than N days,
+including their 'flights' / 'chunks' subcollections, in concurrent batches.
+The local database is not touched.
+"""
+import os
+import sys
+import argparse
+
+# Change working directory to project root to ensure relative paths (like db/noc_data.db) work correctly
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(project_root)
+sys.path.append(project_root)
+
+from config import ENABLE_CLOUD_SYNC
+from database import get_session, get_metadata
+from firestore_lib import set_cloud_sync_enabled, is_cloud_sync_enabled, prune_cloud_days_older_than
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete Firestore flight days older than N days.")
+    parser.add_argument("--days", type=int, required=True, help="Keep this many most recent days in the cloud.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent tree walkers / batch commits (default: 8).")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the days that would be deleted.")
+    parser.add_argument("--yes", action="store_true", help="Skip the confirmation prompt.")
+    args = parser.parse_args()
+
+    # Same preference order as the app: UI toggle first, then .env
+    session = get_session()
+    db_cloud_sync = get_metadata(session, "ui_enable_cloud_sync")
+    session.close()
+    set_cloud_sync_enabled(db_cloud_sync.lower() == 'true' if db_cloud_sync is not None else ENABLE_CLOUD_SYNC)
+    if not is_cloud_sync_enabled():
+        print("Cloud sync is disabled; nothing to prune.")
+        return
+
+    old_days, _ = prune_cloud_days_older_than(args.days, dry_run=True)
+    if not old_days:
+        print(f"No cloud days older than {args.days} days.")
+        return
+    print(f"{len(old_days)} cloud days older than {args.days} days ({old_days[0]} .. {old_days[-1]}).")
+    if args.dry_run:
+        return
+    if not args.yes and input("Delete them from Firestore? (yes/no): ").lower() != "yes":
+        print("Canceled - no changes made.")
+        return
+
+    pruned, deleted = prune_cloud_days_older_than(args.days, max_workers=args.workers)
+    print(f"Pruned {len(pruned)} days ({deleted} documents).")
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,214 @@
 import os
 import gzip
+import time
+import zlib
+import glob
 import struct
 import shutil
+import sqlite3
 import sys
 
+# Add parent dir to path so the backup format can be shared when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.backup_db import FULL_BACKUP_PREFIX, PATCH_BACKUP_PREFIX, read_patch_index, backup_timestamp
+
 CHUNK_SIZE = 4096
 
-def restore_db(patch_path, output_db_path='noc_data_restored.db'):
-    """Reconstructs the database from a patch file and its base full backup."""
+def resolve_chain(backup_path):
+    """
+    [(path, index)] from the FULL backup up to backup_path, following each
+    patch's parent link. index is None for the FULL backup.
+    """
+    backup_dir = os.path.dirname(backup_path)
+    chain = []
+    path = backup_path
+    while not os.path.basename(path).startswith(FULL_BACKUP_PREFIX):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Backup {os.path.basename(path)} in the chain is missing")
+        index = read_patch_index(path)
+        chain.append((path, index))
+        path = os.path.join(backup_dir, index[0]["parent"])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Base full backup not found at {path}")
+    chain.append((path, None))
+    chain.reverse()
+    return chain
+
+def list_restore_points(backup_dir):
+    """Every FULL backup and patch, oldest first; each one is a snapshot that can be restored."""
+    files = glob.glob(os.path.join(backup_dir, f"{FULL_BACKUP_PREFIX}*.db.gz")) + \
+        glob.glob(os.path.join(backup_dir, f"{PATCH_BACKUP_PREFIX}*"))
+    return sorted(files, key=lambda f: (backup_timestamp(f), not os.path.basename(f).startswith(FULL_BACKUP_PREFIX)))
+
+def find_restore_point(backup_dir, at):
+    """
+    Newest snapshot taken at or before `at` ('YYYYmmdd_HHMMSS', or a prefix such as
+    'YYYYmmdd' or 'YYYYmmdd_HH'). Compared as digits only, so a prefix covers the
+    whole day/hour it names.
+    """
+    limit = "".join(ch for ch in at if ch.isdigit()).ljust(14, "9")
+    candidates = [f for f in list_restore_points(backup_dir) if backup_timestamp(f).replace("_", "") <= limit]
+    return candidates[-1] if candidates else None
+
+def verify_db(db_path):
+    """Runs PRAGMA integrity_check on a restored file. Returns True when SQLite reports 'ok'."""
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        result = [row[0] for row in conn.execute("PRAGMA integrity_check").fetchall()]
+    finally:
+        conn.close()
+    ok = result == ["ok"]
+    print(f"Integrity check: {'ok' if ok else '; '.join(result[:10])} ({time.perf_counter() - started:.2f}s)")
+    return ok
+
+def _clear_sidecars(db_path):
+    # A leftover -wal next to the output would be replayed over the restored pages
+    for suffix in ("-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+def _decompress_full(full_backup_path, output_db_path):
+    with gzip.open(full_backup_path, 'rb') as f_base:
+        with open(output_db_path, 'wb') as f_out:
+            shutil.copyfileobj(f_base, f_out)
+
+def _restore_legacy_patch(patch_path, output_db_path):
+    """Patches from before the chain format: gzip, every changed page relative to the FULL backup."""
+    backup_dir = os.path.dirname(patch_path)
+    with gzip.open(patch_path, 'rb') as f_patch:
+        # 1. Read Header (Reference Full Backup Name)
+        header_len_data = f_patch.read(4)
+        if not header_len_data:
+            print("Error: Invalid patch file header.")
+            return False
+        header_len = struct.unpack("<I", header_len_data)[0]
+        ref_name = f_patch.read(header_len).decode('utf-8')
+
+        full_backup_path = os.path.join(backup_dir, ref_name)
+        if not os.path.exists(full_backup_path):
+            print(f"Error: Base full backup not found at {full_backup_path}")
+            return False
+
+        print(f"Restoring from: {ref_name}")
+        print("Decompressing base backup...")
+        _decompress_full(full_backup_path, output_db_path)
+
+        # 2. Apply Patches
+        print("Applying patches...")
+        applied_count = 0
+        with open(output_db_path, 'r+b') as f_out:
+            while True:
+                offset_data = f_patch.read(8)
+                if not offset_data:
+                    break
+
+                offset = struct.unpack("<Q", offset_data)[0]
+                page_data = f_patch.read(CHUNK_SIZE)
+
+                f_out.seek(offset)
+                f_out.write(page_data)
+                applied_count += 1
+    print(f"Applied {applied_count} changed pages.")
+    return True
+
+def _restore_chain(backup_path, output_db_path):
+    t0 = time.perf_counter()
+    chain = resolve_chain(backup_path)
+    full_backup_path = chain[0][0]
+    patches = chain[1:]
+
+    # Newest patch first: the first version of a page we meet is the one to keep
+    newest = {}
+    for path, (header, index, data_start) in reversed(patches):
+        for page_no, offset, length in index:
+            if page_no not in newest:
+                newest[page_no] = (path, data_start + offset, length)
+    total_pages = sum(len(index) for _, (_, index, _) in patches)
+    t1 = time.perf_counter()
+    print(f"Restoring from: {os.path.basename(full_backup_path)} + {len(patches)} patches "
+          f"({total_pages} page versions, {len(newest)} distinct pages) [index {t1 - t0:.2f}s]")
+
+    print("Decompressing base backup...")
+    _decompress_full(full_backup_path, output_db_path)
+    t2 = time.perf_counter()
+
+    print("Applying newest page versions...")
+    handles = {}
+    try:
+        with open(output_db_path, 'r+b') as f_out:
+            # Page order keeps the output writes sequential
+            for page_no in sorted(newest):
+                path, offset, length = newest[page_no]
+                f_patch = handles.get(path) or handles.setdefault(path, open(path, 'rb'))
+                f_patch.seek(offset)
+                f_out.seek(page_no * CHUNK_SIZE)
+                f_out.write(zlib.decompress(f_patch.read(length)))
+            if patches:
+                # The target snapshot may be smaller than the base (VACUUM)
+                f_out.truncate(patches[-1][1][0]["db_size"])
+    finally:
+        for f in handles.values():
+            f.close()
+    t3 = time.perf_counter()
+    print(f"Applied {len(newest)} pages [decompress {t2 - t1:.2f}s, apply {t3 - t2:.2f}s]")
+    return True
+
+def restore_db(patch_path, output_db_path='noc_data_restored.db', verify=True):
+    """
+    Reconstructs the database as it was when `patch_path` was taken. Accepts a
+    FULL backup, a chained patch (point-in-time restore to that snapshot) or a
+    legacy differential patch. Returns True on success.
+    """
     if not os.path.exists(patch_path):
         print(f"Error: Patch file {patch_path} not found.")
-        return
+        return False
 
-    backup_dir = os.path.dirname(patch_path)
-    
+    started = time.perf_counter()
+    print(f"Target: {output_db_path}")
     try:
-        with gzip.open(patch_path, 'rb') as f_patch:
-            # 1. Read Header (Reference Full Backup Name)
-            header_len_data = f_patch.read(4)
-            if not header_len_data:
-                 print("Error: Invalid patch file header.")
-                 return
-            header_len = struct.unpack("<I", header_len_data)[0]
-            ref_name = f_patch.read(header_len).decode('utf-8')
-            
-            full_backup_path = os.path.join(backup_dir, ref_name)
-            if not os.path.exists(full_backup_path):
-                 print(f"Error: Base full backup not found at {full_backup_path}")
-                 return
-            
-            print(f"Restoring from: {ref_name}")
-            print(f"Target: {output_db_path}")
-            
-            # 2. Decompress FULL backup to output file
-            print("Decompressing base backup...")
-            with gzip.open(full_backup_path, 'rb') as f_base:
-                with open(output_db_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_base, f_out)
-            
-            # 3. Apply Patches
-            print("Applying patches...")
-            applied_count = 0
-            with open(output_db_path, 'r+b') as f_out:
-                while True:
-                    offset_data = f_patch.read(8)
-                    if not offset_data:
-                        break
-                    
-                    offset = struct.unpack("<Q", offset_data)[0]
-                    page_data = f_patch.read(CHUNK_SIZE)
-                    
-                    f_out.seek(offset)
-                    f_out.write(page_data)
-                    applied_count += 1
-            
-            print(f"Successfully restored! Applied {applied_count} changed pages.")
-            print(f"Restored file size: {os.path.getsize(output_db_path) / (1024*1024):.2f} MB")
+        _clear_sidecars(output_db_path)
+        if os.path.basename(patch_path).startswith(FULL_BACKUP_PREFIX):
+            print(f"Restoring from: {os.path.basename(patch_path)}")
+            _decompress_full(patch_path, output_db_path)
+            ok = True
+        elif read_patch_index(patch_path) is None:
+            ok = _restore_legacy_patch(patch_path, output_db_path)
+        else:
+            ok = _restore_chain(patch_path, output_db_path)
+        if not ok:
+            return False
+
+        print(f"Successfully restored in {time.perf_counter() - started:.2f}s!")
+        print(f"Restored file size: {os.path.getsize(output_db_path) / (1024*1024):.2f} MB")
+        if verify:
+            return verify_db(output_db_path)
+        return True
 
     except Exception as e:
         print(f"Restore failed: {e}")
         import traceback
         traceback.print_exc()
+        return False
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python tools/restore_db.py <path_to_patch_file> [output_db_path]")
+        print("Usage: python tools/restore_db.py <backup_file> [output_db_path]")
+        print("       python tools/restore_db.py --at <YYYYmmdd_HHMMSS> [output_db_path] [backup_dir]")
+        print("       python tools/restore_db.py --list [backup_dir]")
+    elif sys.argv[1] == "--list":
+        backup_dir = sys.argv[2] if len(sys.argv) > 2 else 'backups'
+        for f in list_restore_points(backup_dir):
+            print(f"{backup_timestamp(f)}  {os.path.basename(f)}  {os.path.getsize(f) / 1024:.0f} KB")
+    elif sys.argv[1] == "--at":
+        at = sys.argv[2]
+        out = sys.argv[3] if len(sys.argv) > 3 else 'noc_data_restored.db'
+        backup_dir = sys.argv[4] if len(sys.argv) > 4 else 'backups'
+        point = find_restore_point(backup_dir, at)
+        if not point:
+            print(f"Error: No backup taken at or before {at} in {backup_dir}.")
+        else:
+            restore_db(point, out)
     else:
         patch = sys.argv[1]
         out = sys.argv[2] if len(sys.argv) > 2 else 'noc_data_restored.db'
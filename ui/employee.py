@@ -2,10 +2,40 @@
 import streamlit as st
 import pandas as pd
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 from database import get_session, Flight, CrewMember, IOEAssignment, ScheduledFlight, flight_crew_association, FlightHistory
-from sqlalchemy import desc, or_
-from bid_periods import get_bid_period_from_date
+from sqlalchemy import desc, or_, extract
+from bid_periods import get_bid_period_from_date, get_bid_period_date_range
+from crew_search import get_crew_index
+
+def _distinct_days(query):
+    days = set()
+    for y, m, d in query.distinct().all():
+        if y is not None:
+            days.add(date(int(y), int(m), int(d)))
+    return days
+
+def get_employee_bid_periods(session, crew_id_pk, employee_id):
+    """
+    Returns the (year, month) bid periods an employee flew or had IOE assignments in,
+    newest first. Aggregates distinct days in SQL over the indexed crew and IOE
+    columns; periods holding only removals stay reachable through "All History",
+    so the changes_json text is never scanned here.
+    """
+    day_cols = lambda col: (extract('year', col), extract('month', col), extract('day', col))
+    days = set()
+    if crew_id_pk:
+        days |= _distinct_days(
+            session.query(*day_cols(Flight.date))
+            .join(flight_crew_association, Flight.id == flight_crew_association.c.flight_id)
+            .filter(flight_crew_association.c.crew_id == crew_id_pk)
+        )
+    if employee_id:
+        days |= _distinct_days(
+            session.query(*day_cols(IOEAssignment.start_date))
+            .filter(IOEAssignment.employee_id == employee_id)
+        )
+    return sorted({get_bid_period_from_date(d) for d in days}, reverse=True)
 
 def render_employee_tab():
     st.header("👤 Employee History Search")
@@ -13,7 +43,7 @@ def render_employee_tab():
     # --- Search Interface ---
     # Check for deep link or session persistence
     default_search = st.session_state.get("employee_search_id", "")
-    default_month = st.session_state.get("employee_search_month", "All History")
+    default_month = st.session_state.get("employee_search_month")
     
     # If we have a default search, we might want to auto-run
     # But streamlit's text_input works best if we just set value
@@ -28,22 +58,24 @@ def render_employee_tab():
 
     session = get_session()
     
-    # Search logic: Exact match on ID or partial match on Name
-    crew_members = session.query(CrewMember).filter(
-        or_(
-            CrewMember.employee_id == search_term,
-            CrewMember.name.ilike(f"%{search_term}%")
-        )
-    ).all()
+    # Search logic: ranked fuzzy match on partial name or ID via the in-memory crew index
+    ranked = get_crew_index(session).search_scored(search_term, limit=25)
+    if ranked and ranked[0][1] >= 3.0:
+        # Exact employee ID hit
+        ranked = ranked[:1]
+    crew_members = []
+    if ranked:
+        by_pk = {c.id: c for c in session.query(CrewMember).filter(CrewMember.id.in_([pk for pk, _ in ranked])).all()}
+        crew_members = [by_pk[pk] for pk, _ in ranked if pk in by_pk]
     
     selected_crew = None
     if crew_members:
         if len(crew_members) > 1:
             st.info(f"Multiple matches found for '{search_term}'. Select one to view history:")
             options = {f"{c.name} ({c.employee_id})": c for c in crew_members}
-            # Sort by name
-            sorted_labels = sorted(options.keys())
-            choice = st.radio("Select Employee", sorted_labels, label_visibility="collapsed")
+            # Best matches first
+            ranked_labels = list(options.keys())
+            choice = st.radio("Select Employee", ranked_labels, label_visibility="collapsed")
             selected_crew = options[choice]
         else:
             selected_crew = crew_members[0]
@@ -72,36 +104,63 @@ def render_employee_tab():
         
     st.subheader(f"History for: {employee_name}")
     
-    # --- Data Fetching (Pre-Filter) ---
+    # --- Month Options (lightweight aggregate) ---
+    sorted_months = [
+        date(y, m, 1).strftime("%B %Y")
+        for y, m in get_employee_bid_periods(session, crew_id_pk, employee_id)
+    ]
+    
+    # --- Filter UI ---
+    filter_opts = ["All History"] + sorted_months
+    
+    # Resolve default index: deep-linked month, otherwise the most recent bid period
+    sel_idx = 1 if sorted_months else 0
+    if default_month in filter_opts:
+        sel_idx = filter_opts.index(default_month)
+
+    # Show filter below header
+    row_filt_1, row_filt_2 = st.columns([1, 3])
+    with row_filt_1:
+        selected_month = st.selectbox("📅 Filter by Month", filter_opts, index=sel_idx)
+
+    # --- Data Fetching (selected bid period only) ---
+    period_start = period_end = None
+    if selected_month != "All History":
+        sel_dt = datetime.strptime(selected_month, "%B %Y")
+        p_start, p_end = get_bid_period_date_range(sel_dt.year, sel_dt.month)
+        period_start = datetime.combine(p_start, datetime.min.time())
+        period_end = datetime.combine(p_end, datetime.min.time()) + timedelta(days=1)
     
-    # 1. Fetch ALL Flown
-    flown_all = []
+    # 1. Flown
+    flown_filtered = []
     if crew_id_pk:
         stmt = session.query(Flight, flight_crew_association.c.role, flight_crew_association.c.flags)\
             .join(flight_crew_association, Flight.id == flight_crew_association.c.flight_id)\
-            .filter(flight_crew_association.c.crew_id == crew_id_pk)\
-            .order_by(desc(Flight.date))
-        flown_all = stmt.all()
+            .filter(flight_crew_association.c.crew_id == crew_id_pk)
+        if period_start:
+            stmt = stmt.filter(Flight.date >= period_start, Flight.date < period_end)
+        flown_filtered = stmt.order_by(desc(Flight.date)).all()
         
-    # 2. Fetch ALL Assignments
-    assignments_all = []
+    # 2. Assignments
+    assignments_filtered = []
     if employee_id:
-        assignments_all = session.query(IOEAssignment).filter(
-            IOEAssignment.employee_id == employee_id
-        ).order_by(desc(IOEAssignment.start_date)).all()
+        stmt = session.query(IOEAssignment).filter(IOEAssignment.employee_id == employee_id)
+        if period_start:
+            stmt = stmt.filter(IOEAssignment.start_date >= period_start, IOEAssignment.start_date < period_end)
+        assignments_filtered = stmt.order_by(desc(IOEAssignment.start_date)).all()
         
-    # 3. Fetch ALL History (Removals/Changes)
-    history_all = []
+    # 3. History (Removals/Changes)
+    history_filtered = []
     # Search for any history record where the changes_json contains the employee_id
     if employee_id:
-        # We search for the ID as a string in the JSON blob
-        # This is a bit broad but we'll filter in Python
+        # The date range narrows the scan via the flights date index before the LIKE is applied
         hist_stmt = session.query(FlightHistory, Flight.flight_number, Flight.date, Flight.departure_airport, Flight.arrival_airport)\
             .join(Flight, Flight.id == FlightHistory.flight_id)\
-            .filter(FlightHistory.changes_json.like(f"%{employee_id}%"))\
-            .order_by(desc(FlightHistory.timestamp))
+            .filter(FlightHistory.changes_json.like(f"%{employee_id}%"))
+        if period_start:
+            hist_stmt = hist_stmt.filter(Flight.date >= period_start, Flight.date < period_end)
         
-        raw_hist = hist_stmt.all()
+        raw_hist = hist_stmt.order_by(desc(FlightHistory.timestamp)).all()
         
         for h, f_num, f_date, f_dep, f_arr in raw_hist:
             try:
@@ -120,7 +179,7 @@ def render_employee_tab():
                         elif not was_in_old and was_in_new:
                             event_type = "Added"
                             
-                        history_all.append({
+                        history_filtered.append({
                             "timestamp": h.timestamp,
                             "flight_id": h.flight_id,
                             "flight_number": f_num,
@@ -133,68 +192,6 @@ def render_employee_tab():
             except:
                 continue
 
-    # --- Month Extraction ---
-    months_set = set()
-    
-    # From Flown
-    for f, _, _ in flown_all:
-        if f.date:
-            m_str = f.date.strftime("%B %Y")
-            months_set.add(m_str)
-            
-    # From Assigned
-    for a in assignments_all:
-        if a.start_date:
-            m_str = a.start_date.strftime("%B %Y")
-            months_set.add(m_str)
-    
-    # From History
-    for h in history_all:
-        if h["date"]:
-            m_str = h["date"].strftime("%B %Y")
-            months_set.add(m_str)
-            
-    # Sort Months
-    sorted_months = sorted(list(months_set), key=lambda x: datetime.strptime(x, "%B %Y"), reverse=True)
-    
-    # --- Filter UI ---
-    filter_opts = ["All History"] + sorted_months
-    
-    # Resolve default index
-    sel_idx = 0
-    if default_month in filter_opts:
-        sel_idx = filter_opts.index(default_month)
-
-    # Show filter below header
-    row_filt_1, row_filt_2 = st.columns([1, 3])
-    with row_filt_1:
-        selected_month = st.selectbox("📅 Filter by Month", filter_opts, index=sel_idx)
-
-    # --- Filtering Logic ---
-    flown_filtered = []
-    if selected_month == "All History":
-        flown_filtered = flown_all
-    else:
-        for item in flown_all:
-            if item[0].date.strftime("%B %Y") == selected_month:
-                flown_filtered.append(item)
-                
-    assignments_filtered = []
-    if selected_month == "All History":
-        assignments_filtered = assignments_all
-    else:
-        for a in assignments_all:
-            if a.start_date.strftime("%B %Y") == selected_month:
-                assignments_filtered.append(a)
-
-    history_filtered = []
-    if selected_month == "All History":
-        history_filtered = history_all
-    else:
-        for h in history_all:
-            if h["date"].strftime("%B %Y") == selected_month:
-                history_filtered.append(h)
-
     # --- Tabs ---
     tab_flown, tab_assigned, tab_removals = st.tabs(["✅ Flights Flown", "📅 Assigned History", "🚫 Removals & Changes"])
     
@@ -3,16 +3,18 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 from database import get_session, Flight, CrewMember, DailySyncStatus, FlightHistory, flight_crew_association
+from crew_search import get_crew_index
 from sqlalchemy import desc, and_
 import json
+import re
+import html
 
-@st.cache_data(ttl=3600)
 def get_all_crew_cached():
+    # Served from the in-memory crew index; only rows added since the last call are loaded
     session = get_session()
-    # Pull only necessary columns for performance
-    crew = session.query(CrewMember.name, CrewMember.employee_id).order_by(CrewMember.name).all()
+    index = get_crew_index(session)
     session.close()
-    return [{"name": c.name, "id": c.employee_id, "label": f"{c.name} ({c.employee_id})"} for c in crew]
+    return index.all_crew()
 
 @st.cache_data(ttl=3600)
 def get_airports_cached():
@@ -24,6 +26,50 @@ def get_airports_cached():
     all_apts = sorted(list(set([a[0] for a in deps] + [a[0] for a in arrs])))
     return all_apts
 
+def render_text_search():
+    with st.expander("🔎 Search Notes / Pax / Load Text", expanded=bool(st.session_state.get("flight_text_query"))):
+        s_col1, s_col2, s_col3 = st.columns([2, 1, 1])
+        with s_col1:
+            query = st.text_input("Search text", key="flight_text_query", placeholder="e.g. MEL 21-51, DIVERT, WCHR")
+        with s_col2:
+            s_start = st.date_input("From", datetime.today() - timedelta(days=90), key="flight_text_start")
+        with s_col3:
+            s_end = st.date_input("To", datetime.today(), key="flight_text_end")
+
+        if not query:
+            st.caption("Matches all words (append * for a prefix match). Results are ranked by relevance.")
+            return
+
+        from flight_search import search_flight_text
+        session = get_session()
+        results = search_flight_text(
+            session, query,
+            start_date=datetime.combine(s_start, datetime.min.time()),
+            end_date=datetime.combine(s_end, datetime.min.time())
+        )
+        rows = []
+        for r in results:
+            f = r["flight"]
+            # Scraped text is rendered as HTML below, so escape it before adding our own markup
+            f_num = html.escape(f.flight_number[2:] if f.flight_number.startswith("C5") else f.flight_number, quote=True)
+            dep_code = html.escape(f.departure_airport.split(" - ")[0].strip() if f.departure_airport else "", quote=True)
+            arr_code = html.escape(f.arrival_airport.split(" - ")[0].strip() if f.arrival_airport else "")
+            rows.append({
+                "Date": f.date.strftime('%Y-%m-%d'),
+                "Flight": f"<a href='/historical?date={f.date.strftime('%Y-%m-%d')}&flight_num={f_num}&dep={dep_code}' target='_self' style='text-decoration:none; font-weight:bold; color:#60B4FF;'>{f_num}</a>",
+                "Route": f"{dep_code}-{arr_code}",
+                "Tail": html.escape(f.tail_number or "--"),
+                # FTS5 marks hits with ** delimiters
+                "Match": re.sub(r"\*\*(.+?)\*\*", r"<mark>\1</mark>", html.escape(r["snippet"]))
+            })
+        session.close()
+
+        if not rows:
+            st.info(f"No flights mention '{query}' in this date range.")
+        else:
+            st.caption(f"{len(rows)} matching flights")
+            st.markdown(pd.DataFrame(rows).to_html(escape=False, index=False, classes='dataframe'), unsafe_allow_html=True)
+
 def render_historical_tab():
     # Header layout with Date Picker
     h_col1, h_col2 = st.columns([3, 1])
@@ -33,6 +79,8 @@ def render_historical_tab():
         d_val = st.session_state.get("history_date_default", datetime.today())
         view_date = st.date_input("Select Date", d_val, label_visibility="collapsed")
     
+    render_text_search()
+    
     # 2. URL Sync (Deep-linking)
     query_params = st.query_params
     url_flight = query_params.get("flight_num", "")
@@ -4,107 +4,80 @@ import json
 import calendar
 from datetime import datetime, date, timedelta
 from database import get_session, Flight, CrewMember, flight_crew_association, IOEAssignment, ScheduledFlight, FlightHistory
+from crew_search import get_crew_index, crew_index
 from sqlalchemy import extract, and_, or_, desc
-from fpdf import FPDF
+from roster_engine import get_month_roster, build_month_roster, load_days
+from roster_export import generate_roster_pdf, fmt_block
 import io
 
-@st.cache_data(ttl=3600)
 def get_all_crew_cached():
+    # Served from the in-memory crew index; only rows added since the last call are loaded
     session = get_session()
-    # Pull only necessary columns for performance
-    crew = session.query(CrewMember.name, CrewMember.employee_id).order_by(CrewMember.name).all()
+    index = get_crew_index(session)
     session.close()
-    return [{"name": c.name, "id": c.employee_id, "label": f"{c.name} ({c.employee_id})"} for c in crew]
+    return index.all_crew()
 
-def generate_roster_pdf(crew_name, employee_id, month_name, year, days_map, num_days, fmt_block):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("helvetica", 'B', 16)
-    
-    # Header
-    pdf.cell(0, 10, f"Flight Roster: {crew_name} ({employee_id})", ln=True, align='C')
-    pdf.set_font("helvetica", '', 12)
-    pdf.cell(0, 10, f"Period: {month_name} {year}", ln=True, align='C')
-    pdf.ln(5)
-    
-    # Table Header
-    pdf.set_fill_color(200, 220, 255)
-    pdf.set_font("helvetica", 'B', 8)
-    # Adjusted widths to fit 190mm (A4 is 210mm - 20mm margins)
-    cols = [("Day", 18), ("Flight", 18), ("Route", 28), ("Out", 18), ("In", 18), ("Schd Blk", 25), ("Act Blk", 25), ("Tail", 30)]
-    for col_name, width in cols:
-        pdf.cell(width, 10, col_name, 1, 0, 'C', True)
-    pdf.ln()
-    
-    # Data Rows
-    pdf.set_font("helvetica", '', 8)
-    total_act = 0
-    total_sch = 0
-    
-    fill = False
-    for day in range(1, num_days + 1):
-        # Calculate weekday
-        day_date = date(year, list(calendar.month_name).index(month_name), day)
-        weekday = day_date.strftime("%a")
-        day_active = days_map.get(day, [])
-        
-        if not day_active:
-            # Empty day row
-            pdf.set_fill_color(245, 245, 245) if fill else pdf.set_fill_color(255, 255, 255)
-            pdf.set_text_color(150, 150, 150)
-            pdf.cell(18, 8, f"{weekday} {day}", 1, 0, 'C', True)
-            pdf.cell(172, 8, "No active flights", 1, 1, 'L', True)
-            pdf.set_text_color(0, 0, 0)
-            fill = not fill
-            continue
-            
-        def clean_apt(apt_str):
-            if not apt_str: return "??"
-            return str(apt_str).split(' - ')[0]
+@st.cache_data(ttl=3600, max_entries=200)
+def get_roster_pdf_cached(crew_name, employee_id, month_name, year, roster_id, updated_at):
+    # updated_at is part of the cache key so a refreshed roster re-renders the PDF
+    from database import RosterCache
+    session = get_session()
+    roster = session.get(RosterCache, roster_id)
+    days = load_days(roster)
+    session.close()
+    days_map = {day: d["legs"] for day, d in days.items() if d["legs"]}
+    _, num_days = calendar.monthrange(year, list(calendar.month_name).index(month_name))
+    return generate_roster_pdf(crew_name, employee_id, month_name, year, days_map, num_days, fmt_block)
 
-        for i, f in enumerate(day_active):
-            pdf.set_fill_color(245, 245, 245) if fill else pdf.set_fill_color(255, 255, 255)
-            
-            day_str = f"{weekday} {day}" if i == 0 else ""
-            f_num = f.flight_number[2:] if f.flight_number.startswith("C5") else f.flight_number
-            
-            pdf.cell(18, 8, day_str, 1, 0, 'C', True)
-            pdf.cell(18, 8, f_num, 1, 0, 'C', True)
-            route_str = f"{clean_apt(f.departure_airport)}-{clean_apt(f.arrival_airport)}"
-            pdf.cell(28, 8, route_str, 1, 0, 'C', True)
-            pdf.cell(18, 8, f.actual_out.strftime("%H:%M") if f.actual_out else "--", 1, 0, 'C', True)
-            pdf.cell(18, 8, f.actual_in.strftime("%H:%M") if f.actual_in else "--", 1, 0, 'C', True)
-            pdf.cell(25, 8, fmt_block(f.planned_block_minutes), 1, 0, 'C', True)
-            pdf.cell(25, 8, fmt_block(f.actual_block_minutes), 1, 0, 'C', True)
-            pdf.cell(30, 8, f.tail_number or "--", 1, 1, 'C', True)
-            
-            total_act += (f.actual_block_minutes or 0)
-            total_sch += (f.planned_block_minutes or 0)
-        
-        fill = not fill
+def render_batch_export(year, month):
+    with st.expander("📦 Batch Export Rosters (Zip)", expanded=False):
+        mode = st.radio("Export For", ["Base", "Employee List"], horizontal=True, key="batch_roster_mode")
+        if mode == "Base":
+            base = st.selectbox("Base", ["IAD", "IAH"], key="batch_roster_base")
+            ids_text = ""
+        else:
+            base = None
+            ids_text = st.text_area("Employee IDs (one per line or comma separated)", key="batch_roster_ids")
 
-    # Totals Section
-    pdf.ln(5)
-    pdf.set_font("helvetica", 'B', 8)
-    pdf.set_text_color(100, 100, 100)
-    pdf.cell(118, 5, "", 0, 0)
-    pdf.cell(25, 5, "Total Sch", 0, 0, 'C')
-    pdf.cell(25, 5, "Total Act", 0, 1, 'C')
-    
-    pdf.set_text_color(0, 0, 0)
-    pdf.set_font("helvetica", 'B', 10)
-    pdf.cell(118, 10, "MONTHLY SUMMARY", 0, 0, 'R')
-    pdf.cell(25, 10, fmt_block(total_sch), 1, 0, 'C')
-    pdf.cell(25, 10, fmt_block(total_act), 1, 1, 'C')
-    
-    return bytes(pdf.output())
+        if st.button(f"Export {calendar.month_name[month]} {year} Rosters", key="batch_roster_go"):
+            from roster_export import export_roster_batch, crews_for_base, crews_for_employee_ids
+            session = get_session()
+            if base:
+                crews = crews_for_base(session, base, year, month)
+            else:
+                crews = crews_for_employee_ids(session, ids_text.replace(",", "\n").split("\n"))
+
+            if not crews:
+                st.warning("No matching crew members found.")
+                session.close()
+                return
+
+            progress_bar = st.progress(0, text=f"Rendering {len(crews)} rosters...")
+            def report(done, total, file_name):
+                progress_bar.progress(done / total, text=f"Rendered {done}/{total}: {file_name}")
+
+            zip_bytes, timings = export_roster_batch(session, crews, year, month, progress_callback=report)
+            session.close()
+
+            st.session_state["batch_roster_zip"] = zip_bytes
+            st.session_state["batch_roster_timings"] = timings
+            st.session_state["batch_roster_name"] = f"Rosters_{base or 'CrewList'}_{calendar.month_name[month]}_{year}.zip"
+
+        if st.session_state.get("batch_roster_zip"):
+            timings = st.session_state.get("batch_roster_timings", [])
+            st.download_button(
+                label=f"⬇️ Download {len(timings)} Rosters (Zip)",
+                data=st.session_state["batch_roster_zip"],
+                file_name=st.session_state["batch_roster_name"],
+                mime="application/zip",
+                use_container_width=True
+            )
+            if timings:
+                df_t = pd.DataFrame(timings).sort_values("render_s", ascending=False)
+                st.caption(f"Render time: {df_t['render_s'].sum():.2f}s total, {df_t['render_s'].mean():.3f}s avg per PDF")
+                st.dataframe(df_t, hide_index=True, use_container_width=True)
 
 def render_roster_tab():
-    def fmt_block(mins):
-        if mins is None: return "0:00"
-        h = abs(mins) // 60
-        m = abs(mins) % 60
-        return f"{h}:{m:02d}"
     query_params = st.query_params
     
     # Resolve initial date defaults
@@ -130,9 +103,19 @@ def render_roster_tab():
     col_s1, col_s2, col_s3 = st.columns([2, 1, 1])
     
     with col_s1:
+        crew_options = crew_list
+        crew_query = st.text_input("Search Employee", key="roster_crew_query", placeholder="Partial name or employee ID")
+        if crew_query:
+            matches = crew_index.search(crew_query, limit=50)
+            if matches:
+                crew_options = matches
+                if st.session_state.get("roster_crew_selector") not in matches:
+                    st.session_state["roster_crew_selector"] = matches[0]
+            else:
+                st.caption(f"No crew match '{crew_query}'.")
         selected_crew_data = st.selectbox(
             "Select Employee", 
-            crew_list, 
+            crew_options, 
             key="roster_crew_selector",
             format_func=lambda x: x["label"]
         )
@@ -146,6 +129,8 @@ def render_roster_tab():
         selected_month_name = st.selectbox("Month", months, index=d_month - 1)
         selected_month = months.index(selected_month_name) + 1
 
+    render_batch_export(selected_year, selected_month)
+
     if not selected_crew_data:
         st.info("Please select an employee to view their roster and history.")
         return
@@ -169,25 +154,15 @@ def render_roster_tab():
         return
 
     # --- Data Preparation for Schedule & Export ---
-    # Fetch flights CURRENTLY associated with this member in this month
-    current_flights = session.query(Flight).join(flight_crew_association).filter(
-        and_(
-            flight_crew_association.c.crew_id == selected_crew.id,
-            extract('year', Flight.date) == selected_year,
-            extract('month', Flight.date) == selected_month
-        )
-    ).all()
-
-    active_flights = [f for f in current_flights if f.status != "Canceled"]
+    # Precomputed by the roster engine; scrapes keep touched employee-days fresh
+    roster = get_month_roster(session, selected_crew, selected_year, selected_month)
+    cached_days = load_days(roster)
     
-    total_month_sch = sum((f.planned_block_minutes or 0) for f in active_flights)
-    total_month_act = sum((f.actual_block_minutes or 0) for f in active_flights)
+    total_month_sch = roster.scheduled_block_minutes or 0
+    total_month_act = roster.actual_block_minutes or 0
     
     # Group Active by day for both UI and PDF
-    from collections import defaultdict
-    days_map = defaultdict(list)
-    for f in active_flights:
-        days_map[f.date.day].append(f)
+    days_map = {day: d["legs"] for day, d in cached_days.items() if d["legs"]}
 
     _, num_days = calendar.monthrange(selected_year, selected_month)
 
@@ -195,7 +170,7 @@ def render_roster_tab():
     h_col1, h_col2 = st.columns([2.5, 1])
     h_col1.subheader(f"Schedule & History: {selected_crew.name} ({hrId})")
     with h_col2:
-        pdf_bytes = generate_roster_pdf(selected_crew.name, hrId, selected_month_name, selected_year, days_map, num_days, fmt_block)
+        pdf_bytes = get_roster_pdf_cached(selected_crew.name, hrId, selected_month_name, selected_year, roster.id, roster.updated_at)
         st.download_button(
             label="📄 Export Roster to PDF",
             data=pdf_bytes,
@@ -217,48 +192,28 @@ def render_roster_tab():
             st.write(f"Completion: {pct:.1%}")
             st.progress(pct)
 
+    c_col1, c_col2 = st.columns([3, 1])
+    with c_col1:
+        st.caption(f"🚫 {roster.removed_count or 0} removals · ❌ {roster.canceled_count or 0} cancellations this month · Roster cached at {roster.updated_at.strftime('%Y-%m-%d %H:%M')}")
+    with c_col2:
+        if st.button("🔄 Rebuild Roster", use_container_width=True, help="Recompute this month from flights and history."):
+            build_month_roster(session, selected_crew, selected_year, selected_month)
+            session.close()
+            st.rerun()
+
     tab_schedule, tab_audit = st.tabs(["📅 Monthly Schedule", "🚫 Removal Audit"])
 
     # ==========================================
     # TAB 1: MONTHLY SCHEDULE (ACTIVE & RECENT)
     # ==========================================
     with tab_schedule:
-        canceled_flights = [f for f in current_flights if f.status == "Canceled"]
-
-        # Fetch All Month History for Removal Scanning
-        history_query = session.query(FlightHistory, Flight).join(Flight).filter(
-            and_(
-                extract('year', Flight.date) == selected_year,
-                extract('month', Flight.date) == selected_month
-            )
-        ).all()
-
-        removed_flights = []
-        processed_ids = set()
-        for hist, f in history_query:
-            if f.id in [af.id for af in active_flights]: continue
-            try:
-                changes = json.loads(hist.changes_json)
-                if "Crew" in changes:
-                    old_c = changes["Crew"].get("old", [])
-                    new_c = changes["Crew"].get("new", [])
-                    was_in = any(str(c.get("id")) == str(hrId) for c in old_c)
-                    is_in = any(str(c.get("id")) == str(hrId) for c in new_c)
-                    if was_in and not is_in:
-                        if f.id not in processed_ids:
-                            removed_flights.append(f)
-                            processed_ids.add(f.id)
-            except: continue
-
-        # (Logic moved to header for export support)
-
         st.divider()
         for day in range(1, num_days + 1):
             day_date = date(selected_year, selected_month, day)
             day_active = days_map.get(day, [])
             weekday = day_date.strftime("%a")
-            total_active_block = sum((f.actual_block_minutes or 0) for f in day_active)
-            total_scheduled_block = sum((f.planned_block_minutes or 0) for f in day_active)
+            total_active_block = sum((f["actual_block_minutes"] or 0) for f in day_active)
+            total_scheduled_block = sum((f["planned_block_minutes"] or 0) for f in day_active)
             
             label = f"{weekday} {day}"
             if day_active:
@@ -266,17 +221,17 @@ def render_roster_tab():
                  with st.expander(label_styled, expanded=False):
                      flight_rows = []
                      for f in day_active:
-                         f_num = f.flight_number[2:] if f.flight_number.startswith("C5") else f.flight_number
-                         dep_code = f.departure_airport.split(" - ")[0].strip() if f.departure_airport else ""
-                         f_link = f"<a href='/historical?date={f.date.strftime('%Y-%m-%d')}&flight_num={f_num}&dep={dep_code}' target='_self' style='text-decoration:none; font-weight:bold; color:#60B4FF;'>{f_num}</a>"
+                         f_num = f["flight_number"][2:] if f["flight_number"].startswith("C5") else f["flight_number"]
+                         dep_code = f["departure_airport"].split(" - ")[0].strip() if f["departure_airport"] else ""
+                         f_link = f"<a href='/historical?date={f['date']}&flight_num={f_num}&dep={dep_code}' target='_self' style='text-decoration:none; font-weight:bold; color:#60B4FF;'>{f_num}</a>"
                          flight_rows.append({
                              "Flight": f_link,
-                             "Route": f"{f.departure_airport or '??'}-{f.arrival_airport or '??'}",
-                             "Out (L)": f.actual_out.strftime("%H:%M") if f.actual_out else "--",
-                             "In (L)": f.actual_in.strftime("%H:%M") if f.actual_in else "--",
-                             "Schd Blk": fmt_block(f.planned_block_minutes),
-                             "Actual Blk": fmt_block(f.actual_block_minutes),
-                             "Tail": f.tail_number or "--"
+                             "Route": f"{f['departure_airport'] or '??'}-{f['arrival_airport'] or '??'}",
+                             "Out (L)": f["actual_out"] or "--",
+                             "In (L)": f["actual_in"] or "--",
+                             "Schd Blk": fmt_block(f["planned_block_minutes"]),
+                             "Actual Blk": fmt_block(f["actual_block_minutes"]),
+                             "Tail": f["tail_number"] or "--"
                          })
                      st.markdown(pd.DataFrame(flight_rows).to_html(escape=False, index=False, classes='dataframe'), unsafe_allow_html=True)
             else:
@@ -1,9 +1,10 @@
 
 import streamlit as st
-from config import NOC_USERNAME, NOC_PASSWORD, VERSION, SCRAPE_INTERVAL_HOURS, ENABLE_CLOUD_SYNC
+from config import NOC_USERNAME, NOC_PASSWORD, VERSION, SCRAPE_INTERVAL_HOURS, ENABLE_CLOUD_SYNC, CLOUD_COMPACT_ENCODING
 from database import get_session, get_metadata, set_metadata
-from firestore_lib import set_cloud_sync_enabled
+from firestore_lib import set_cloud_sync_enabled, set_compact_encoding_enabled
 from tools.backup_db import create_db_backup
+from scheduler_worker import wake_scheduler
 
 def render_settings_tab():
     st.header("⚙️ Settings")
@@ -120,6 +121,33 @@ def render_settings_tab():
         st.success("✅ Cloud Sync Enabled")
     else:
         st.info("☁️ Cloud Sync is currently disabled.")
+
+    session = get_session()
+    db_compact = get_metadata(session, "ui_cloud_compact_encoding")
+    session.close()
+    initial_compact = CLOUD_COMPACT_ENCODING if db_compact is None else db_compact.lower() == 'true'
+    compact_enabled = st.toggle(
+        "Compact Cloud Encoding", value=initial_compact,
+        help="Store each day's flights as a few compressed columnar documents instead of one document per flight. "
+             "Run a Full Sync after switching so every day in the cloud uses the new format."
+    )
+    if compact_enabled != initial_compact:
+        session = get_session()
+        set_metadata(session, "ui_cloud_compact_encoding", str(compact_enabled).lower())
+        session.close()
+    set_compact_encoding_enabled(compact_enabled)
+
+    session = get_session()
+    current_retention = int(get_metadata(session, "cloud_retention_days") or 0)
+    session.close()
+    new_retention = st.number_input(
+        "Cloud Retention (days, 0 = keep all)", min_value=0, max_value=3650, value=current_retention,
+        help="Once a day the background scheduler deletes cloud flight days older than this. Local data is kept."
+    )
+    if new_retention != current_retention:
+        session = get_session()
+        set_metadata(session, "cloud_retention_days", str(new_retention))
+        session.close()
         
     st.divider()
     st.subheader("Scheduler Config")
@@ -130,28 +158,64 @@ def render_settings_tab():
     
     initial_interval = int(current_interval_db) if current_interval_db else SCRAPE_INTERVAL_HOURS
     
-    new_interval = st.number_input("Scrape Interval (Hours)", min_value=1, max_value=24, value=initial_interval)
+    new_interval = st.number_input(
+        "Scrape Interval (Hours)", min_value=1, max_value=24, value=initial_interval,
+        help="Base refresh interval for dates 2-3 days out. Today and tomorrow refresh faster, later dates slower; dates whose flights change often refresh up to 2x faster."
+    )
     
     current_days_db = get_metadata(session, "scrape_days")
     from config import SCRAPE_DAYS
     initial_days = int(current_days_db) if current_days_db else SCRAPE_DAYS
     new_days = st.number_input("Days to Scrape", min_value=1, max_value=45, value=initial_days)
 
+    from scraper import get_scrape_stations, parse_stations
+    initial_stations = [s for s in get_scrape_stations(session) if s]
+    new_stations = parse_stations(st.text_input(
+        "Stations", value=", ".join(initial_stations),
+        help="Comma-separated station codes (e.g. IAD, IAH) scraped for every date in each sweep. Leave empty to scrape the account's default station."
+    ))
+
     next_scrape = get_metadata(session, "next_scheduled_scrape")
     if next_scrape:
         st.info(f"⏳ **Next Automatic Scrape:** {next_scrape}")
+
+    with st.expander("📅 Refresh Plan", expanded=False):
+        import pandas as pd
+        from scrape_scheduler import ScrapePlanner
+        planner = ScrapePlanner()
+        session = get_session()
+        planner.refresh(session, initial_interval, initial_days, stations=initial_stations)
+        session.close()
+        budget = planner.describe_budget()
+        if budget:
+            st.caption(f"NOC load budget: {budget['budget_per_hour']} scrapes/h (the old sweep of {initial_days} days "
+                       f"every {initial_interval}h, {budget['stations']} station(s)); planned: {budget['planned_per_hour']} scrapes/h "
+                       f"for upcoming dates, plus {budget['past_per_hour']} scrapes/h for the daily refresh of past dates.")
+        st.dataframe(pd.DataFrame(planner.describe()).rename(columns={
+            "date": "Date", "station": "Station", "next_due": "Next Refresh", "interval_minutes": "Interval (min)",
+            "changes_per_flight": "Changes/Flight (24h)", "failures": "Failed Attempts"
+        }), width="stretch", hide_index=True)
     
     if new_interval != initial_interval:
         session = get_session()
         set_metadata(session, "scrape_interval_hours", str(new_interval))
         session.close()
-        st.success(f"Interval Updated! Restart scheduler or app.")
+        wake_scheduler()
+        st.success(f"Interval Updated! The scheduler has re-planned.")
 
     if new_days != initial_days:
         session = get_session()
         set_metadata(session, "scrape_days", str(new_days))
         session.close()
-        st.success(f"Days Updated! Reflected in next background scrape.")
+        wake_scheduler()
+        st.success(f"Days Updated! The scheduler has re-planned.")
+
+    if new_stations != initial_stations:
+        session = get_session()
+        set_metadata(session, "scrape_stations", ",".join(new_stations))
+        session.close()
+        wake_scheduler()
+        st.success(f"Stations Updated! New stations are scraped on the next run.")
 
     st.divider()
     st.subheader("🛠️ Database Management")
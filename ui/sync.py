@@ -1,13 +1,207 @@
 
 import streamlit as st
 from datetime import datetime, timedelta
-from database import get_session, get_metadata, set_metadata, DailySyncStatus
-from scraper import NOCScraper
+from database import get_session, get_metadata, set_metadata, DailySyncStatus, StationSyncStatus
+from scraper import NOCScraper, get_scrape_stations, parse_stations, scrape_targets
 from config import NOC_USERNAME, NOC_PASSWORD, SESSION_STATE_PATH
 import os
 from firestore_lib import is_cloud_sync_enabled
+from cloud_metrics import cloud_metrics
 from sqlalchemy import desc
 from logger_util import log_buffer
+from scrape_lock import ScrapeLock, get_active_lease, force_release
+from scrape_telemetry import ScrapeRunRecorder, PORTAL_PHASES, LOCAL_PHASES
+from portal_breaker import portal_breaker
+
+def render_cloud_worker_status():
+    """Background cloud push status (mirrored to metadata by whichever process runs the scraper)."""
+    import json
+    from cloud_outbox import pending_count
+    from cloud_sync_worker import STATUS_KEY
+    session = get_session()
+    raw_status = get_metadata(session, STATUS_KEY)
+    outbox_pending = pending_count(session)
+    session.close()
+
+    status = json.loads(raw_status) if raw_status else {}
+    with st.expander("☁️ Cloud Push Worker", expanded=bool(status.get("last_error"))):
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("State", (status.get("state") or "not started").title())
+        c2.metric("Outbox Pending", outbox_pending)
+        c3.metric("Changes Pushed", status.get("pushed_changes", 0))
+        c4.metric("Requests Coalesced", f"{status.get('coalesced', 0)}/{status.get('requests', 0)}")
+        if status.get("last_push_at"):
+            days = status.get("last_push_days") or []
+            st.caption(f"Last push: {status['last_push_at']} ({status.get('last_push_seconds', 0)}s) covering {len(days)} day(s)")
+        if status.get("last_error"):
+            st.error(f"Last push error: {status['last_error']}")
+
+def render_cloud_sync_runs(limit=20):
+    """Per-run Firestore cost and latency recorded by cloud_metrics."""
+    import json
+    import pandas as pd
+    from database import CloudSyncRun
+    session = get_session()
+    runs = session.query(CloudSyncRun).order_by(desc(CloudSyncRun.started_at)).limit(limit).all()
+    session.close()
+
+    with st.expander("📈 Cloud Sync Runs", expanded=False):
+        if not runs:
+            st.caption("No cloud sync runs recorded yet.")
+            return
+        st.dataframe(pd.DataFrame([{
+            "Started": r.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "Run": r.label,
+            "Seconds": r.duration_seconds,
+            "Reads": r.reads,
+            "Writes": r.writes,
+            "Deletes": r.deletes,
+            "KB": round((r.bytes or 0) / 1024, 1),
+            "Retries": r.retries,
+            "Errors": r.errors
+        } for r in runs]), width="stretch", hide_index=True)
+
+        labels = [f"{r.started_at.strftime('%Y-%m-%d %H:%M:%S')} · {r.label}" for r in runs]
+        picked = st.selectbox("Run details", range(len(runs)), format_func=lambda i: labels[i], key="cloud_run_details")
+        summary = json.loads(runs[picked].summary_json or "{}")
+        buckets_ms = summary.get("buckets_ms", [])
+        rows = []
+        for op in summary.get("ops", []):
+            # p50/p95 are bucket upper bounds; None means above the largest bucket
+            over = f">{buckets_ms[-1]}" if buckets_ms else "-"
+            rows.append({
+                "Operation": op["op"],
+                "Collection": op["collection"],
+                "Calls": op["calls"],
+                "Docs": op["docs"],
+                "KB": round(op["bytes"] / 1024, 1),
+                "Avg ms": op["avg_ms"],
+                "p50 ms": op["p50_ms"] if op["p50_ms"] is not None else over,
+                "p95 ms": op["p95_ms"] if op["p95_ms"] is not None else over,
+                "Retries": op["retries"],
+                "Errors": op["errors"]
+            })
+        if rows:
+            st.dataframe(pd.DataFrame(rows).astype({"p50 ms": str, "p95 ms": str}), width="stretch", hide_index=True)
+
+def render_portal_breaker():
+    """NOC portal circuit breaker state (mirrored to metadata by whichever process runs the scraper)."""
+    import json
+    from portal_breaker import STATUS_KEY, OPEN
+    session = get_session()
+    raw_status = get_metadata(session, STATUS_KEY)
+    session.close()
+
+    status = json.loads(raw_status) if raw_status else {}
+    is_open = status.get("state") == OPEN
+    if is_open:
+        st.warning(f"🔌 **NOC portal unreachable:** scheduled scrapes are paused until {status.get('open_until')}, then a single probe decides whether to resume.")
+    with st.expander("🔌 NOC Portal Circuit", expanded=False):
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("State", (status.get("state") or "closed").replace("_", "-").title())
+        c2.metric("Consecutive Failures", status.get("failures", 0))
+        c3.metric("Consecutive Timeouts", status.get("timeouts", 0))
+        c4.metric("Probes (failed)", f"{status.get('probes', 0)} ({status.get('failed_probes', 0)})")
+        st.caption(f"Circuit opened {status.get('total_trips', 0)} time(s) and {status.get('total_failures', 0)} portal failures "
+                   f"({status.get('total_timeouts', 0)} timeouts) since the scraper process started; updated {status.get('updated_at') or 'never'}.")
+        if status.get("last_error"):
+            st.caption(f"Last portal error: {status['last_error']}")
+        if is_open and st.button("Close Circuit Now", help="Resume scheduled scrapes without waiting for the backoff (this app's scheduler only)."):
+            portal_breaker.reset()
+            from scheduler_worker import wake_scheduler
+            wake_scheduler()
+            st.rerun()
+
+def render_scrape_runs(limit=30):
+    """Per-run scrape timings recorded by scrape_telemetry, split into portal and local phases."""
+    import pandas as pd
+    from database import ScrapeRun, ScrapePhase
+    session = get_session()
+    runs = session.query(ScrapeRun).order_by(desc(ScrapeRun.started_at)).limit(limit).all()
+    run_ids = [r.id for r in runs]
+    phases = session.query(ScrapePhase).filter(ScrapePhase.run_id.in_(run_ids)).all() if run_ids else []
+    session.close()
+
+    with st.expander("⏱️ Scrape Run Telemetry", expanded=False):
+        if not runs:
+            st.caption("No scrape runs recorded yet.")
+            return
+
+        per_run = {}
+        for p in phases:
+            if p.phase != "total":
+                per_run.setdefault(p.run_id, {})
+                per_run[p.run_id][p.phase] = per_run[p.run_id].get(p.phase, 0.0) + (p.seconds or 0.0)
+
+        def split(run_id):
+            times = per_run.get(run_id, {})
+            return (round(sum(v for k, v in times.items() if k in PORTAL_PHASES), 1),
+                    round(sum(v for k, v in times.items() if k in LOCAL_PHASES), 1))
+
+        rows = []
+        for r in runs:
+            portal_s, local_s = split(r.id)
+            rows.append({
+                "Started": r.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+                "Source": r.source,
+                "Status": r.status,
+                "Dates": r.dates_scraped,
+                "Seconds": r.duration_seconds,
+                "Portal s": portal_s,
+                "Local s": local_s,
+                "Inserted": r.inserted,
+                "Updated": r.updated,
+                "Pruned": r.pruned,
+                "Error": r.error or ""
+            })
+        st.dataframe(pd.DataFrame(rows), width="stretch", hide_index=True)
+
+        # Phase seconds per run, oldest first, so regressions show up as a rising band
+        trend = pd.DataFrame([
+            {"Run": r.started_at.strftime('%m-%d %H:%M'), **per_run.get(r.id, {})} for r in reversed(runs)
+        ]).set_index("Run").fillna(0)
+        ordered = [p for p in PORTAL_PHASES + LOCAL_PHASES if p in trend.columns]
+        if ordered:
+            st.caption("Seconds per phase · portal: " + ", ".join(p for p in ordered if p in PORTAL_PHASES)
+                       + " · local: " + ", ".join(p for p in ordered if p in LOCAL_PHASES))
+            st.bar_chart(trend[ordered])
+
+        labels = [f"{r.started_at.strftime('%Y-%m-%d %H:%M:%S')} · {r.source}" for r in runs]
+        picked = st.selectbox("Run details", range(len(runs)), format_func=lambda i: labels[i], key="scrape_run_details")
+        run_id = runs[picked].id
+        detail = {}
+        for p in phases:
+            if p.run_id != run_id:
+                continue
+            day = p.date.strftime('%Y-%m-%d') if p.date else "(run)"
+            row = detail.setdefault(day, {"Date": day})
+            if p.phase == "total":
+                row.update({"Total s": p.seconds, "Inserted": p.inserted, "Updated": p.updated, "Pruned": p.pruned})
+            else:
+                row[p.phase] = p.seconds
+        if detail:
+            st.dataframe(pd.DataFrame(sorted(detail.values(), key=lambda d: d["Date"])), width="stretch", hide_index=True)
+
+def render_station_sync_status(days=3):
+    """Last scrape per station for yesterday through the next few days."""
+    import pandas as pd
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    session = get_session()
+    rows = session.query(StationSyncStatus).filter(
+        StationSyncStatus.date >= today - timedelta(days=1), StationSyncStatus.date < today + timedelta(days=days)
+    ).order_by(StationSyncStatus.date, StationSyncStatus.station).all()
+    session.close()
+    if not rows:
+        return
+
+    with st.expander("🛫 Station Sync Status", expanded=False):
+        st.dataframe(pd.DataFrame([{
+            "Date": r.date.strftime('%Y-%m-%d'),
+            "Station": r.station,
+            "Last Scraped": r.last_scraped_at.strftime('%Y-%m-%d %H:%M:%S') if r.last_scraped_at else "",
+            "Flights": r.flights_found,
+            "Status": r.status
+        } for r in rows]), width="stretch", hide_index=True)
 
 def render_sync_tab():
     username = st.session_state.get("username")
@@ -17,7 +211,8 @@ def render_sync_tab():
     session = get_session()
     global_last_sync = get_metadata(session, "last_successful_sync")
     last_sync_rec = session.query(DailySyncStatus).order_by(desc(DailySyncStatus.last_scraped_at)).first()
-    is_active = get_metadata(session, "is_scrape_in_progress") == "True"
+    active_lease = get_active_lease(session)
+    is_active = active_lease is not None
     session.close()
     
     st.header("Sync Settings")
@@ -26,16 +221,24 @@ def render_sync_tab():
         st.info(f"📊 **Data Freshness:** Last pull performed at {global_last_sync}")
     if last_sync_rec:
         st.caption(f"Last data point synced: {last_sync_rec.date.strftime('%Y-%m-%d')} ({last_sync_rec.flights_found} flights)")
+    render_station_sync_status()
 
     # Cloud Configuration Check (using dynamic setting)
     active_cloud_sync = is_cloud_sync_enabled()
     if active_cloud_sync:
         st.success("✅ Cloud Sync Active")
+        render_cloud_worker_status()
+        render_cloud_sync_runs()
     else:
          st.warning("⚠️ Cloud Sync Inactive")
 
+    render_portal_breaker()
+    render_scrape_runs()
+
     if is_active:
         st.info("⏳ **Scraper Busy:** A sync operation is currently running (Background or Manual).")
+        st.caption(f"Lock held by `{active_lease.owner}` since {active_lease.acquired_at.strftime('%H:%M:%S')}, "
+                   f"last heartbeat {active_lease.heartbeat_at.strftime('%H:%M:%S')}, expires {active_lease.expires_at.strftime('%H:%M:%S')} unless renewed.")
         with st.expander("📡 Live Scraper Feed", expanded=True):
             st.code("\n".join(log_buffer.get_last(20)), language="text")
             col_l, col_r = st.columns([1, 1])
@@ -45,7 +248,7 @@ def render_sync_tab():
             with col_r:
                 if st.button("🚨 Force Reset Sync Lock", use_container_width=True, help="Use this ONLY if the scraper is stuck and no actual progress is being made."):
                     session = get_session()
-                    set_metadata(session, "is_scrape_in_progress", "False")
+                    force_release(session)
                     session.close()
                     st.toast("Sync lock cleared!", icon="🔓")
                     st.rerun()
@@ -53,6 +256,10 @@ def render_sync_tab():
     st.divider()
     
     st.subheader("1. Scraper Sync (NOC -> Local DB)")
+    if st.button("⏩ Run Scheduled Scrape Now", disabled=is_active, help="Asks the background scheduler to refresh the whole configured window right away."):
+        from scheduler_worker import request_scrape_now
+        request_scrape_now()
+        st.toast("Scheduler woken up; scrape starting.", icon="⏩")
     sync_mode = st.radio("Sync Mode", ["Current Day", "Date Range"], horizontal=True)
     
     start_date = datetime.today()
@@ -66,21 +273,27 @@ def render_sync_tab():
             end_date = st.date_input("End Date", datetime.today())
     else:
         st.info(f"Will sync data for: **{start_date.strftime('%Y-%m-%d')}**")
+
+    session = get_session()
+    configured_stations = [s for s in get_scrape_stations(session) if s]
+    session.close()
+    stations_input = st.text_input("Stations", value=", ".join(configured_stations),
+                                   help="Comma-separated station codes to scrape for each date. Leave empty to scrape the account's default station.")
+    stations = parse_stations(stations_input) or [None]
     
 
     if st.button(f"Start Scraper Sync ({sync_mode})", type="primary", disabled=is_active):
         status_area = st.empty()
         
-        # --- Check for global lock ---
-        session = get_session()
-        is_active = get_metadata(session, "is_scrape_in_progress")
-        session.close()
-
-        if is_active == "True":
+        # --- Take the cross-process scrape lease ---
+        scrape_lock = ScrapeLock("manual")
+        if start_date > end_date:
+            status_area.error("Start date must be before or equal to end date.")
+        elif not portal_breaker.allow_sweep(force_probe=True):
+            status_area.error(f"🔌 **NOC portal unreachable:** the probe request failed ({portal_breaker.last_error}). Try again later.")
+        elif not scrape_lock.acquire():
             status_area.error("⚠️ **Sync Blocked:** A background or manual sync is currently in progress. Please wait for it to complete.")
             st.toast("Sync already running!", icon="🔒")
-        elif start_date > end_date:
-            status_area.error("Start date must be before or equal to end date.")
         else:
             status_area.info("Initializing browser...")
             progress_bar = st.progress(0)
@@ -90,13 +303,11 @@ def render_sync_tab():
             session.close()
 
             scraper = NOCScraper(headless=True) # Ensure this is compatible with your environment
+            telemetry = ScrapeRunRecorder("manual")
+            scraper.telemetry = telemetry
+            run_error = None
             
             try:
-                # Set Global Lock
-                session = get_session()
-                set_metadata(session, "is_scrape_in_progress", "True")
-                session.close()
-
                 scraper.start(auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH)
                 if scraper.login(username=username, password=password, auth_mode=auth_mode, storage_state_path=SESSION_STATE_PATH):
                     # Clear any scrape error banner on successful login
@@ -106,42 +317,51 @@ def render_sync_tab():
                     
                     status_area.success("Logged in! Scraping dates...")
                     
-                    # Iterate
-                    curr = start_date
-                    total_days = (end_date - start_date).days + 1
-                    days_done = 0
+                    # Iterate over every (station, date) pair
+                    dates = [datetime.combine(start_date + timedelta(days=i), datetime.min.time())
+                             for i in range((end_date - start_date).days + 1)]
+                    targets = scrape_targets(dates, stations)
+                    done = 0
                     
                     log_area = st.empty()
                     def update_logs():
                         with log_area:
                             st.code("\n".join(log_buffer.get_last(15)), language="text")
 
-                    while curr <= end_date:
-                        status_area.write(f"Scraping {curr.strftime('%Y-%m-%d')}...")
+                    for station, s_dt in targets:
+                        if scrape_lock.lost:
+                            status_area.warning("Scrape lock was taken over by another process; stopping.")
+                            break
+                        if portal_breaker.is_open():
+                            status_area.warning(f"The NOC portal keeps failing; skipped the remaining dates. Last error: {scraper.last_error}")
+                            break
+                        status_area.write(f"Scraping {s_dt.strftime('%Y-%m-%d')}{f' at {station}' if station else ''}...")
                         update_logs()
                         
-                        s_dt = datetime.combine(curr, datetime.min.time())
-                        scraper.scrape_date(s_dt)
+                        portal_breaker.record(scraper.scrape_date(s_dt, station), scraper.last_error)
                         
-                        days_done += 1
-                        progress_bar.progress(days_done / total_days)
-                        curr += timedelta(days=1)
+                        done += 1
+                        progress_bar.progress(done / len(targets))
                         update_logs()
                         
-                    status_area.success("Sync Complete! Check the Historical Data tab.")
+                    if not scrape_lock.lost and not portal_breaker.is_open():
+                        status_area.success("Sync Complete! Check the Historical Data tab.")
                     update_logs()
                 else:
+                    run_error = "Login failed"
+                    portal_breaker.record_failure(run_error)
                     status_area.error("Login failed. Please check your credentials.")
             except Exception as e:
                 import traceback
+                run_error = e
+                portal_breaker.record_failure(e)
                 status_area.error(f"An error occurred: {e}")
                 st.exception(e) # Show full traceback
             finally:
                 # Release Global Lock
-                session = get_session()
-                set_metadata(session, "is_scrape_in_progress", "False")
-                session.close()
+                scrape_lock.release()
                 scraper.stop()
+                telemetry.finish(error=run_error)
     
     st.divider()
     
@@ -183,25 +403,27 @@ def render_sync_tab():
                         st.code("\n".join(log_buffer.get_last(15)), language="text")
 
                 update_logs()
-                status.write(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Gathering IOE assignments...")
-                cnt_ioe = upload_ioe_to_cloud(session)
-                update_logs()
-                status.write(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Uploaded {cnt_ioe} IOE records.")
+                with cloud_metrics.run("Full Cloud Mirror"):
+                    status.write(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Gathering IOE assignments...")
+                    cnt_ioe = upload_ioe_to_cloud(session)
+                    update_logs()
+                    status.write(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Uploaded {cnt_ioe} IOE records.")
                 
-                status.write(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Gathering scheduled pairings...")
-                cnt_pair = upload_pairings_to_cloud(session)
-                update_logs()
-                status.write(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Uploaded {cnt_pair} pairing bundles.")
+                    status.write(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Gathering scheduled pairings...")
+                    # Forced: the upload hashes can't tell whether the cloud still holds the bundles
+                    cnt_pair = upload_pairings_to_cloud(session, force=True)
+                    update_logs()
+                    status.write(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Uploaded {cnt_pair} pairing bundles.")
                 
-                status.write(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Gathering historical flight data (this may take a moment)...")
-                cnt_flt = upload_flights_to_cloud(session) # No date range = all
-                update_logs()
-                status.write(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Uploaded {cnt_flt} daily flight blocks.")
+                    status.write(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Gathering historical flight data (this may take a moment)...")
+                    cnt_flt = upload_flights_to_cloud(session) # No date range = all
+                    update_logs()
+                    status.write(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Uploaded {cnt_flt} daily flight blocks.")
                 
-                status.write(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Syncing application metadata...")
-                cnt_meta = upload_metadata_to_cloud(session)
-                update_logs()
-                status.write(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Metadata sync complete.")
+                    status.write(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Syncing application metadata...")
+                    cnt_meta = upload_metadata_to_cloud(session)
+                    update_logs()
+                    status.write(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Metadata sync complete.")
                 
                 session.close()
                 end_time = datetime.now()
@@ -262,5 +484,19 @@ def render_sync_tab():
                  status.update(label="✅ Restore Complete!", state="complete", expanded=False)
                  st.success(f"**Restore Summary:**\n- {stats.get('flights', 0)} Flights restored/updated\n- {stats.get('pairings', 0)} Pairings restored\n- {stats.get('ioe', 0)} IOE Assignments restored\n- {stats.get('metadata', 0)} Metadata keys updated")
                  st.balloons()
+
+        session = get_session()
+        from ingest_data import PULL_WATERMARK_KEY
+        pull_watermark = get_metadata(session, PULL_WATERMARK_KEY)
+        session.close()
+        if pull_watermark:
+            st.caption(f"Last cloud pull: {pull_watermark[:19].replace('T', ' ')} UTC")
+        if st.button("🔄 Pull Recent Cloud Changes", help="Only downloads flight days updated in the cloud since the last pull."):
+            with st.spinner("Pulling changed flight days..."):
+                from ingest_data import pull_flight_updates
+                session = get_session()
+                cnt = pull_flight_updates(session)
+                session.close()
+                st.success(f"Pulled recent changes ({cnt} new flights).")
     else:
         st.info("Cloud sync is disabled. Enable it in the sidebar to use this feature.")